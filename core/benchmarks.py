@@ -0,0 +1,220 @@
+"""Latency and query benchmarks for the main pages, APIs and WebSocket consumers.
+
+HTTP scenarios go through the full middleware stack with Django's test
+client, each request made as a random user from a pool of logged-in
+clients; WebSocket scenarios drive the consumers with channels'
+`WebsocketCommunicator`. Every scenario reports p50/p99/mean latency and
+queries per request (core.querylog), and `compare` flags scenarios that
+got slower or started running more queries than a stored baseline.
+
+Run it against a populated database (core.synthetic); `manage.py
+benchmark` does both on a throwaway one.
+"""
+import math
+import random
+import statistics
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+
+from . import chat
+from .consumers import ChatConsumer, NotificationsConsumer
+from .models import Hashtag, Post, Story
+from .notifications import push_notification
+from .querylog import record_queries
+
+WS_TIMEOUT = 5
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile (`p` in 0..100) of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, queries=(), errors=0):
+    """Stats for one scenario; latencies are in seconds."""
+    ms = [t * 1000 for t in latencies]
+    result = {
+        'requests': len(ms),
+        'errors': errors,
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p99_ms': round(percentile(ms, 99), 2),
+        'mean_ms': round(statistics.fmean(ms), 2),
+        'max_ms': round(max(ms), 2),
+    }
+    if queries:
+        result['queries_per_request'] = round(statistics.fmean(queries), 2)
+        result['max_queries'] = max(queries)
+    return result
+
+
+class Workload:
+    """Users, clients and targets the scenarios pick from at random."""
+
+    def __init__(self, clients=20, seed=0):
+        self.rng = random.Random(seed)
+        # The most connected users see the fullest feeds and inboxes
+        users = list(User.objects.select_related('profile').order_by('-profile__following_count')[:clients])
+        if not users:
+            raise ValueError('no users to benchmark with; generate data first')
+        self.clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            self.clients.append((user, client))
+        self.usernames = list(User.objects.order_by('-profile__follower_count').values_list('username', flat=True)[:500])
+        self.post_ids = list(Post.objects.order_by('-created_at').values_list('id', flat=True)[:2000])
+        self.story_ids = list(Story.objects.order_by('-created_at').values_list('id', flat=True)[:500])
+        self.tags = list(Hashtag.objects.values_list('name', flat=True)[:50])
+
+    def pick(self):
+        return self.rng.choice(self.clients)
+
+
+def _sample(rng, items, k):
+    return rng.sample(items, min(k, len(items)))
+
+
+# name -> (workload, user) -> (method, url, data)
+HTTP_SCENARIOS = {
+    'home': lambda w, u: ('get', reverse('home'), {}),
+    'profile': lambda w, u: ('get', reverse('profile', args=[w.rng.choice(w.usernames)]), {}),
+    'explore': lambda w, u: ('get', reverse('explore_api'), {'mode': w.rng.choice(['ranked', 'recent'])}),
+    'tag': lambda w, u: ('get', reverse('tag', args=[w.rng.choice(w.tags)]), {}),
+    'search': lambda w, u: ('get', reverse('user_typeahead'), {'q': w.rng.choice(w.usernames)[:w.rng.randint(1, 4)]}),
+    'notifications': lambda w, u: ('get', reverse('notifications'), {}),
+    'messages': lambda w, u: ('get', reverse('messages'), {}),
+    'like': lambda w, u: ('post', reverse('like_toggle', args=[w.rng.choice(w.post_ids)]), {}),
+    'story_viewed': lambda w, u: (
+        'post', reverse('mark_story_viewed'), {'story_ids': ','.join(map(str, _sample(w.rng, w.story_ids, 3)))},
+    ),
+}
+WS_SCENARIOS = ('chat', 'notification_push')
+
+
+def run_http(workload, name, iterations, warmup=5):
+    """Time `iterations` requests of scenario `name`; return its summary."""
+    build = HTTP_SCENARIOS[name]
+    latencies, queries, errors = [], [], 0
+    for i in range(warmup + iterations):
+        user, client = workload.pick()
+        method, url, data = build(workload, user)
+        with record_queries() as recorded:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        queries.append(recorded.count)
+        errors += response.status_code >= 400
+    return summarize(latencies, queries, errors)
+
+
+async def _connect(consumer, path, user, kwargs=None):
+    communicator = WebsocketCommunicator(consumer.as_asgi(), path)
+    communicator.scope['user'] = user
+    communicator.scope['url_route'] = {'kwargs': kwargs or {}}
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise RuntimeError(f'{user.username} could not connect to {path}')
+    return communicator
+
+
+async def _chat_round_trips(thread, sender, receiver, iterations):
+    """Seconds from a message being sent until the other participant receives it."""
+    clients = [
+        await _connect(ChatConsumer, f'/ws/chat/{thread.id}/', user, {'thread_id': str(thread.id)})
+        for user in (sender, receiver)
+    ]
+    latencies = []
+    try:
+        for i in range(iterations):
+            start = time.perf_counter()
+            await clients[0].send_json_to({'text': f'benchmark {i}'})
+            await clients[1].receive_json_from(timeout=WS_TIMEOUT)
+            latencies.append(time.perf_counter() - start)
+            await clients[0].receive_json_from(timeout=WS_TIMEOUT)  # the sender's own echo
+    finally:
+        for communicator in clients:
+            await communicator.disconnect()
+    return latencies
+
+
+async def _notification_pushes(user, actor, post, iterations):
+    """Seconds from push_notification until the recipient's socket gets the frame."""
+    communicator = await _connect(NotificationsConsumer, '/ws/notif/', user)
+    push = sync_to_async(push_notification)
+    latencies = []
+    try:
+        for i in range(iterations):
+            start = time.perf_counter()
+            await push(user, f'benchmark {i}', title='Benchmark', actor=actor, post=post)
+            await communicator.receive_json_from(timeout=WS_TIMEOUT)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await communicator.disconnect()
+    return latencies
+
+
+def run_ws(workload, name, iterations):
+    (sender, _), (receiver, _) = workload.clients[0], workload.clients[-1]
+    if name == 'chat':
+        thread, _ = chat.get_or_create_direct_thread(sender, receiver)
+        latencies = async_to_sync(_chat_round_trips)(thread, sender, receiver, iterations)
+    else:
+        post = Post.objects.filter(author=receiver).first()
+        latencies = async_to_sync(_notification_pushes)(receiver, sender, post, iterations)
+    return summarize(latencies)
+
+
+def run(scenarios=None, iterations=200, clients=20, seed=0, log=None):
+    """Run `scenarios` (default: all) and return {scenario: summary}."""
+    log = log or (lambda message: None)
+    workload = Workload(clients, seed)
+    results = {}
+    for name in scenarios or [*HTTP_SCENARIOS, *WS_SCENARIOS]:
+        if name in HTTP_SCENARIOS:
+            results[name] = run_http(workload, name, iterations)
+        elif name in WS_SCENARIOS:
+            results[name] = run_ws(workload, name, iterations)
+        else:
+            raise ValueError(f'unknown scenario {name!r}')
+        log(format_result(name, results[name]))
+    return results
+
+
+def format_result(name, result):
+    line = f'{name:>17}: p50 {result["p50_ms"]:8.2f} ms  p99 {result["p99_ms"]:8.2f} ms'
+    if 'queries_per_request' in result:
+        line += f'  {result["queries_per_request"]:5.1f} queries/request'
+    if result['errors']:
+        line += f'  {result["errors"]} errors'
+    return line
+
+
+def compare(baseline, current, tolerance=0.25):
+    """Return regression messages for scenarios in both result sets.
+
+    A scenario regresses if its p99 grew by more than `tolerance`, or it
+    runs more queries per request, or it started failing.
+    """
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if now['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p99 {before["p99_ms"]:.2f} -> {now["p99_ms"]:.2f} ms')
+        if now.get('queries_per_request', 0) > before.get('queries_per_request', 0) + 0.5:
+            regressions.append(
+                f'{name}: queries/request {before.get("queries_per_request")} -> {now["queries_per_request"]}'
+            )
+        if now['errors'] > before['errors']:
+            regressions.append(f'{name}: errors {before["errors"]} -> {now["errors"]}')
+    return regressions
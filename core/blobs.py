@@ -0,0 +1,129 @@
+"""Reference counting and garbage collection for content-addressed media.
+
+`Post.media`, `Story.media`, `ArchivedStory.media` and `Message.attachment`
+rows acquire their blob when created and release it when deleted
+(signals). When the count drops to zero the blob file and the variants,
+posters and previews recorded as derived from it are deleted once the
+transaction commits -- unless it was stored again in the last
+`MEDIA_GC_GRACE_SECONDS`, in which case `manage.py gc_media` picks it up
+later. `gc_media` also removes files under `blobs/` that no row accounts
+for, such as uploads whose transaction rolled back after the file was
+written.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .counters import adjust
+from .models import ArchivedStory, MediaBlob, Message, Post, Story
+from .storage import BLOB_PREFIX, content_storage
+
+# model -> blob-backed file field
+REFERENCES = {Post: 'media', Story: 'media', ArchivedStory: 'media', Message: 'attachment'}
+
+
+def _grace():
+    return timedelta(seconds=getattr(settings, 'MEDIA_GC_GRACE_SECONDS', 60))
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def touch(name, size):
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, size=size, touched_at=timezone.now())],
+        update_conflicts=True, unique_fields=['name'], update_fields=['touched_at'],
+    )
+
+
+def acquire(name):
+    if is_blob(name):
+        MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def release(name):
+    if not is_blob(name):
+        return
+    adjust(MediaBlob.objects.filter(name=name), ref_count=-1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def record_derived(name, paths):
+    """Remember files rendered from blob `name` (core.images / core.videos) for `collect`."""
+    if not is_blob(name) or not paths:
+        return
+    with transaction.atomic():
+        derived = MediaBlob.objects.select_for_update().filter(name=name).values_list('derived', flat=True).first()
+        if derived is not None and not set(paths) <= set(derived):
+            MediaBlob.objects.filter(name=name).update(derived=sorted({*derived, *paths}))
+
+
+def collect(name):
+    """Delete blob `name` and its derived files if nothing references it; return whether it did."""
+    derived = MediaBlob.objects.filter(name=name).values_list('derived', flat=True).first() or []
+    with transaction.atomic():
+        deleted, _ = MediaBlob.objects.filter(
+            name=name, ref_count=0, touched_at__lt=timezone.now() - _grace(),
+        ).delete()
+        if not deleted:
+            return False
+        content_storage().delete(name)
+        for path in derived:
+            default_storage.delete(path)
+    return True
+
+
+def reconcile():
+    """Recount references from the tables; return the number of blobs whose count changed."""
+    counts = {}
+    for model, field in REFERENCES.items():
+        for name in model.objects.filter(**{f'{field}__startswith': BLOB_PREFIX}).values_list(field, flat=True).iterator():
+            counts[name] = counts.get(name, 0) + 1
+    changed = 0
+    for blob in MediaBlob.objects.iterator():
+        if blob.ref_count != counts.get(blob.name, 0):
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=counts.get(blob.name, 0))
+            changed += 1
+    return changed
+
+
+def sweep():
+    """Collect every unreferenced blob past the grace period; return how many were deleted."""
+    stale = MediaBlob.objects.filter(ref_count=0, touched_at__lt=timezone.now() - _grace())
+    return sum(collect(name) for name in stale.values_list('name', flat=True))
+
+
+def _files(storage, folder):
+    try:
+        _, files = storage.listdir(folder)
+    except FileNotFoundError:
+        return []
+    return [f'{folder}{name}' for name in files]
+
+
+def sweep_orphans():
+    """Delete files under `blobs/` that are neither a MediaBlob nor derived from one,
+    and were last written before the grace period; return how many were deleted."""
+    storage = content_storage()
+    cutoff = timezone.now() - _grace()
+    try:
+        folders, _ = storage.listdir(BLOB_PREFIX)
+    except FileNotFoundError:
+        return 0
+    deleted = 0
+    for folder in folders:
+        prefix = f'{BLOB_PREFIX}{folder}/'
+        known = set()
+        for name, derived in MediaBlob.objects.filter(name__startswith=prefix).values_list('name', 'derived').iterator():
+            known.add(name)
+            known.update(derived)
+        for path in _files(storage, prefix) + _files(storage, f'{prefix}variants/'):
+            if path not in known and storage.get_modified_time(path) < cutoff:
+                storage.delete(path)
+                deleted += 1
+    return deleted
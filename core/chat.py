@@ -0,0 +1,65 @@
+"""Direct-message thread lookup and participant checks."""
+from django.core.cache import cache
+from django.db import transaction
+
+from . import inbox
+from .models import MessageThread
+
+# Upper bound on staleness when another process changes a thread's members.
+PARTICIPANTS_CACHE_SECONDS = 300
+
+
+def direct_key(user_a_id, user_b_id):
+    """Canonical key for the DM between two users (order-independent)."""
+    low, high = sorted((int(user_a_id), int(user_b_id)))
+    return f'{low}:{high}'
+
+
+def get_or_create_direct_thread(user, other):
+    """Return (thread, created) for the DM between `user` and `other`.
+
+    Race-safe: the unique `direct_key` makes concurrent creators converge on
+    one row (get_or_create retries the lookup on IntegrityError).
+    """
+    with transaction.atomic():
+        thread, created = MessageThread.objects.get_or_create(direct_key=direct_key(user.id, other.id))
+        if created:
+            thread.participants.add(user, other)
+            inbox.create_entries(thread, [user, other])
+    return thread, created
+
+
+def _participants_key(thread_id):
+    return f'thread_participants:{thread_id}'
+
+
+def participant_ids(thread_id):
+    """Frozenset of user ids in the thread, cached until its participants change.
+
+    DMs are answered from `direct_key` with one primary-key lookup; group
+    threads read the M2M table. Unknown threads are not cached.
+    """
+    key = _participants_key(thread_id)
+    ids = cache.get(key)
+    if ids is not None:
+        return ids
+    row = MessageThread.objects.filter(id=thread_id).values_list('direct_key').first()
+    if row is None:
+        return frozenset()
+    if row[0]:
+        ids = frozenset(int(uid) for uid in row[0].split(':'))
+    else:
+        ids = frozenset(
+            MessageThread.participants.through.objects.filter(messagethread_id=thread_id)
+            .values_list('user_id', flat=True)
+        )
+    cache.set(key, ids, PARTICIPANTS_CACHE_SECONDS)
+    return ids
+
+
+def invalidate_participants(thread_id):
+    cache.delete(_participants_key(thread_id))
+
+
+def is_participant(thread_id, user_id):
+    return int(user_id) in participant_ids(thread_id)
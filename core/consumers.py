@@ -1,8 +1,16 @@
+import asyncio
 import json
+import logging
+from collections import defaultdict
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from asgiref.sync import sync_to_async
-from .models import MessageThread, Message
+from django.db import transaction
+from .models import Message
+from . import chat, inbox
+
+logger = logging.getLogger(__name__)
 
 class NotificationsConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -26,9 +34,136 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'title': event.get('title', 'Notification'),
             'text': event.get('text', ''),
+            'count': event.get('count', 1),
             'created_at': event.get('created_at', ''),
         }))
 
+    async def notif_batch(self, event):
+        # One channel-layer message from the delivery worker; one frame per item.
+        for item in event.get('items', []):
+            await self.notif_message(item)
+
+class RoomBatcher:
+    """Per-room micro-batcher for chat messages received in this process.
+
+    Messages are buffered for up to `CHAT_BATCH_MAX_LATENCY_MS` (or until
+    `CHAT_BATCH_SIZE` are waiting), saved with one bulk INSERT plus the inbox
+    summary update, and broadcast to the room as one `chat.batch` event.
+    Flushes for a room are serialized, so delivery order matches arrival.
+    A save is retried `SAVE_ATTEMPTS` times; if it still fails, each sender
+    gets a `chat.error` frame with its unsaved texts so the client can
+    resend them.
+    """
+    SAVE_ATTEMPTS = 3
+    SAVE_RETRY_DELAY = 0.05  # seconds, doubled after each failed attempt
+    _rooms = {}
+
+    @classmethod
+    def for_room(cls, thread_id, channel_layer):
+        thread_id = int(thread_id)
+        batcher = cls._rooms.get(thread_id)
+        if batcher is None:
+            batcher = cls._rooms[thread_id] = cls(thread_id, channel_layer)
+        return batcher
+
+    def __init__(self, thread_id, channel_layer):
+        self.thread_id = thread_id
+        self.channel_layer = channel_layer
+        self.pending = []
+        self.timer = None
+        self.flushes = set()
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def max_latency():
+        return getattr(settings, 'CHAT_BATCH_MAX_LATENCY_MS', 5) / 1000
+
+    @staticmethod
+    def max_size():
+        return getattr(settings, 'CHAT_BATCH_SIZE', 50)
+
+    def add(self, channel_name, sender_id, sender_username, text):
+        self.pending.append((channel_name, sender_id, sender_username, text))
+        if len(self.pending) >= self.max_size():
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self._spawn(self.flush())
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self._flush_later())
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_latency())
+        self.timer = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            try:
+                await self._flush_batch()
+            finally:
+                # Idle, however the flush went: forget the room so long-lived
+                # processes don't accumulate batchers.
+                if not self.pending and self.timer is None and self._rooms.get(self.thread_id) is self:
+                    del self._rooms[self.thread_id]
+
+    async def _flush_batch(self):
+        size = self.max_size()
+        batch, self.pending = self.pending[:size], self.pending[size:]
+        if self.pending and self.timer is None:
+            self._spawn(self.flush())
+        if not batch:
+            return
+        saved = await self._save_with_retries(batch)
+        if saved is None:
+            await self._reject(batch)
+            return
+        await self.channel_layer.group_send(f'chat_{self.thread_id}', {
+            'type': 'chat.batch',
+            'messages': saved,
+        })
+
+    async def _save_with_retries(self, batch):
+        """Saved message dicts for `batch`, or None once every attempt has failed."""
+        for attempt in range(self.SAVE_ATTEMPTS):
+            try:
+                return await self._save_batch(batch)
+            except Exception:
+                if attempt + 1 == self.SAVE_ATTEMPTS:
+                    logger.exception('Could not save %d chat message(s) for thread %s', len(batch), self.thread_id)
+                    return None
+                logger.warning('Saving chat messages for thread %s failed; retrying', self.thread_id, exc_info=True)
+                await asyncio.sleep(self.SAVE_RETRY_DELAY * 2 ** attempt)
+
+    async def _reject(self, batch):
+        """Hand each sender back the texts that were not saved."""
+        unsaved = defaultdict(list)
+        for channel_name, _, _, text in batch:
+            unsaved[channel_name].append(text)
+        for channel_name, texts in unsaved.items():
+            await self.channel_layer.send(channel_name, {'type': 'chat.error', 'error': 'not_saved', 'texts': texts})
+
+    @sync_to_async
+    def _save_batch(self, batch):
+        with transaction.atomic():
+            msgs = Message.objects.bulk_create([
+                Message(thread_id=self.thread_id, sender_id=sender_id, text=text)
+                for _, sender_id, _, text in batch
+            ])
+            inbox.record_messages(self.thread_id, msgs)
+        return [{
+            'message_id': m.id,
+            'sender': username,
+            'text': m.text,
+            'created_at': m.created_at.isoformat(),
+        } for m, (_, _, username, _) in zip(msgs, batch)]
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.thread_id = self.scope['url_route']['kwargs']['thread_id']
@@ -49,28 +184,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
         user = self.scope['user']
         if not text:
             return
-        msg = await self._save_message(self.thread_id, user.id, text)
-        await self.channel_layer.group_send(self.room_group, {
-            'type': 'chat.message',
-            'message_id': msg['id'],
-            'sender': msg['sender'],
-            'text': msg['text'],
-            'created_at': msg['created_at'],
-        })
+        batcher = RoomBatcher.for_room(self.thread_id, self.channel_layer)
+        batcher.add(self.channel_name, user.id, user.username, text)
 
     async def chat_message(self, event):
         await self.send(text_data=json.dumps(event))
 
-    @sync_to_async
-    def _is_participant(self, user_id, thread_id):
-        try:
-            t = MessageThread.objects.get(id=thread_id)
-            return t.participants.filter(id=user_id).exists()
-        except MessageThread.DoesNotExist:
-            return False
+    async def chat_batch(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    async def chat_error(self, event):
+        await self.send(text_data=json.dumps(event))
 
     @sync_to_async
-    def _save_message(self, thread_id, sender_id, text):
-        thread = MessageThread.objects.get(id=thread_id)
-        m = Message.objects.create(thread=thread, sender_id=sender_id, text=text)
-        return {'id': m.id, 'sender': m.sender.username, 'text': m.text, 'created_at': m.created_at.isoformat()}
\ No newline at end of file
+    def _is_participant(self, user_id, thread_id):
+        return chat.is_participant(thread_id, user_id)
@@ -0,0 +1,54 @@
+"""Denormalized counters on `Post`, `Profile` and `Story`.
+
+Views bump counters with single-statement F() updates next to the write that
+changes them; `reconcile_counters` recomputes them in bulk to repair drift
+(e.g. rows removed by cascades or raw SQL).
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Like, Post, Profile, Story, StoryView
+
+# (model, counter field, source model, source FK, outer column the FK matches)
+COUNTERS = [
+    (Post, 'like_count', Like, 'post', 'pk'),
+    (Post, 'comment_count', Comment, 'post', 'pk'),
+    (Profile, 'follower_count', Follow, 'following', 'user_id'),
+    (Profile, 'following_count', Follow, 'follower', 'user_id'),
+    (Profile, 'post_count', Post, 'author', 'user_id'),
+    (Story, 'view_count', StoryView, 'story', 'pk'),
+]
+
+
+def adjust(queryset, **deltas):
+    """Atomically add `deltas` to counter fields of every row in `queryset`.
+
+    Results are clamped at zero so a drifted counter never violates the
+    PositiveIntegerField constraint.
+    """
+    return queryset.update(**{name: Greatest(F(name) + delta, Value(0)) for name, delta in deltas.items()})
+
+
+def reconcile_counters(batch_size=500):
+    """Recompute every counter and fix rows that drifted.
+
+    Returns a {"Model.field": rows_fixed} dict.
+    """
+    fixed = {}
+    for model, field, source, fk, outer in COUNTERS:
+        actual = (
+            source.objects.filter(**{fk: OuterRef(outer)})
+            .order_by().values(fk).annotate(n=Count('pk')).values('n')
+        )
+        drifted = (
+            model.objects.annotate(actual=Coalesce(Subquery(actual), 0))
+            .exclude(**{field: F('actual')})
+            .only('pk')
+        )
+        rows = []
+        for obj in drifted.iterator(chunk_size=batch_size):
+            setattr(obj, field, obj.actual)
+            rows.append(obj)
+        model.objects.bulk_update(rows, [field], batch_size=batch_size)
+        fixed[f'{model.__name__}.{field}'] = len(rows)
+    return fixed
@@ -0,0 +1,139 @@
+"""Moving expired stories out of the `Story` table.
+
+`expire_stories` walks stories older than `stories.STORY_TTL` oldest first,
+`STORY_EXPIRY_BATCH_SIZE` at a time (a range scan on `core_story_created`),
+and per batch, in its own transaction:
+
+* copies them into `ArchivedStory` (`STORY_EXPIRY_MODE = 'archive'`, the
+  default) so authors keep them, or drops them outright (`'delete'`);
+* deletes their `StoryView` rows in chunks of `VIEW_DELETE_CHUNK`, so one
+  popular story never turns into a single huge DELETE;
+* deletes the stories, whose media blobs are released (core.blobs) and
+  garbage-collected with their variants and posters once nothing else
+  references them.
+
+That keeps `Story` -- and so every tray query -- down to a day of uploads.
+`ExpiryScheduler` runs it in-process every `STORY_EXPIRY_INTERVAL_SECONDS`,
+started with the first request (core.signals); `manage.py expire_stories`
+does the same from cron.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import blobs, stories
+from .models import ArchivedStory, Story, StoryView
+
+logger = logging.getLogger(__name__)
+
+VIEW_DELETE_CHUNK = 1000
+
+
+def batch_size():
+    return getattr(settings, 'STORY_EXPIRY_BATCH_SIZE', 500)
+
+
+def expiry_mode():
+    return getattr(settings, 'STORY_EXPIRY_MODE', 'archive')
+
+
+def expire_stories(batch=None, mode=None, now=None):
+    """Archive or delete every expired story; return how many were removed."""
+    batch = batch or batch_size()
+    mode = mode or expiry_mode()
+    if mode not in ('archive', 'delete'):
+        raise ValueError(f'unknown story expiry mode {mode!r}')
+    cutoff = (now or timezone.now()) - stories.STORY_TTL
+    total = 0
+    while True:
+        handled = expire_batch(cutoff, batch, archive=mode == 'archive')
+        total += handled
+        if handled < batch:
+            break
+    if total:
+        stories.invalidate_all_trays()
+    return total
+
+
+def expire_batch(cutoff, batch, archive=True):
+    """Remove up to `batch` stories created before `cutoff`; return how many."""
+    with transaction.atomic():
+        expired = list(
+            Story.objects.filter(created_at__lt=cutoff).order_by('created_at')
+            .select_for_update(skip_locked=True)[:batch]
+        )
+        if not expired:
+            return 0
+        ids = [s.pk for s in expired]
+        if archive:
+            ArchivedStory.objects.bulk_create([
+                ArchivedStory(
+                    user_id=s.user_id, media=s.media.name, variants=s.variants, poster=s.poster.name,
+                    preview=s.preview.name, view_count=s.view_count, created_at=s.created_at,
+                )
+                for s in expired
+            ])
+            # bulk_create skips post_save, so take the archive's blob references here
+            for s in expired:
+                blobs.acquire(s.media.name)
+        _delete_views(ids)
+        Story.objects.filter(pk__in=ids).delete()
+        if not archive:
+            legacy = [s for s in expired if not blobs.is_blob(s.media.name)]
+            if legacy:
+                transaction.on_commit(lambda: _delete_legacy_files(legacy))
+    return len(ids)
+
+
+def _delete_views(story_ids):
+    views = StoryView.objects.filter(story_id__in=story_ids)
+    while True:
+        chunk = list(views.values_list('pk', flat=True)[:VIEW_DELETE_CHUNK])
+        if not chunk:
+            return
+        StoryView.objects.filter(pk__in=chunk).delete()
+
+
+def _delete_legacy_files(expired):
+    # Uploads from before content-addressed storage are owned by one row each
+    for s in expired:
+        s.media.storage.delete(s.media.name)
+        for name in filter(None, [s.poster.name, s.preview.name, *s.variants.values()]):
+            default_storage.delete(name)
+
+
+class ExpiryScheduler:
+    """Daemon thread running `expire_stories` every `STORY_EXPIRY_INTERVAL_SECONDS` (0 disables it)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        if not getattr(settings, 'STORY_EXPIRY_INTERVAL_SECONDS', 300):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='story-expiry', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, 'STORY_EXPIRY_INTERVAL_SECONDS', 300)
+        while True:
+            try:
+                expired = expire_stories()
+                if expired:
+                    logger.info('Expired %d stories', expired)
+            except Exception:
+                logger.exception('Story expiry failed; will retry')
+            finally:
+                close_old_connections()
+            time.sleep(interval)
+
+
+scheduler = ExpiryScheduler()
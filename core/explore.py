@@ -0,0 +1,65 @@
+"""Explore grid: newest-first or engagement-ranked pages.
+
+Ranking is computed offline by `compute_rankings` (run periodically via
+`manage.py rank_explore`): each like/comment inside the window contributes
+a weight that halves every `half_life`, and the top posts are written to
+`ExploreRank` with a dense rank, so serving a page never sorts `Post`.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import feed
+from .models import Comment, ExploreRank, Like, Post
+
+EXPLORE_PAGE_SIZE = 24
+COMMENT_WEIGHT = 2.0
+LIKE_WEIGHT = 1.0
+
+
+def compute_rankings(window=timedelta(days=3), half_life=timedelta(hours=24), limit=1000):
+    """Rebuild the ranking table; return the number of ranked posts."""
+    now = timezone.now()
+    since = now - window
+    decay = math.log(2) / half_life.total_seconds()
+    scores = defaultdict(float)
+    for model, weight in ((Like, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+        for post_id, created_at in model.objects.filter(created_at__gte=since).values_list('post_id', 'created_at').iterator():
+            scores[post_id] += weight * math.exp(-decay * (now - created_at).total_seconds())
+    top = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+    with transaction.atomic():
+        ExploreRank.objects.all().delete()
+        ExploreRank.objects.bulk_create([
+            ExploreRank(post_id=post_id, rank=i, score=score, computed_at=now)
+            for i, (post_id, score) in enumerate(top, start=1)
+        ], batch_size=500)
+    return len(top)
+
+
+def ranked_page(cursor=None, page_size=EXPLORE_PAGE_SIZE):
+    """Return (posts, next_cursor) from the ranking table; cursor is the last rank served."""
+    try:
+        after = int(cursor) if cursor else 0
+    except ValueError:
+        after = 0
+    ranks = list(
+        ExploreRank.objects.filter(rank__gt=after).select_related('post__author')
+        .order_by('rank')[:page_size + 1]
+    )
+    has_more = len(ranks) > page_size
+    ranks = ranks[:page_size]
+    return [r.post for r in ranks], (str(ranks[-1].rank) if has_more else None)
+
+
+def recent_page(cursor=None, page_size=EXPLORE_PAGE_SIZE):
+    return feed.keyset_page(Post.objects.select_related('author'), cursor, page_size)
+
+
+def explore_page(mode, cursor=None, page_size=EXPLORE_PAGE_SIZE):
+    """Return (mode, posts, next_cursor); ranked falls back to recent until a ranking exists."""
+    if mode == 'ranked' and ExploreRank.objects.exists():
+        return 'ranked', *ranked_page(cursor, page_size)
+    return 'recent', *recent_page(None if mode == 'ranked' else cursor, page_size)
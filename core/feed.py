@@ -0,0 +1,129 @@
+"""Home feed: a materialized per-user timeline with keyset pagination.
+
+Posts are fanned out on write into `TimelineEntry` rows for the author and
+each follower. Posts by authors with more than `FEED_FANOUT_MAX_FOLLOWERS`
+followers are marked `fanned_out=False` instead and merged in on read, so a
+single post never triggers an unbounded insert. The choice is made once per
+post, so a post stays visible however the author's follower count moves
+afterwards.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry
+
+FEED_PAGE_SIZE = 20
+# Posts copied into a new follower's timeline when they follow someone.
+FOLLOW_BACKFILL_SIZE = 50
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 5000)
+
+
+def encode_cursor(created_at, post_id):
+    """Encode a (created_at, id) position as an opaque, URL-safe token."""
+    micros = (created_at - _EPOCH) // _MICROSECOND
+    return f'{micros}_{post_id}'
+
+
+def decode_cursor(cursor):
+    """Return (created_at, post_id) for a cursor, or None if it is malformed."""
+    try:
+        micros, post_id = (int(part) for part in cursor.split('_', 1))
+    except (AttributeError, ValueError):
+        return None
+    return _EPOCH + micros * _MICROSECOND, post_id
+
+
+def _before(cursor, created_field, id_field):
+    created_at, post_id = cursor
+    # The redundant `<=` bound is a plain range the planner can walk an index
+    # with; the OR alone becomes a MULTI-INDEX OR followed by a sort.
+    return Q(**{f'{created_field}__lte': created_at}) & (
+        Q(**{f'{created_field}__lt': created_at}) | Q(**{created_field: created_at, f'{id_field}__lt': post_id})
+    )
+
+
+def keyset_page(queryset, cursor=None, page_size=FEED_PAGE_SIZE, field='created_at'):
+    """Newest-first page of `queryset` (rows with a `field` timestamp and id) and the next cursor."""
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        queryset = queryset.filter(_before(position, field, 'id'))
+    rows = list(queryset.order_by(f'-{field}', '-id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].id) if has_more else None
+    return rows, next_cursor
+
+
+def fan_out_post(post):
+    """Write `post` into the timelines of its author and (small) audience."""
+    user_ids = [post.author_id]
+    follower_ids = list(
+        Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)[:fanout_limit() + 1]
+    )
+    if len(follower_ids) <= fanout_limit():
+        user_ids.extend(follower_ids)
+    else:
+        post.fanned_out = False
+        Post.objects.filter(pk=post.pk).update(fanned_out=False)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=uid, post=post, created_at=post.created_at) for uid in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def backfill_follow(follower, following):
+    """Seed `follower`'s timeline with recent posts from a newly followed user."""
+    recent = Post.objects.filter(author=following).order_by('-created_at', '-id').values_list('id', 'created_at')
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=follower, post_id=pid, created_at=ts) for pid, ts in recent[:FOLLOW_BACKFILL_SIZE]],
+        ignore_conflicts=True,
+    )
+
+
+def drop_follow(follower, following):
+    """Remove an unfollowed author's posts from `follower`'s timeline."""
+    TimelineEntry.objects.filter(user=follower, post__author=following).delete()
+
+
+def _pulled_posts(user):
+    """Posts by followed authors that were not fanned out, to be merged on read."""
+    return Post.objects.filter(
+        fanned_out=False, author_id__in=Follow.objects.filter(follower=user).values('following_id'),
+    )
+
+
+def get_feed_page(user, cursor=None, page_size=FEED_PAGE_SIZE):
+    """Return (posts, next_cursor) for one page of `user`'s home feed.
+
+    `next_cursor` is None on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+
+    entries = TimelineEntry.objects.filter(user=user)
+    if position:
+        entries = entries.filter(_before(position, 'created_at', 'post_id'))
+    rows = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:page_size + 1])
+
+    pulled = _pulled_posts(user)
+    if position:
+        pulled = pulled.filter(_before(position, 'created_at', 'id'))
+    pulled = list(pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:page_size + 1])
+    if pulled:
+        rows = sorted(set(rows + pulled), reverse=True)
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    by_id = Post.objects.select_related('author').prefetch_related('comments__author').in_bulk(
+        [pid for _, pid in rows]
+    )
+    posts = [by_id[pid] for _, pid in rows if pid in by_id]
+    next_cursor = encode_cursor(*rows[-1]) if has_more and rows else None
+    return posts, next_cursor
@@ -1,8 +1,11 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
 from .models import Post, Comment, Story  
 from .models import Profile
+from .image_worker import strip_metadata
 
 
 class ProfileForm(forms.ModelForm):
@@ -14,6 +17,14 @@ class ProfileForm(forms.ModelForm):
             'avatar': forms.ClearableFileInput(attrs={'class': 'form-control'}),
         }
 
+    def clean_avatar(self):
+        avatar = self.cleaned_data.get('avatar')
+        if isinstance(avatar, UploadedFile):
+            # The original is served as the avatar's fallback; drop its GPS/camera EXIF.
+            avatar.seek(0)
+            return ContentFile(strip_metadata(avatar.read()), name=avatar.name)
+        return avatar
+
 class SignUpForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput)
     confirm_password = forms.CharField(widget=forms.PasswordInput)
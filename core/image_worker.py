@@ -0,0 +1,112 @@
+"""Pillow encoding run inside the `core.images` process pool.
+
+Kept free of Django imports so spawned workers start quickly.
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+QUALITY = 80
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+# Raised for files that are not images Pillow can (or should) decode.
+DECODE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError)
+# Uploaded originals in these formats are stored without metadata.
+STRIPPED_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+# Quality for lossy originals that have to be re-encoded to apply their EXIF rotation.
+ROTATED_QUALITY = 95
+_ORIENTATION = 0x0112
+_WEBP_METADATA_CHUNKS = {b'EXIF', b'XMP '}
+_WEBP_METADATA_FLAGS = 0x08 | 0x04  # VP8X "has EXIF" and "has XMP" bits
+
+
+def strip_metadata(data):
+    """Return image bytes `data` without EXIF/XMP (GPS, camera, ...), or `data` itself.
+
+    WebP files just lose their metadata chunks and JPEGs are re-saved with
+    their own quantization tables, so neither is encoded again at another
+    quality. An image with an EXIF rotation is rotated first so it still
+    displays upright. Bytes that carry no metadata, are not a JPEG, PNG or
+    WebP, or cannot be decoded come back unchanged.
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            exif = image.getexif()
+            if image.format not in STRIPPED_FORMATS or not (
+                exif or {'exif', 'xmp', 'XML:com.adobe.xmp'} & set(image.info)
+            ):
+                return data
+            rotated = exif.get(_ORIENTATION, 1) != 1
+            if image.format == 'WEBP' and not rotated:
+                stripped = _without_webp_metadata(data)
+                if stripped:
+                    return stripped
+            options = {}
+            if image.format == 'JPEG':
+                options['quality'] = ROTATED_QUALITY if rotated else 'keep'
+            elif image.format == 'WEBP':
+                options.update({'lossless': True} if _webp_chunk(data, b'VP8L') else {'quality': ROTATED_QUALITY})
+            if 'icc_profile' in image.info:
+                options['icc_profile'] = image.info['icc_profile']
+            buf = BytesIO()
+            (ImageOps.exif_transpose(image) if rotated else image).save(buf, image.format, **options)
+    except DECODE_ERRORS:
+        return data
+    return buf.getvalue()
+
+
+def _webp_chunks(data):
+    """Yield (fourcc, chunk bytes incl. header and padding) of a RIFF WebP; ValueError if malformed."""
+    if data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        raise ValueError('not a RIFF WebP file')
+    pos = 12
+    while pos < len(data):
+        size = int.from_bytes(data[pos + 4:pos + 8], 'little')
+        end = pos + 8 + size + (size & 1)
+        if pos + 8 > len(data) or end > len(data):
+            raise ValueError('truncated WebP chunk')
+        yield data[pos:pos + 4], data[pos:end]
+        pos = end
+
+
+def _webp_chunk(data, fourcc):
+    try:
+        return any(tag == fourcc for tag, _ in _webp_chunks(data))
+    except ValueError:
+        return False
+
+
+def _without_webp_metadata(data):
+    """`data` with its EXIF/XMP chunks (and their VP8X flags) removed, or None if malformed."""
+    kept = []
+    try:
+        for tag, chunk in _webp_chunks(data):
+            if tag in _WEBP_METADATA_CHUNKS:
+                continue
+            if tag == b'VP8X' and len(chunk) > 8:
+                chunk = chunk[:8] + bytes([chunk[8] & ~_WEBP_METADATA_FLAGS]) + chunk[9:]
+            kept.append(chunk)
+    except ValueError:
+        return None
+    body = b'WEBP' + b''.join(kept)
+    return b'RIFF' + len(body).to_bytes(4, 'little') + body
+
+
+def render_variants(data, widths, fmt=FORMAT):
+    """Return (width, height, {width: encoded bytes}) for image bytes `data`.
+
+    Widths at or above the original are skipped, but at least one copy is
+    always produced. Copies are saved without EXIF or other metadata.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        targets = [w for w in widths if w < width] or [width]
+        if image.mode not in ('RGB', 'RGBA') or (fmt == 'JPEG' and image.mode == 'RGBA'):
+            image = image.convert('RGB')
+        out = {}
+        for target in targets:
+            copy = image.resize((target, max(1, round(height * target / width))), Image.Resampling.LANCZOS)
+            buf = BytesIO()
+            copy.save(buf, fmt, quality=QUALITY)
+            out[target] = buf.getvalue()
+    return width, height, out
@@ -0,0 +1,191 @@
+"""Downscaled image variants for posts, stories and avatars.
+
+After an upload commits, `schedule` hands the original to a process pool
+(`IMAGE_WORKERS` processes) that decodes it with Pillow, applies the EXIF
+orientation and encodes one WebP copy per width in the model's spec (JPEG
+if this Pillow lacks WebP). The copies are saved without EXIF metadata and
+their names recorded on the row together with the original's dimensions,
+so templates can emit `srcset` and grids stop downloading full-size
+originals. With `IMAGE_PROCESSING = 'inline'` the work runs in the request.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from . import blobs
+from .image_worker import DECODE_ERRORS, EXTENSION, render_variants
+from .models import Post, Profile, Story
+
+logger = logging.getLogger(__name__)
+
+# model -> (file field, variants field, widths, whether to record dimensions)
+SPECS = {
+    Post: ('media', 'variants', (320, 640, 1080), True),
+    Story: ('media', 'variants', (360, 720), True),
+    Profile: ('avatar', 'avatar_variants', (160,), False),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _needs_variants(instance):
+    if isinstance(instance, Post):
+        return instance.media_type == Post.IMAGE
+    if isinstance(instance, Story):
+        return not instance.is_video
+    return bool(instance.avatar)
+
+
+def schedule(instance):
+    """Generate variants for `instance`'s image once the current transaction commits."""
+    if not _needs_variants(instance):
+        return
+    model = type(instance)
+    name = getattr(instance, SPECS[model][0]).name
+    transaction.on_commit(lambda: _submit(model, instance.pk, name))
+
+
+def discard_avatar(name, variants):
+    """Delete a replaced or removed avatar and its variants once the transaction commits.
+
+    Avatars live in default storage, one file per upload, so unlike blobs
+    nothing else can be pointing at them.
+    """
+    paths = [path for path in [name, *variants.values()] if path]
+    if paths:
+        transaction.on_commit(lambda: [default_storage.delete(path) for path in paths])
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned (not forked) workers: the parent has threads, and
+            # image_worker imports nothing from Django.
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _reuse(model, pk, name):
+    """Copy variants from another row sharing this (content-addressed) file; return whether it could."""
+    field, variants_field, _, record_size = SPECS[model]
+    columns = [variants_field, *(['width', 'height'] if record_size else [])]
+    done = model.objects.filter(**{field: name}).exclude(**{variants_field: {}}).values(*columns).first()
+    if done:
+        model.objects.filter(pk=pk, **{field: name}).update(**done)
+    return bool(done)
+
+
+def _submit(model, pk, name):
+    widths = SPECS[model][2]
+    if _reuse(model, pk, name):
+        return
+    try:
+        with default_storage.open(name, 'rb') as f:
+            data = f.read()
+    except OSError:
+        logger.warning('Image %s for %s %s is missing', name, model.__name__, pk)
+        return
+    if getattr(settings, 'IMAGE_PROCESSING', 'pool') == 'inline':
+        try:
+            result = render_variants(data, widths)
+        except DECODE_ERRORS:
+            logger.warning('Could not decode image %s', name)
+            return
+        _store(model, pk, name, result)
+        return
+    future = _executor_instance().submit(render_variants, data, widths)
+    future.add_done_callback(lambda f: _on_done(model, pk, name, f))
+
+
+def generate(instances, chunk_size=50):
+    """Render variants for `instances` through the pool and wait; return how many were stored."""
+    stored = 0
+    pending = [i for i in instances if _needs_variants(i)]
+    for start in range(0, len(pending), chunk_size):
+        futures = []
+        for instance in pending[start:start + chunk_size]:
+            model = type(instance)
+            name = getattr(instance, SPECS[model][0]).name
+            if _reuse(model, instance.pk, name):
+                stored += 1
+                continue
+            try:
+                with default_storage.open(name, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                logger.warning('Image %s for %s %s is missing', name, model.__name__, instance.pk)
+                continue
+            futures.append((model, instance.pk, name, _executor_instance().submit(render_variants, data, SPECS[model][2])))
+        for model, pk, name, future in futures:
+            try:
+                result = future.result()
+            except DECODE_ERRORS:
+                logger.warning('Could not decode image %s', name)
+                continue
+            _store(model, pk, name, result)
+            stored += 1
+    return stored
+
+
+def _on_done(model, pk, name, future):
+    try:
+        result = future.result()
+    except DECODE_ERRORS:
+        logger.warning('Could not decode image %s', name)
+        return
+    except Exception:
+        logger.exception('Variant generation failed for %s', name)
+        return
+    # Runs on the executor's callback thread, outside any request.
+    close_old_connections()
+    try:
+        _store(model, pk, name, result)
+    finally:
+        close_old_connections()
+
+
+def _store(model, pk, name, result):
+    field, variants_field, _, record_size = SPECS[model]
+    width, height, encoded = result
+    stem, _ = os.path.splitext(name)
+    directory, base = os.path.split(stem)
+    variants = {
+        str(w): default_storage.save(f'{directory}/variants/{base}_{w}.{EXTENSION}', ContentFile(data))
+        for w, data in encoded.items()
+    }
+    updates = {variants_field: variants}
+    if record_size:
+        updates.update(width=width, height=height)
+    # Only if the file was not replaced in the meantime (e.g. a new avatar).
+    if not model.objects.filter(pk=pk, **{field: name}).update(**updates):
+        for variant in variants.values():
+            default_storage.delete(variant)
+        return
+    blobs.record_derived(name, list(variants.values()))
+
+
+def variant_url(variants, min_width, fallback):
+    """URL of the smallest variant at least `min_width` wide (else the largest), or `fallback`."""
+    if not variants:
+        return fallback
+    widths = sorted(int(w) for w in variants)
+    chosen = next((w for w in widths if w >= min_width), widths[-1])
+    return default_storage.url(variants[str(chosen)])
+
+
+def srcset(variants):
+    return ', '.join(
+        f'{default_storage.url(variants[w])} {w}w' for w in sorted(variants, key=int)
+    )
@@ -0,0 +1,66 @@
+"""Denormalized inbox: thread summaries and per-participant unread state.
+
+Every new message (or batch of messages) updates its thread's summary and
+all participants' `InboxEntry` rows in two UPDATE statements, so the inbox list renders from
+one query and unread badges never count messages.
+"""
+from django.db import models
+from django.db.models import Case, F, Value, When
+
+from .models import InboxEntry, MessageThread
+
+PREVIEW_LENGTH = 100
+
+
+def preview_for(message):
+    text = (message.text or '').strip()
+    if text:
+        return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + '…'
+    return 'Attachment' if message.attachment else ''
+
+
+def create_entries(thread, users):
+    """Add inbox rows for `users`; `partner` is set for two-person threads."""
+    users = list(users)
+    activity = thread.updated_at or thread.created_at
+    entries = []
+    for user in users:
+        others = [u for u in users if u.pk != user.pk]
+        partner = others[0] if len(others) == 1 else None
+        entries.append(InboxEntry(user=user, thread=thread, partner=partner, last_activity=activity))
+    InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def record_message(message):
+    """Fold a freshly saved `message` into its thread summary and inbox rows."""
+    record_messages(message.thread_id, [message])
+
+
+def record_messages(thread_id, messages):
+    """Fold saved `messages` (oldest first, one thread) into the summary rows.
+
+    Each sender's badge is reset to the number of messages after their own
+    last one; everyone else's grows by the batch size.
+    """
+    last = messages[-1]
+    MessageThread.objects.filter(pk=thread_id).update(
+        updated_at=last.created_at,
+        last_message_id=last.id,
+        last_sender_id=last.sender_id,
+        last_preview=preview_for(last),
+    )
+    own_last = {m.sender_id: (i, m.id) for i, m in enumerate(messages)}
+    unread = [When(user_id=uid, then=Value(len(messages) - i - 1)) for uid, (i, _) in own_last.items()]
+    read = [When(user_id=uid, then=Value(mid)) for uid, (_, mid) in own_last.items()]
+    InboxEntry.objects.filter(thread_id=thread_id).update(
+        last_activity=last.created_at,
+        unread_count=Case(*unread, default=F('unread_count') + len(messages)),
+        last_read_message_id=Case(*read, default=F('last_read_message_id'), output_field=models.BigIntegerField()),
+    )
+
+
+def mark_read(user, thread):
+    """Reset `user`'s unread badge for `thread` up to its latest message."""
+    InboxEntry.objects.filter(user=user, thread=thread).exclude(
+        unread_count=0, last_read_message_id=thread.last_message_id,
+    ).update(unread_count=0, last_read_message_id=thread.last_message_id)
@@ -0,0 +1,81 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from core.consumers import ChatConsumer
+from core.models import MessageThread
+
+IDLE_TIMEOUT = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure ChatConsumer throughput (messages/sec) with per-message writes '
+        'versus the per-room micro-batcher. Runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=5)
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent by each client.')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--latency-ms', type=int, default=5)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            users = [User.objects.create_user(username=f'bench{i}') for i in range(options['clients'])]
+            modes = [
+                ('unbatched', {'CHAT_BATCH_SIZE': 1, 'CHAT_BATCH_MAX_LATENCY_MS': 0}),
+                ('batched', {'CHAT_BATCH_SIZE': options['batch_size'],
+                             'CHAT_BATCH_MAX_LATENCY_MS': options['latency_ms']}),
+            ]
+            for label, overrides in modes:
+                thread = MessageThread.objects.create()
+                thread.participants.add(*users)
+                with override_settings(**overrides):
+                    elapsed, delivered = async_to_sync(self._run)(thread, users, options['messages'])
+                total = len(users) * options['messages']
+                saved = thread.messages.count()
+                line = f'{label:>10}: {saved} saved in {elapsed:.2f}s = {saved / elapsed:,.0f} msgs/sec'
+                if delivered < total:
+                    line += f' ({total - delivered} broadcasts dropped by the channel layer)'
+                self.stdout.write(line)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    async def _run(self, thread, users, per_client):
+        clients = []
+        for user in users:
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{thread.id}/')
+            communicator.scope['user'] = user
+            communicator.scope['url_route'] = {'kwargs': {'thread_id': str(thread.id)}}
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError(f'{user.username} could not join thread {thread.id}')
+            clients.append(communicator)
+
+        expected = len(users) * per_client
+        start = time.perf_counter()
+        for i in range(per_client):
+            for communicator in clients:
+                await communicator.send_json_to({'text': f'message {i}'})
+        # Every client sees every message; time until the first one has them
+        # all, or until the room goes quiet (a full channel layer drops frames).
+        received = 0
+        last = start
+        while received < expected:
+            if await clients[0].receive_nothing(timeout=IDLE_TIMEOUT):
+                break
+            frame = await clients[0].receive_json_from()
+            received += len(frame.get('messages', [frame]))
+            last = time.perf_counter()
+        elapsed = last - start
+
+        for communicator in clients:
+            await communicator.disconnect()
+        return elapsed, received
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core import benchmarks, synthetic
+from core.models import Post
+
+# journal_mode=DELETE, synchronous=FULL, deferred transactions: SQLite's own defaults
+SQLITE_DEFAULTS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent like throughput (likes/sec, latency, "database is locked" errors) with '
+        'several threads toggling likes through the like API. On SQLite compares default journaling '
+        'with the configured WAL setup; on PostgreSQL, reconnecting per request with persistent '
+        'connections. Runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--likes', type=int, default=200, help='Like toggles per thread.')
+        parser.add_argument('--users', type=int, default=200, help='Size of the generated graph.')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # A file, not the usual in-memory test database: journaling is what is measured
+            workdir = tempfile.TemporaryDirectory()
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir.name, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Generated media goes to a throwaway MEDIA_ROOT, like the data
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                synthetic.generate(users=options['users'], threads_per_user=0, story_fraction=0)
+                users = list(User.objects.order_by('id')[:options['threads']])
+                post_ids = list(Post.objects.values_list('id', flat=True)[:500])
+                for label, settings_dict, overrides in self._modes():
+                    saved = {key: connection.settings_dict.get(key) for key in settings_dict}
+                    connection.settings_dict.update(settings_dict)
+                    connections.close_all()
+                    try:
+                        with override_settings(NOTIFICATION_DELIVERY='inline', **overrides):
+                            self.stdout.write(self._run(label, users, post_ids, options['likes']))
+                    finally:
+                        connections.close_all()
+                        connection.settings_dict.update(saved)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if workdir:
+                workdir.cleanup()
+
+    def _modes(self):
+        """(label, settings_dict changes, settings overrides) for each configuration compared."""
+        if connection.vendor == 'sqlite':
+            options = connection.settings_dict['OPTIONS']
+            defaults = {key: value for key, value in options.items() if key != 'transaction_mode'}
+            return [
+                ('rollback journal', {'OPTIONS': {**defaults, 'timeout': 5}, 'CONN_MAX_AGE': 0},
+                 {'SQLITE_PRAGMAS': SQLITE_DEFAULTS}),
+                ('WAL (configured)', {}, {}),
+            ]
+        return [
+            ('reconnect per request', {'CONN_MAX_AGE': 0}, {}),
+            ('persistent/pooled (configured)', {}, {}),
+        ]
+
+    def _run(self, label, users, post_ids, per_thread):
+        barrier = threading.Barrier(len(users) + 1)
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def worker(user, offset):
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            mine, failed = [], 0
+            for i in range(per_thread):
+                url = reverse('like_toggle', args=[post_ids[(offset + i * 7) % len(post_ids)]])
+                start = time.perf_counter()
+                try:
+                    client.post(url)
+                except OperationalError:  # "database is locked"
+                    failed += 1
+                    continue
+                mine.append(time.perf_counter() - start)
+            connections.close_all()
+            with lock:
+                latencies.extend(mine)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=worker, args=(user, i * 31)) for i, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if not latencies:
+            return f'{label:>30}: every request failed ({errors[0]} errors)'
+        stats = benchmarks.summarize(latencies, errors=errors[0])
+        return (
+            f'{label:>30}: {len(latencies) / elapsed:8.1f} likes/sec  p50 {stats["p50_ms"]:7.2f} ms  '
+            f'p99 {stats["p99_ms"]:8.2f} ms  {errors[0]} errors'
+        )
@@ -0,0 +1,86 @@
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from core import benchmarks, synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic graph in a throwaway test database, then report p50/p99 latency and '
+        'queries per request for the main views, APIs and WebSocket consumers. Results can be '
+        'saved as JSON (--output) and checked against an earlier run (--compare).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per scenario.')
+        parser.add_argument('--clients', type=int, default=20, help='Logged-in users the requests rotate through.')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            choices=[*benchmarks.HTTP_SCENARIOS, *benchmarks.WS_SCENARIOS],
+                            help='Run only this scenario (repeatable).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write results to this JSON file.')
+        parser.add_argument('--compare', help='Baseline JSON from an earlier --output.')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p99 growth vs the baseline.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        setup_test_environment()
+        try:
+            # Generated media goes to a throwaway MEDIA_ROOT, like the data
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                start = time.perf_counter()
+                counts = synthetic.generate(users=options['users'], seed=options['seed'])
+                self.stdout.write(f'Generated {sum(counts.values()):,} rows in {time.perf_counter() - start:.1f}s')
+                # Write-behind paths run inline so their cost lands in the request being measured
+                with override_settings(NOTIFICATION_DELIVERY='inline', STORY_VIEW_RECORDING='inline',
+                                       IMAGE_PROCESSING='inline', STORY_EXPIRY_INTERVAL_SECONDS=0):
+                    results = benchmarks.run(
+                        options['scenarios'], options['iterations'], options['clients'], options['seed'],
+                        log=self.stdout.write,
+                    )
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'meta': self._meta(options, counts), 'results': results}, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if baseline is not None:
+            regressions = benchmarks.compare(baseline, results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def _meta(self, options, counts):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = ''
+        return {
+            'date': timezone.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'users': options['users'],
+            'iterations': options['iterations'],
+            'clients': options['clients'],
+            'seed': options['seed'],
+            'rows': counts,
+        }
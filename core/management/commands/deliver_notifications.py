@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.notifications import OUTBOX_BATCH_SIZE, process_outbox, send_due_pushes
+
+
+class Command(BaseCommand):
+    help = (
+        'Deliver every pending notification in the outbox (e.g. after a restart) and any throttled '
+        'pushes now due. With --loop it keeps running, as a dedicated delivery service.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--loop', type=float, metavar='SECONDS', default=0,
+                            help='Keep running, polling the outbox every SECONDS.')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                handled = process_outbox(options['batch_size'])
+                if not handled:
+                    break
+                total += handled
+            pushed = send_due_pushes()
+            if total or pushed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Delivered {total} pending notification(s); sent {pushed} throttled push(es).'
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import expiry
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive (or delete) stories past their 24 hour lifetime in batches, with their '
+        'views and, once unreferenced, their media files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--mode', choices=['archive', 'delete'], default=None,
+                            help='Defaults to STORY_EXPIRY_MODE.')
+        parser.add_argument('--loop', type=int, metavar='SECONDS', default=0,
+                            help='Keep running, expiring stories every SECONDS.')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expiry.expire_stories(options['batch_size'], options['mode'])
+            self.stdout.write(self.style.SUCCESS(f'Expired {expired} stor{"y" if expired == 1 else "ies"}.'))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
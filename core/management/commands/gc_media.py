@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core import blobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount media blob references from posts, stories and messages, then delete '
+        'unreferenced blobs and their derived files, and files under blobs/ that no blob '
+        'accounts for (run periodically, e.g. from cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-reconcile', action='store_true', help='Trust the stored reference counts.')
+
+    def handle(self, *args, **options):
+        if not options['no_reconcile']:
+            self.stdout.write(f'Corrected {blobs.reconcile()} reference count(s).')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {blobs.sweep()} unreferenced blob(s).'))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {blobs.sweep_orphans()} orphaned file(s).'))
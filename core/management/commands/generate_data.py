@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with a synthetic social graph (power-law follows, posts, likes, '
+        'comments, stories, threads) for load testing. Every user\'s password is --password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts-per-user', type=float, default=4, help='Mean; actual counts are skewed.')
+        parser.add_argument('--follows-per-user', type=int, default=40, help='Roughly the median out-degree x3.')
+        parser.add_argument('--like-rate', type=float, default=0.15, help='Mean share of followers liking a post.')
+        parser.add_argument('--story-fraction', type=float, default=0.2, help='Share of users with active stories.')
+        parser.add_argument('--threads-per-user', type=int, default=2)
+        parser.add_argument('--messages-per-thread', type=int, default=12)
+        parser.add_argument('--days', type=int, default=30, help='Spread posts over this many days.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--password', default='password')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = synthetic.generate(
+            users=options['users'], posts_per_user=options['posts_per_user'],
+            follows_per_user=options['follows_per_user'], like_rate=options['like_rate'],
+            story_fraction=options['story_fraction'], threads_per_user=options['threads_per_user'],
+            messages_per_thread=options['messages_per_thread'], days=options['days'], seed=options['seed'],
+            batch_size=options['batch_size'], password=options['password'], log=self.stdout.write,
+        )
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {total:,} rows in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core import videos
+from core.images import generate
+from core.models import Post, Profile, Story
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate downscaled image variants, and video posters/previews when ffmpeg is available, '
+        'for uploads that have none yet (e.g. those predating the pipeline).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate existing variants as well.')
+
+    def handle(self, *args, **options):
+        querysets = [
+            Post.objects.filter(media_type=Post.IMAGE),
+            Story.objects.all(),
+            Profile.objects.exclude(avatar='').exclude(avatar__isnull=True),
+        ]
+        for qs in querysets:
+            if not options['all']:
+                field = 'avatar_variants' if qs.model is Profile else 'variants'
+                qs = qs.filter(**{field: {}})
+            stored = generate(qs.iterator())
+            self.stdout.write(self.style.SUCCESS(f'{qs.model.__name__}: stored variants for {stored} image(s).'))
+
+        if not videos.ffmpeg_binary():
+            self.stdout.write(self.style.WARNING('ffmpeg not found; skipping video posters.'))
+            return
+        for model in (Post, Story):
+            qs = model.objects.filter(media__iregex=r'\.(mp4|webm|mov)$')
+            if not options['all']:
+                qs = qs.filter(poster='')
+            done = sum(1 for obj in qs.iterator() if videos.process(model, obj.pk, obj.media.name))
+            self.stdout.write(self.style.SUCCESS(f'{model.__name__}: stored posters for {done} video(s).'))
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import purge_stale
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked upload sessions (and their partial files) idle for longer than --hours (run from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24)
+
+    def handle(self, *args, **options):
+        removed = purge_stale(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} stale upload(s).'))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.explore import compute_rankings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the explore ranking table from recent likes and comments (run periodically, e.g. from cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-hours', type=int, default=72)
+        parser.add_argument('--half-life-hours', type=float, default=24)
+        parser.add_argument('--limit', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ranked = compute_rankings(
+            window=timedelta(hours=options['window_hours']),
+            half_life=timedelta(hours=options['half_life_hours']),
+            limit=options['limit'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Ranked {ranked} post(s).'))
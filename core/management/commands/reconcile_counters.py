@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like/comment/follow/post counters and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(batch_size=options['batch_size'])
+        for name, count in fixed.items():
+            self.stdout.write(f'{name}: {count} row(s) fixed')
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {sum(fixed.values())} counter row(s).'))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_timelines(apps, schema_editor):
+    """Fan existing posts out to their authors and current followers."""
+    Post = apps.get_model('core', 'Post')
+    Follow = apps.get_model('core', 'Follow')
+    TimelineEntry = apps.get_model('core', 'TimelineEntry')
+    followers = {}
+    for follower_id, following_id in Follow.objects.values_list('follower_id', 'following_id'):
+        followers.setdefault(following_id, []).append(follower_id)
+    batch = []
+    for post_id, author_id, created_at in Post.objects.values_list('id', 'author_id', 'created_at').iterator():
+        for user_id in [author_id, *followers.get(author_id, [])]:
+            batch.append(TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at))
+        if len(batch) >= 1000:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_storyview_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='core_post_author_recent'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='core.post'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created_at', '-post'], name='core_timeline_user_page'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (model, counter field, source model, source FK, outer column the FK matches)
+COUNTERS = [
+    ('Post', 'like_count', 'Like', 'post', 'pk'),
+    ('Post', 'comment_count', 'Comment', 'post', 'pk'),
+    ('Profile', 'follower_count', 'Follow', 'following', 'user_id'),
+    ('Profile', 'following_count', 'Follow', 'follower', 'user_id'),
+    ('Profile', 'post_count', 'Post', 'author', 'user_id'),
+]
+
+
+def populate_counters(apps, schema_editor):
+    for model_name, field, source_name, fk, outer in COUNTERS:
+        model = apps.get_model('core', model_name)
+        source = apps.get_model('core', source_name)
+        actual = (
+            source.objects.filter(**{fk: OuterRef(outer)})
+            .order_by().values(fk).annotate(n=Count('pk')).values('n')
+        )
+        model.objects.update(**{field: Coalesce(Subquery(actual), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
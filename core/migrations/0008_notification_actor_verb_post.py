@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Leading-username text formats written by push_notification before the
+# actor/verb columns existed.
+TEXT_VERBS = [
+    (' liked your post.', 'like'),
+    (' commented: ', 'comment'),
+    (' started following you.', 'follow'),
+]
+
+
+def backfill_actor_verb(apps, schema_editor):
+    Notification = apps.get_model('core', 'Notification')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    pending = []
+    for n in Notification.objects.filter(verb='').only('id', 'text').iterator():
+        if n.text == 'You posted new content.':
+            n.verb = 'post'
+            pending.append((n, None))
+            continue
+        for marker, verb in TEXT_VERBS:
+            if marker in n.text:
+                n.verb = verb
+                pending.append((n, n.text.split(marker, 1)[0]))
+                break
+    usernames = {name for _, name in pending if name}
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    for n, name in pending:
+        n.actor_id = user_ids.get(name)
+    Notification.objects.bulk_update([n for n, _ in pending], ['verb', 'actor'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_denormalized_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.post'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='verb',
+            field=models.CharField(blank=True, choices=[('like', 'Like'), ('comment', 'Comment'), ('follow', 'Follow'), ('post', 'Post')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='core_notif_user_recent'),
+        ),
+        migrations.RunPython(backfill_actor_verb, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:54
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    Notification = apps.get_model('core', 'Notification')
+    Notification.objects.update(updated_at=models.F('created_at'), pushed_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_notification_actor_verb_post'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='core_notif_user_recent',
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='pushed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actors',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-updated_at'], name='core_notif_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'verb', 'post', '-updated_at'], name='core_notif_aggregate'),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
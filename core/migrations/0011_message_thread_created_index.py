@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', 'created_at'], name='core_message_thread_time'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inbox(apps, schema_editor):
+    """Summarize existing threads; everything already sent counts as read."""
+    MessageThread = apps.get_model('core', 'MessageThread')
+    Message = apps.get_model('core', 'Message')
+    InboxEntry = apps.get_model('core', 'InboxEntry')
+    entries = []
+    for thread in MessageThread.objects.prefetch_related('participants').iterator(chunk_size=200):
+        last = Message.objects.filter(thread=thread).order_by('-created_at', '-id').first()
+        if last:
+            text = (last.text or '').strip()
+            thread.updated_at = last.created_at
+            thread.last_message = last
+            thread.last_sender_id = last.sender_id
+            thread.last_preview = text[:100] if text else ('Attachment' if last.attachment else '')
+            thread.save(update_fields=['updated_at', 'last_message', 'last_sender', 'last_preview'])
+        users = list(thread.participants.all())
+        for user in users:
+            others = [u for u in users if u.pk != user.pk]
+            entries.append(InboxEntry(
+                user=user, thread=thread, partner=others[0] if len(others) == 1 else None,
+                last_activity=thread.updated_at or thread.created_at, last_read_message=last,
+            ))
+    InboxEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_message_thread_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message'),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('partner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='core.messagethread')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_activity'], name='core_inbox_user_recent')],
+                'unique_together': {('user', 'thread')},
+            },
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
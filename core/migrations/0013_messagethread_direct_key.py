@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+def backfill_direct_keys(apps, schema_editor):
+    """Key existing two-person threads; if a pair has duplicates the oldest wins."""
+    MessageThread = apps.get_model('core', 'MessageThread')
+    seen = set()
+    keyed = []
+    for thread in MessageThread.objects.prefetch_related('participants').order_by('id').iterator(chunk_size=200):
+        ids = sorted(u.pk for u in thread.participants.all())
+        if len(ids) != 2:
+            continue
+        key = f'{ids[0]}:{ids[1]}'
+        if key in seen:
+            continue
+        seen.add(key)
+        thread.direct_key = key
+        keyed.append(thread)
+    MessageThread.objects.bulk_update(keyed, ['direct_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_inbox_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagethread',
+            name='direct_key',
+            field=models.CharField(blank=True, max_length=41, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_direct_keys, migrations.RunPython.noop),
+    ]
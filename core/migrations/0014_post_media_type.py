@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def classify_existing(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    Post.objects.filter(media__iregex=r'\.(mp4|webm|mov)$').update(media_type='video')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_messagethread_direct_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='media_type',
+            field=models.CharField(choices=[('image', 'Image'), ('video', 'Video')], default='image', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['media_type', '-created_at', '-id'], name='core_post_media_recent'),
+        ),
+        migrations.RunPython(classify_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_post_media_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExploreRank',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='explore_rank', serialize=False, to='core.post')),
+                ('rank', models.PositiveIntegerField(unique=True)),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:10
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# UserSearchToken weights as of this migration: username, username part, name
+USERNAME, USERNAME_PART, NAME = 0, 1, 2
+_SPLIT = re.compile(r'[^a-z]+')
+
+
+def tokens_for(user):
+    """{token: weight} for `user`, as core.search indexed users when this migration was written."""
+    found = {}
+
+    def add(token, weight):
+        token = token.strip().lower()[:150]
+        if token and weight < found.get(token, weight + 1):
+            found[token] = weight
+
+    username = user.username.lower()
+    add(username, USERNAME)
+    for part in _SPLIT.split(username):
+        add(part, USERNAME_PART)
+    for name in (user.first_name, user.last_name):
+        for part in (name or '').split():
+            add(part, NAME)
+    return found
+
+
+def index_existing(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserSearchToken = apps.get_model('core', 'UserSearchToken')
+    UserSearchToken.objects.bulk_create([
+        UserSearchToken(user_id=user.id, token=token, weight=weight)
+        for user in User.objects.only('id', 'username', 'first_name', 'last_name').iterator()
+        for token, weight in tokens_for(user).items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_explorerank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=150)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'weight'], name='core_search_token')],
+                'unique_together': {('user', 'token')},
+            },
+        ),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:18
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Caption parsing as core.tags did it when this migration was written
+MAX_TAGS = 30
+MAX_MENTIONS = 20
+HASHTAG_RE = re.compile(r'(?<![\w&])#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.+-]{1,150})')
+
+
+def parse_caption(caption):
+    caption = caption or ''
+    tags = list(dict.fromkeys(t.lower() for t in HASHTAG_RE.findall(caption)))[:MAX_TAGS]
+    names = list(dict.fromkeys(n.rstrip('.') for n in MENTION_RE.findall(caption)))[:MAX_MENTIONS]
+    return tags, [n for n in names if n]
+
+
+def index_existing(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    Hashtag = apps.get_model('core', 'Hashtag')
+    PostTag = apps.get_model('core', 'PostTag')
+    Mention = apps.get_model('core', 'Mention')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    tags, mentions = [], []
+    for post in Post.objects.exclude(caption='').only('id', 'author_id', 'caption', 'created_at').iterator():
+        tag_names, usernames = parse_caption(post.caption)
+        for name in tag_names:
+            tag, _ = Hashtag.objects.get_or_create(name=name)
+            tags.append(PostTag(hashtag=tag, post_id=post.id, created_at=post.created_at))
+        for user_id in User.objects.filter(username__in=usernames).exclude(pk=post.author_id).values_list('id', flat=True):
+            mentions.append(Mention(post_id=post.id, user_id=user_id, created_at=post.created_at))
+    PostTag.objects.bulk_create(tags, batch_size=500, ignore_conflicts=True)
+    Mention.objects.bulk_create(mentions, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_usersearchtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='verb',
+            field=models.CharField(blank=True, choices=[('like', 'Like'), ('comment', 'Comment'), ('follow', 'Follow'), ('post', 'Post'), ('mention', 'Mention')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='core.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='core_mention_user_recent')],
+                'unique_together': {('post', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='core.hashtag')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to='core.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hashtag', '-created_at', '-id'], name='core_posttag_page')],
+                'unique_together': {('hashtag', 'post')},
+            },
+        ),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
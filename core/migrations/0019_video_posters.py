@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='poster',
+            field=models.FileField(blank=True, upload_to='posts/'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='posts/'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='poster',
+            field=models.FileField(blank=True, upload_to='stories/'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='stories/'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:30
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=core.storage.content_storage, upload_to='messages/'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='media',
+            field=models.FileField(storage=core.storage.content_storage, upload_to='posts/'),
+        ),
+        migrations.AlterField(
+            model_name='story',
+            name='media',
+            field=models.FileField(storage=core.storage.content_storage, upload_to='stories/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('touched_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'touched_at'], name='core_blob_unreferenced')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:35
+
+import core.storage
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_media_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedStory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media', models.FileField(storage=core.storage.content_storage, upload_to='stories/')),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('poster', models.FileField(blank=True, upload_to='stories/')),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['created_at'], name='core_story_created'),
+        ),
+        migrations.AddField(
+            model_name='archivedstory',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_stories', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedstory',
+            index=models.Index(fields=['user', '-created_at'], name='core_archive_user_recent'),
+        ),
+    ]
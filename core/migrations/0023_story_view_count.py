@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_view_counts(apps, schema_editor):
+    Story = apps.get_model('core', 'Story')
+    StoryView = apps.get_model('core', 'StoryView')
+    views = StoryView.objects.filter(story=OuterRef('pk')).order_by().values('story').annotate(n=Count('pk')).values('n')
+    Story.objects.update(view_count=Coalesce(Subquery(views), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_story_expiry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='storyview',
+            index=models.Index(fields=['story', '-viewed_at', '-id'], name='core_storyview_recent'),
+        ),
+        migrations.RunPython(populate_view_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def mark_pulled_posts(apps, schema_editor):
+    # Posts that never reached a follower's timeline were left to the read path
+    Post = apps.get_model('core', 'Post')
+    TimelineEntry = apps.get_model('core', 'TimelineEntry')
+    Follow = apps.get_model('core', 'Follow')
+    delivered = TimelineEntry.objects.filter(post=OuterRef('pk')).exclude(user=OuterRef('author'))
+    Post.objects.filter(Exists(Follow.objects.filter(following=OuterRef('author')))).exclude(
+        Exists(delivered)
+    ).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_story_view_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='fanned_out',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-created_at', '-id'], name='core_post_pulled_recent'),
+        ),
+        migrations.RunPython(mark_pulled_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_known_actors(apps, schema_editor):
+    # Only unseen rows are folded into again; their displayed actors are all that is known
+    Notification = apps.get_model('core', 'Notification')
+    NotificationActor = apps.get_model('core', 'NotificationActor')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    rows = Notification.objects.filter(seen=False, verb__in=['like', 'follow'])
+    for n in rows.iterator(chunk_size=500):
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification=n, user_id=uid)
+             for uid in User.objects.filter(username__in=n.recent_actors).values_list('id', flat=True)],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_post_fanned_out'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='push_due',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('push_due__isnull', False)), fields=['push_due'], name='core_notif_push_due'),
+        ),
+        migrations.AddField(
+            model_name='notificationactor',
+            name='notification',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='core.notification'),
+        ),
+        migrations.AddField(
+            model_name='notificationactor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationactor',
+            unique_together={('notification', 'user')},
+        ),
+        migrations.RunPython(record_known_actors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_notification_actors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_notificationoutbox_claimed_by'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='core_message_thread_time',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', '-id'], name='core_message_thread_recent'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_message_thread_recent_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='result',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+# model -> (blob-backed file field, fields naming files rendered from it)
+DERIVED_FIELDS = {
+    'Post': ('media', ['variants', 'poster', 'preview']),
+    'Story': ('media', ['variants', 'poster', 'preview']),
+    'ArchivedStory': ('media', ['variants', 'poster']),
+}
+
+
+def populate_derived(apps, schema_editor):
+    MediaBlob = apps.get_model('core', 'MediaBlob')
+    derived = {}
+    for model_name, (field, fields) in DERIVED_FIELDS.items():
+        rows = apps.get_model('core', model_name).objects.filter(**{f'{field}__startswith': 'blobs/'})
+        for row in rows.values(field, *fields).iterator():
+            names = derived.setdefault(row[field], set())
+            for name in fields:
+                value = row[name]
+                names.update(value.values() if isinstance(value, dict) else [value] if value else [])
+    for name, names in derived.items():
+        if names:
+            MediaBlob.objects.filter(name=name).update(derived=sorted(names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_uploadsession_completed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='derived',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(populate_derived, migrations.RunPython.noop),
+    ]
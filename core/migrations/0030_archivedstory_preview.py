@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_mediablob_derived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedstory',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='stories/'),
+        ),
+    ]
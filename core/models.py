@@ -1,37 +1,134 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from datetime import timedelta
 
+from .storage import content_storage
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov')
+
+
+def media_type_for(name):
+    return Post.VIDEO if (name or '').lower().endswith(VIDEO_EXTENSIONS) else Post.IMAGE
+
 
 class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # {"<width>": storage name} of downscaled copies, filled in by core.images.
+    avatar_variants = models.JSONField(default=dict, blank=True)
     bio = models.CharField(max_length=160, blank=True)
+    # Denormalized counters, kept in step with F() updates in the views and
+    # repaired by `manage.py reconcile_counters`.
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.username
 
     @property
     def avatar_url(self):
-        """Return avatar URL or fallback to default static image."""
-        return self.avatar.url if self.avatar else '/static/core/default-avatar.svg'
+        """Return avatar URL (the downscaled copy once ready) or fallback to default static image."""
+        if not self.avatar:
+            return '/static/core/default-avatar.svg'
+        if self.avatar_variants:
+            return default_storage.url(self.avatar_variants[max(self.avatar_variants, key=int)])
+        return self.avatar.url
+
+
+class UserSearchToken(models.Model):
+    """Prefix-search index over usernames and names, maintained by signals.
+
+    Searching is a B-tree range scan on `token` instead of LIKE '%q%' over
+    auth_user. `weight` ranks where the token came from (lower is better).
+    """
+    USERNAME = 0
+    USERNAME_PART = 1
+    NAME = 2
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=150)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('user', 'token')
+        indexes = [
+            models.Index(fields=['token', 'weight'], name='core_search_token'),
+        ]
+
+    def __str__(self):
+        return f'{self.token} -> {self.user_id}'
 
 
 class Post(models.Model):
+    IMAGE = 'image'
+    VIDEO = 'video'
+    MEDIA_TYPE_CHOICES = [(IMAGE, 'Image'), (VIDEO, 'Video')]
+
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts')
     caption = models.TextField(blank=True)
-    media = models.FileField(upload_to='posts/')
+    media = models.FileField(upload_to='posts/', storage=content_storage)
+    # Classified from the upload's extension on save; indexed for the reels feed.
+    media_type = models.CharField(max_length=10, choices=MEDIA_TYPE_CHOICES, default=IMAGE)
+    # Filled in after upload by core.images for images: original pixel size
+    # and {"<width>": storage name} of downscaled copies for srcset.
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
+    # Videos only, written by core.videos when ffmpeg is available: a poster
+    # frame and a short muted low-bitrate clip for grid tiles.
+    poster = models.FileField(upload_to='posts/', blank=True)
+    preview = models.FileField(upload_to='posts/', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # False when the author had too many followers to fan this post out on
+    # write (core.feed); such posts are merged into timelines on read.
+    fanned_out = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', '-created_at', '-id'], name='core_post_author_recent'),
+            # Per-author keyset scans for the fan-out-on-read half of the feed.
+            models.Index(
+                fields=['author', '-created_at', '-id'], condition=models.Q(fanned_out=False),
+                name='core_post_pulled_recent',
+            ),
+            models.Index(fields=['media_type', '-created_at', '-id'], name='core_post_media_recent'),
+            # Explore's "recent" mode: keyset pages over every post, newest first.
+            models.Index(fields=['-created_at', '-id'], name='core_post_recent'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.media_type = media_type_for(self.media.name)
+        super().save(*args, **kwargs)
 
     @property
     def is_video(self):
-        return self.media.name.lower().endswith(('.mp4', '.webm', '.mov'))
+        return self.media_type == self.VIDEO
 
     def __str__(self):
         return f'{self.author.username}:{self.id}'
 
 
+class ExploreRank(models.Model):
+    """Precomputed explore ranking, rebuilt by `manage.py rank_explore`.
+
+    `rank` is 1-based and dense so ranked explore pages are a range scan.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='explore_rank')
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'#{self.rank} post {self.post_id} ({self.score:.2f})'
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -67,20 +164,91 @@ class Follow(models.Model):
 
 
 class Notification(models.Model):
+    LIKE = 'like'
+    COMMENT = 'comment'
+    FOLLOW = 'follow'
+    POST = 'post'
+    MENTION = 'mention'
+    VERB_CHOICES = [(LIKE, 'Like'), (COMMENT, 'Comment'), (FOLLOW, 'Follow'), (POST, 'Post'), (MENTION, 'Mention')]
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    verb = models.CharField(max_length=20, choices=VERB_CHOICES, blank=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
     text = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     seen = models.BooleanField(default=False)
+    # Aggregation: likes/follows on the same target within a window are
+    # coalesced into one row ("alice and 42 others liked your post.").
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+    pushed_at = models.DateTimeField(null=True, blank=True)
+    # Set when a push was throttled: the accumulated count is sent then.
+    push_due = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='core_notif_user_recent'),
+            models.Index(fields=['user', 'verb', 'post', '-updated_at'], name='core_notif_aggregate'),
+            models.Index(fields=['push_due'], condition=models.Q(push_due__isnull=False), name='core_notif_push_due'),
+        ]
 
     def __str__(self):
         return f'Notif for {self.user.username}: {self.text}'
 
 
+class NotificationActor(models.Model):
+    """A distinct user folded into an aggregated `Notification`; `actor_count` counts these."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('notification', 'user')
+
+    def __str__(self):
+        return f'{self.user_id} in notification {self.notification_id}'
+
+
+class NotificationOutbox(models.Model):
+    """A notification waiting for the background delivery worker.
+
+    Rows are written on the request path and deleted once the worker has
+    stored the `Notification` and pushed it, so pending work survives a
+    restart.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    verb = models.CharField(max_length=20, blank=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=100)
+    text = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the worker delivering this row, inside the transaction that
+    # deletes it (core.notifications._claim); empty whenever it is visible.
+    claimed_by = models.CharField(max_length=32, blank=True)
+
+    def __str__(self):
+        return f'Pending notif for {self.user_id}: {self.text}'
+
+
 class MessageThread(models.Model):
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='threads')
+    # "<lower user id>:<higher user id>" for two-person threads, so a DM is
+    # found (or created) by one unique-index lookup. NULL for group threads.
+    direct_key = models.CharField(max_length=41, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    # updated_at removed to match existing DB schema
+    # Summary of the latest message, maintained by core.inbox.record_message
+    updated_at = models.DateTimeField(null=True, blank=True)
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_preview = models.CharField(max_length=100, blank=True)
 
     def __str__(self):
         return f'Thread {self.id} with {[u.username for u in self.participants.all()]}'
@@ -90,25 +258,71 @@ class Message(models.Model):
     thread = models.ForeignKey(MessageThread, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     text = models.TextField(blank=True)
-    attachment = models.FileField(upload_to='messages/', blank=True, null=True)
+    attachment = models.FileField(upload_to='messages/', storage=content_storage, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # History pages walk a thread newest-first by id (core.views._message_page).
+            models.Index(fields=['thread', '-id'], name='core_message_thread_recent'),
+        ]
+
     def __str__(self):
         return f'Message {self.id} by {self.sender.username}'
 
 
+class InboxEntry(models.Model):
+    """One participant's view of a thread: what the inbox list renders.
+
+    `last_activity` and the preview live on the thread; they are copied here
+    so the inbox is a single (user, -last_activity) index scan.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='inbox')
+    thread = models.ForeignKey(MessageThread, on_delete=models.CASCADE, related_name='inbox_entries')
+    # The other participant of a direct thread, for the inbox avatar/name.
+    partner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    last_activity = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        unique_together = ('user', 'thread')
+        indexes = [
+            models.Index(fields=['user', '-last_activity'], name='core_inbox_user_recent'),
+        ]
+
+    def __str__(self):
+        return f'Thread {self.thread_id} in inbox of {self.user_id}'
+
+
 class Story(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stories')
-    media = models.FileField(upload_to='stories/')
+    media = models.FileField(upload_to='stories/', storage=content_storage)
+    # Same as the Post fields, filled in by core.images / core.videos.
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
+    poster = models.FileField(upload_to='stories/', blank=True)
+    preview = models.FileField(upload_to='stories/', blank=True)
+    # Distinct viewers, maintained by core.viewers when buffered views are flushed.
+    view_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Active-story reads and the expiry job both range-scan this.
+            models.Index(fields=['created_at'], name='core_story_created'),
+        ]
+
     def is_active(self):
         """Stories expire after 24 hours."""
         return timezone.now() - self.created_at < timedelta(hours=24)
 
     @property
     def is_video(self):
-        return self.media.name.lower().endswith(('.mp4', '.webm', '.mov'))
+        return self.media.name.lower().endswith(VIDEO_EXTENSIONS)
 
     def __str__(self):
         return f"{self.user.username}'s story"
@@ -122,6 +336,154 @@ class StoryView(models.Model):
 
     class Meta:
         unique_together = ('story', 'viewer')
+        indexes = [
+            # The owner's "seen by" list, newest first
+            models.Index(fields=['story', '-viewed_at', '-id'], name='core_storyview_recent'),
+        ]
+
+    def __str__(self):
+        return f"{self.viewer.username} viewed story {self.story.id}"
+
+
+class ArchivedStory(models.Model):
+    """An expired story moved out of `Story` by core.expiry.
+
+    Keeping only live stories in `Story` bounds that table (and every
+    tray query) to a day of uploads; the archive is only read per author.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_stories')
+    media = models.FileField(upload_to='stories/', storage=content_storage)
+    variants = models.JSONField(default=dict, blank=True)
+    poster = models.FileField(upload_to='stories/', blank=True)
+    preview = models.FileField(upload_to='stories/', blank=True)
+    view_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='core_archive_user_recent'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}'s archived story from {self.created_at:%Y-%m-%d}"
+
+class TimelineEntry(models.Model):
+    """Materialized home-feed row: `post` is visible in `user`'s timeline.
+
+    `created_at` is copied from the post so a feed page is a single
+    index range scan on (user, created_at, post) without joining `Post`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='core_timeline_user_page'),
+        ]
+
+    def __str__(self):
+        return f'Post {self.post_id} in timeline of {self.user_id}'
+
+
+class Hashtag(models.Model):
+    # Stored lowercased without the leading '#'.
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """A post carrying a hashtag in its caption.
+
+    `created_at` is copied from the post so a tag page is a range scan on
+    (hashtag, created_at) without sorting `Post`.
+    """
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='post_tags')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='tags')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('hashtag', 'post')
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at', '-id'], name='core_posttag_page'),
+        ]
+
+    def __str__(self):
+        return f'Post {self.post_id} tagged {self.hashtag_id}'
+
+
+class Mention(models.Model):
+    """An @username in a post caption that resolved to a user."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='mentions')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='mentions')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('post', 'user')
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='core_mention_user_recent'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} mentioned in post {self.post_id}'
+
+
+class UploadSession(models.Model):
+    """A chunked upload in progress (see core.uploads).
+
+    Bytes are appended to a temporary file outside MEDIA_ROOT; `received`
+    is the committed length, so a client that lost its connection asks for
+    it and resumes from there.
+    """
+    POST = 'post'
+    STORY = 'story'
+    MESSAGE = 'message'
+    KIND_CHOICES = [(POST, 'Post'), (STORY, 'Story'), (MESSAGE, 'Message')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Message attachments only; checked when the session is opened.
+    thread = models.ForeignKey(MessageThread, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Optional hex SHA-256 of the whole file, verified on completion.
+    sha256 = models.CharField(max_length=64, blank=True)
+    received = models.PositiveBigIntegerField(default=0)
+    # Set when a completion request claims the session; `result` is the
+    # response it produced, returned again to repeated completions.
+    completed_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.kind} upload {self.id} ({self.received}/{self.size})'
+
+
+class MediaBlob(models.Model):
+    """A file in content-addressed storage (core.storage), shared by every
+    post, story or message whose upload had the same bytes.
+
+    `ref_count` is the number of rows pointing at it (core.blobs);
+    `touched_at` is the last time it was stored, so a blob that is being
+    re-uploaded is not collected underneath the new row.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    touched_at = models.DateTimeField()
+    # Variants, posters and previews rendered from this file, deleted with it.
+    derived = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'touched_at'], name='core_blob_unreferenced'),
+        ]
 
     def __str__(self):
-        return f"{self.viewer.username} viewed story {self.story.id}"
\ No newline at end of file
+        return f'{self.name} ({self.ref_count} refs)'
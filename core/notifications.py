@@ -0,0 +1,297 @@
+"""Notification storage and real-time push.
+
+Likes and follows are coalesced: a new event for the same (recipient, verb,
+post) within `NOTIFICATION_AGGREGATE_WINDOW` seconds updates the existing
+unseen row instead of inserting another one; `NotificationActor` rows keep
+`actor_count` to distinct users, and `retract` takes an actor back out on
+unlike/unfollow. Pushes for a coalesced row are throttled to one per
+`NOTIFICATION_PUSH_DEBOUNCE` seconds: a throttled row gets `push_due`, and
+the delivery worker sends the accumulated count once it passes.
+
+With `NOTIFICATION_DELIVERY = 'queued'` the request only inserts a
+`NotificationOutbox` row; a background thread drains the outbox in batches,
+bulk-inserting notifications and sending one channel-layer message per
+recipient. `'inline'` stores and pushes inside the request, as before.
+
+Each batch is claimed, folded, inserted and deleted in one transaction, so
+workers in several processes never deliver the same row and a crash
+mid-batch leaves nothing half-applied. The thread starts with a process's
+first request (core.signals) and drains whatever a restart left behind;
+`manage.py deliver_notifications --loop` runs the same loop as a service.
+"""
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationActor, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+AGGREGATED_VERBS = {Notification.LIKE, Notification.FOLLOW}
+# Usernames kept on an aggregated row for display.
+RECENT_ACTORS = 3
+OUTBOX_BATCH_SIZE = 200
+
+_VERB_PHRASES = {
+    Notification.LIKE: 'liked your post.',
+    Notification.FOLLOW: 'started following you.',
+}
+_TITLES = {
+    Notification.LIKE: 'New like',
+    Notification.FOLLOW: 'New follower',
+}
+
+
+def _window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_AGGREGATE_WINDOW', 3600))
+
+
+def _debounce():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_PUSH_DEBOUNCE', 10))
+
+
+def aggregate_text(verb, recent_actors, actor_count):
+    """Render e.g. "alice and 42 others liked your post."."""
+    phrase = _VERB_PHRASES[verb]
+    others = actor_count - 1
+    if others <= 0:
+        return f'{recent_actors[0]} {phrase}'
+    return f'{recent_actors[0]} and {others} other{"s" if others > 1 else ""} {phrase}'
+
+
+def _event(title, n):
+    return {
+        'title': title,
+        'text': n.text,
+        'count': n.actor_count,
+        'created_at': n.updated_at.isoformat(),
+    }
+
+
+def _send(user_id, title, n):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(f'notif_{user_id}', {'type': 'notif.message', **_event(title, n)})
+
+
+def _send_batch(user_id, events):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(f'notif_{user_id}', {'type': 'notif.batch', 'items': events})
+
+
+def _fold(n, actor, now, new_actor):
+    """Merge one more event by `actor` into aggregated row `n`; return whether to push now."""
+    if new_actor:
+        n.actor_count += 1
+    n.recent_actors = [actor.username, *[a for a in n.recent_actors if a != actor.username]][:RECENT_ACTORS]
+    n.actor = actor
+    n.text = aggregate_text(n.verb, n.recent_actors, n.actor_count)
+    n.updated_at = now
+    if n.pushed_at is None or now - n.pushed_at >= _debounce():
+        n.pushed_at, n.push_due = now, None
+        return True
+    # Throttled: the delivery worker sends the accumulated count when the debounce ends
+    n.push_due = n.pushed_at + _debounce()
+    return False
+
+
+def _open_row(user_id, verb, post_id, now):
+    """The unseen aggregated row still inside the window, locked, or None."""
+    return (
+        Notification.objects.select_for_update()
+        .filter(user_id=user_id, verb=verb, post_id=post_id, seen=False, updated_at__gte=now - _window())
+        .order_by('-updated_at').first()
+    )
+
+
+def _coalesce(user_id, actor, verb, post_id, now):
+    """Fold this event into a recent unseen row; return (row, should_push) or None."""
+    n = _open_row(user_id, verb, post_id, now)
+    if n is None:
+        return None
+    _, new_actor = NotificationActor.objects.get_or_create(notification=n, user=actor)
+    should_push = _fold(n, actor, now, new_actor)
+    n.save(update_fields=['actor_count', 'recent_actors', 'actor', 'text', 'updated_at', 'pushed_at', 'push_due'])
+    if not should_push:
+        transaction.on_commit(worker.wake)
+    return n, should_push
+
+
+def _try_coalesce(user_id, actor, verb, post_id, now):
+    if verb not in AGGREGATED_VERBS or actor is None:
+        return None
+    with transaction.atomic():
+        return _coalesce(user_id, actor, verb, post_id, now)
+
+
+def retract(user, actor, verb, post=None):
+    """Take `actor` back out of `user`'s open aggregated notification (unlike, unfollow)."""
+    post_id = post.id if post else None
+    NotificationOutbox.objects.filter(user=user, actor=actor, verb=verb, post_id=post_id).delete()
+    with transaction.atomic():
+        n = _open_row(user.id, verb, post_id, timezone.now())
+        if n is None or not NotificationActor.objects.filter(notification=n, user=actor).delete()[0]:
+            return
+        if n.actor_count <= 1:
+            n.delete()
+            return
+        n.actor_count -= 1
+        n.recent_actors = [a for a in n.recent_actors if a != actor.username]
+        if n.actor_id == actor.id:
+            others = n.actors.select_related('user').order_by('-id')
+            latest = others.filter(user__username__in=n.recent_actors[:1]).first() or others.first()
+            if latest:
+                n.actor = latest.user
+        if not n.recent_actors:
+            n.recent_actors = [n.actor.username]
+        n.text = aggregate_text(n.verb, n.recent_actors, n.actor_count)
+        n.save(update_fields=['actor_count', 'recent_actors', 'actor', 'text'])
+
+
+def _new_notification(user_id, text, actor, verb, post_id, now):
+    return Notification(
+        user_id=user_id, text=text, actor=actor, verb=verb, post_id=post_id,
+        recent_actors=[actor.username] if actor else [],
+        updated_at=now, pushed_at=now,
+    )
+
+
+def push_notification(user, text, title='Activity', actor=None, verb='', post=None):
+    if getattr(settings, 'NOTIFICATION_DELIVERY', 'inline') == 'queued':
+        NotificationOutbox.objects.create(user=user, actor=actor, verb=verb, post=post, title=title, text=text)
+        transaction.on_commit(worker.wake)
+        return None
+    now = timezone.now()
+    post_id = post.id if post else None
+    coalesced = _try_coalesce(user.id, actor, verb, post_id, now)
+    if coalesced is not None:
+        n, should_push = coalesced
+        if should_push:
+            _send(user.id, title, n)
+        return n
+    n = _new_notification(user.id, text, actor, verb, post_id, now)
+    n.save()
+    if verb in AGGREGATED_VERBS and actor:
+        NotificationActor.objects.create(notification=n, user=actor)
+    _send(user.id, title, n)
+    return n
+
+
+def _claim(batch_size):
+    """Lock the next `batch_size` outbox rows for the current transaction.
+
+    Other workers skip rows held with SELECT ... FOR UPDATE SKIP LOCKED.
+    SQLite has no row locks: stamping the batch with `claimed_by` takes the
+    database write lock first, so a concurrent worker waits until this
+    batch is committed (and its rows deleted) before picking its own.
+    """
+    pending = NotificationOutbox.objects.select_related('actor').order_by('id')
+    if connection.features.has_select_for_update_skip_locked:
+        return list(pending.select_for_update(skip_locked=True, of=('self',))[:batch_size])
+    token = uuid.uuid4().hex
+    NotificationOutbox.objects.filter(
+        id__in=NotificationOutbox.objects.filter(claimed_by='').order_by('id').values('id')[:batch_size]
+    ).update(claimed_by=token)
+    return list(pending.filter(claimed_by=token))
+
+
+def process_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """Deliver up to `batch_size` pending outbox rows; return how many were handled."""
+    with transaction.atomic():
+        rows = _claim(batch_size)
+        if not rows:
+            return 0
+        pushes = _deliver(rows)
+    for user_id, events in pushes.items():
+        _send_batch(user_id, events)
+    return len(rows)
+
+
+def _deliver(rows):
+    """Store the notifications for claimed outbox `rows` and delete them; return pushes by user."""
+    pushes = defaultdict(list)
+    fresh = {}  # aggregation key (or outbox id) -> (title, unsaved Notification, actor ids)
+    for row in rows:
+        key = (row.user_id, row.verb, row.post_id) if row.verb in AGGREGATED_VERBS and row.actor else row.id
+        if key in fresh:
+            _, n, actor_ids = fresh[key]
+            _fold(n, row.actor, row.created_at, row.actor_id not in actor_ids)
+            actor_ids.add(row.actor_id)
+            continue
+        coalesced = _try_coalesce(row.user_id, row.actor, row.verb, row.post_id, row.created_at)
+        if coalesced is None:
+            n = _new_notification(row.user_id, row.text, row.actor, row.verb, row.post_id, row.created_at)
+            fresh[key] = (row.title, n, {row.actor_id})
+        elif coalesced[1]:
+            pushes[row.user_id].append(_event(row.title, coalesced[0]))
+    for _, n, _ in fresh.values():
+        # New rows are pushed once the batch commits, with everything folded into them
+        n.pushed_at, n.push_due = n.updated_at, None
+    Notification.objects.bulk_create([n for _, n, _ in fresh.values()])
+    NotificationActor.objects.bulk_create([
+        NotificationActor(notification=n, user_id=uid)
+        for _, n, actor_ids in fresh.values() if n.verb in AGGREGATED_VERBS and n.actor_id
+        for uid in actor_ids
+    ])
+    NotificationOutbox.objects.filter(id__in=[row.id for row in rows]).delete()
+    for title, n, _ in fresh.values():
+        pushes[n.user_id].append(_event(title, n))
+    return pushes
+
+
+def send_due_pushes(now=None):
+    """Send the throttled pushes whose debounce has ended; return how many were sent."""
+    now = now or timezone.now()
+    pushes = defaultdict(list)
+    for n in Notification.objects.filter(push_due__lte=now).order_by('push_due')[:OUTBOX_BATCH_SIZE]:
+        # Claim the row first: another process's worker may be sending it too
+        if Notification.objects.filter(pk=n.pk, push_due=n.push_due).update(push_due=None, pushed_at=now):
+            pushes[n.user_id].append(_event(_TITLES.get(n.verb, 'Activity'), n))
+    for user_id, events in pushes.items():
+        _send_batch(user_id, events)
+    return sum(map(len, pushes.values()))
+
+
+class DeliveryWorker:
+    """Daemon thread that drains the outbox and sends due pushes whenever it is woken (or polls)."""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-delivery', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.ensure_started()
+        self._wakeup.set()
+
+    def _run(self):
+        poll = getattr(settings, 'NOTIFICATION_OUTBOX_POLL_SECONDS', 5)
+        while True:
+            try:
+                while process_outbox():
+                    pass
+                send_due_pushes()
+            except Exception:
+                logger.exception('Notification delivery failed; will retry')
+            finally:
+                close_old_connections()
+            self._wakeup.wait(timeout=poll)
+            self._wakeup.clear()
+
+
+worker = DeliveryWorker()
@@ -0,0 +1,102 @@
+"""Per-request query accounting: how many, how long, and which repeat.
+
+`QueryBudgetMiddleware` wraps every database connection for the length of
+a request (`connection.execute_wrapper`, so it works with DEBUG off) and
+records the number of statements, the time spent in them and how often
+each distinct SQL string ran. A request over its budget (`QUERY_BUDGET`,
+or `QUERY_BUDGETS[url_name]`) or running one statement at least
+`QUERY_REPEAT_THRESHOLD` times -- the usual shape of an N+1 -- is logged
+with its worst offenders. With `QUERY_SERVER_TIMING` on, the numbers are
+sent back in a `Server-Timing` header for the browser's network panel.
+
+Tests use `QueryBudgetAssertions.assertMaxQueries` for the same counts.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """`execute_wrapper` that counts statements, their total time and repeats."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold=2):
+        """[(sql, times)] for statements run at least `threshold` times, most frequent first."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def summary(self, limit=3):
+        lines = [f'{self.count} queries in {self.duration * 1000:.1f} ms']
+        lines += [f'  {n}x {sql[:200]}' for sql, n in self.repeated()[:limit]]
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries(using=None):
+    """Record every query on `using` (default: all connections) inside the block."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for alias in [using] if using else connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+def budget_for(request):
+    match = getattr(request, 'resolver_match', None)
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if match and match.url_name in budgets:
+        return budgets[match.url_name]
+    return getattr(settings, 'QUERY_BUDGET', 30)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as queries:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        budget = budget_for(request)
+        repeated = queries.repeated(getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5))
+        if queries.count > budget or repeated:
+            logger.warning(
+                '%s %s ran %s (budget %d)', request.method, request.path, queries.summary(), budget,
+            )
+        if getattr(settings, 'QUERY_SERVER_TIMING', False):
+            response['Server-Timing'] = (
+                f'db;desc="{queries.count} queries";dur={queries.duration * 1000:.1f}, '
+                f'total;dur={elapsed * 1000:.1f}'
+            )
+        return response
+
+
+class QueryBudgetAssertions:
+    """TestCase mixin: `with self.assertMaxQueries(n): ...`."""
+
+    @contextmanager
+    def assertMaxQueries(self, limit, using=None):
+        with record_queries(using) as queries:
+            yield queries
+        if queries.count > limit:
+            self.fail(f'{queries.count} queries executed, at most {limit} expected\n{queries.summary(limit=10)}')
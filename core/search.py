@@ -0,0 +1,85 @@
+"""User search backed by the `UserSearchToken` prefix index.
+
+Each user is indexed under their lowercased username, the parts of the
+username split on punctuation/digits, and their first and last names. A
+query term matches tokens that start with it (a range scan on the token
+index); results rank username hits above name hits and shorter matches
+first among the first `CANDIDATE_LIMIT` index hits.
+"""
+import re
+
+from django.contrib.auth.models import User
+
+from .models import UserSearchToken
+
+MAX_TERMS = 3
+# Index rows examined per query, so one-letter prefixes stay cheap at any scale.
+CANDIDATE_LIMIT = 1000
+_SPLIT = re.compile(r'[^a-z]+')
+# Upper bound for "starts with" range scans: token >= term AND token < term + _HIGH
+_HIGH = '\U0010ffff'
+
+
+def tokens_for(user):
+    """Return {token: weight} for a user, keeping the best weight per token."""
+    found = {}
+
+    def add(token, weight):
+        token = token.strip().lower()[:150]
+        if token and weight < found.get(token, weight + 1):
+            found[token] = weight
+
+    username = user.username.lower()
+    add(username, UserSearchToken.USERNAME)
+    for part in _SPLIT.split(username):
+        add(part, UserSearchToken.USERNAME_PART)
+    for name in (user.first_name, user.last_name):
+        for part in (name or '').split():
+            add(part, UserSearchToken.NAME)
+    return found
+
+
+def index_user(user):
+    UserSearchToken.objects.filter(user=user).delete()
+    UserSearchToken.objects.bulk_create([
+        UserSearchToken(user=user, token=token, weight=weight) for token, weight in tokens_for(user).items()
+    ])
+
+
+def rebuild_index(batch_size=2000):
+    """Re-index every user; returns the number of users indexed."""
+    UserSearchToken.objects.all().delete()
+    batch, count = [], 0
+    for user in User.objects.only('id', 'username', 'first_name', 'last_name').iterator(chunk_size=batch_size):
+        batch.extend(UserSearchToken(user=user, token=t, weight=w) for t, w in tokens_for(user).items())
+        count += 1
+        if len(batch) >= batch_size:
+            UserSearchToken.objects.bulk_create(batch, batch_size=batch_size)
+            batch = []
+    UserSearchToken.objects.bulk_create(batch, batch_size=batch_size)
+    return count
+
+
+def _prefix(term):
+    return {'token__gte': term, 'token__lt': term + _HIGH}
+
+
+def search_users(q, limit=50, exclude_id=None):
+    """Return up to `limit` users matching every term of `q` by prefix, best first."""
+    terms = q.lower().split()[:MAX_TERMS]
+    if not terms:
+        return []
+    hits = UserSearchToken.objects.filter(**_prefix(terms[0]))
+    for term in terms[1:]:
+        hits = hits.filter(user__in=UserSearchToken.objects.filter(**_prefix(term)).values('user_id'))
+    if exclude_id is not None:
+        hits = hits.exclude(user_id=exclude_id)
+    # Bounded scan in index order; the exact token sorts first in its range.
+    best = {}
+    for user_id, token, weight in hits.order_by('token').values_list('user_id', 'token', 'weight')[:CANDIDATE_LIMIT]:
+        key = (weight, len(token), token)
+        if key < best.get(user_id, (weight + 1,)):
+            best[user_id] = key
+    ranked = sorted(best, key=lambda uid: (best[uid], uid))[:limit]
+    users = User.objects.select_related('profile').in_bulk(ranked)
+    return [users[uid] for uid in ranked if uid in users]
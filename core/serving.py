@@ -0,0 +1,177 @@
+"""Serving uploaded media: validators, byte ranges and long-lived caching.
+
+Every file gets a strong ETag: files under `blobs/` are content-addressed
+(core.storage), so their name is the validator and they are cached as
+`immutable`; anything else is hashed once per (path, size, mtime) and the
+digest kept in the default cache. Conditional requests get a 304, and a
+single `Range` returns 206 with just those bytes -- streamed from the open
+file, which WSGI servers with `wsgi.file_wrapper` send with sendfile().
+
+Only raster images and video are shown inline: anything else users
+uploaded (HTML, SVG, PDFs, ...) is sent as an attachment, so it never runs
+on the app's own origin.
+
+With `MEDIA_SENDFILE = 'x-accel-redirect'` (nginx) or `'x-sendfile'`
+(Apache/lighttpd) Django only answers the validators and hands the body,
+including ranges, to the fronting server.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, quote_etag
+
+from .storage import BLOB_PREFIX
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_READ_SIZE = 1024 * 1024
+# Compressed files are served as what they are, not decoded by the browser (as FileResponse does)
+_ENCODED_TYPES = {
+    'bzip2': 'application/x-bzip',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+    'br': 'application/x-brotli',
+    'compress': 'application/x-compress',
+}
+
+
+def media_type(path):
+    """(content type, whether it may be displayed inline) for media file `path`."""
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = _ENCODED_TYPES.get(encoding, content_type) or 'application/octet-stream'
+    inline = content_type.startswith(('image/', 'video/')) and content_type != 'image/svg+xml'
+    return content_type, inline
+
+
+def cache_control(name):
+    if name.startswith(BLOB_PREFIX):
+        return IMMUTABLE
+    return f'public, max-age={getattr(settings, "MEDIA_MAX_AGE", 86400)}'
+
+
+def etag_for(name, path, stat):
+    """Strong ETag (unquoted) for media file `name` at `path`."""
+    if name.startswith(BLOB_PREFIX):
+        # Storage never rewrites a name: the digest (or digest_variant) is the version
+        return os.path.splitext(os.path.basename(name))[0]
+    key = f'media-etag:{name}:{stat.st_size}:{stat.st_mtime_ns}'
+    etag = cache.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_READ_SIZE), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()
+        cache.set(key, etag, None)
+    return etag
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single `bytes=` range, None to send
+    the whole file, or False if the range cannot be satisfied."""
+    match = _RANGE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None  # absent, multi-range or malformed: a full 200 is allowed
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class _RangeFile:
+    """Read at most `length` bytes from an open file positioned at the range start.
+
+    Exposes fileno() so a WSGI file_wrapper can sendfile() from the current
+    offset for exactly the response's Content-Length.
+    """
+    def __init__(self, f, length):
+        self._f = f
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
+
+
+def serve(request, path):
+    """Serve MEDIA_ROOT/`path` with ETag/Last-Modified validation and Range support."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405, headers={'Allow': 'GET, HEAD'})
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404('Media not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Media not found')
+
+    name = path.replace(os.sep, '/')
+    etag = quote_etag(etag_for(name, full_path, stat))
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        'Cache-Control': cache_control(name),
+        'Accept-Ranges': 'bytes',
+    }
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified.headers.setdefault(header, value)
+        return not_modified
+
+    content_type, inline = media_type(full_path)
+    if not inline:
+        headers['Content-Disposition'] = content_disposition_header(True, os.path.basename(name))
+    mode = getattr(settings, 'MEDIA_SENDFILE', '')
+    if mode == 'x-accel-redirect':
+        # nginx serves the bytes (and ranges) from an `internal` location
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        return HttpResponse(content_type=content_type, headers={**headers, 'X-Accel-Redirect': prefix + name})
+    if mode == 'x-sendfile':
+        return HttpResponse(content_type=content_type, headers={**headers, 'X-Sendfile': full_path})
+
+    size = stat.st_size
+    # If-Range: only honour the range if the client's copy is still current
+    if_range = request.headers.get('If-Range')
+    byte_range = parse_range(request.headers.get('Range'), size) if if_range in (None, etag) else None
+    if byte_range is False:
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+    f = open(full_path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        f.seek(start)
+        response = FileResponse(_RangeFile(f, end - start + 1), status=206, content_type=content_type)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.headers['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(f, content_type=content_type)
+    for header, value in headers.items():
+        response.headers[header] = value
+    return response
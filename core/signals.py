@@ -1,9 +1,80 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from .models import Profile
+from .models import ArchivedStory, Message, MessageThread, Post, Profile, Story
+from . import blobs, chat, expiry, images, notifications, search
+
+SEARCH_FIELDS = {'username', 'first_name', 'last_name'}
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def reindex_user(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Logins save `last_login` only; skip saves that cannot change the tokens
+    if raw or (update_fields is not None and not SEARCH_FIELDS & set(update_fields)):
+        return
+    search.index_user(instance)
+
+
+@receiver(m2m_changed, sender=MessageThread.participants.through)
+def invalidate_thread_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if reverse:
+        # user.threads.add(...): `instance` is the user, `pk_set` the threads
+        thread_ids = pk_set or instance.threads.values_list('id', flat=True)
+    else:
+        thread_ids = [instance.pk]
+    for thread_id in thread_ids:
+        chat.invalidate_participants(thread_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Story)
+@receiver(post_save, sender=ArchivedStory)
+@receiver(post_save, sender=Message)
+def acquire_media(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        blobs.acquire(getattr(instance, blobs.REFERENCES[sender]).name)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Story)
+@receiver(post_delete, sender=ArchivedStory)
+@receiver(post_delete, sender=Message)
+def release_media(sender, instance, **kwargs):
+    blobs.release(getattr(instance, blobs.REFERENCES[sender]).name)
+
+
+@receiver(post_delete, sender=Profile)
+def delete_avatar(sender, instance, **kwargs):
+    images.discard_avatar(instance.avatar.name, instance.avatar_variants)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(request_started)
+def start_background_workers(sender, **kwargs):
+    """Start this process's worker threads with its first request.
+
+    Not in AppConfig.ready(), which also runs for migrations, tests and
+    every other management command.
+    """
+    if getattr(settings, 'NOTIFICATION_DELIVERY', 'inline') == 'queued':
+        notifications.worker.ensure_started()
+    expiry.scheduler.ensure_started()
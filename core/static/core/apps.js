@@ -185,6 +185,24 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
+  // Videos ship with preload="none": grid tiles play on hover (delegated, so
+  // tiles appended by infinite scroll work too), reels while mostly in view.
+  document.addEventListener('mouseover', e => {
+    const v = e.target.closest && e.target.closest('video[data-hover-play]');
+    if (v) v.play().catch(() => {});
+  });
+  document.addEventListener('mouseout', e => {
+    const v = e.target.closest && e.target.closest('video[data-hover-play]');
+    if (v) v.pause();
+  });
+  if ('IntersectionObserver' in window) {
+    const inView = new IntersectionObserver(entries => entries.forEach(e => {
+      if (e.isIntersecting) e.target.play().catch(() => {});
+      else e.target.pause();
+    }), { threshold: 0.6 });
+    document.querySelectorAll('video[data-autoplay-visible]').forEach(v => inView.observe(v));
+  }
+
   // Expose a small helper to reset the notifications badge when entering the notifications page
   window.resetNotifBadge = function () {
     if (badge) {
@@ -231,4 +249,94 @@ function showToast(title, body) {
   `;
   container.appendChild(toastEl);
   setTimeout(() => { try { toastEl.remove(); } catch {} }, 4000);
-}
\ No newline at end of file
+}
+// Chunked, resumable upload through /api/uploads/. A retry of the same file
+// (even after a reload) resumes from the server's offset; each chunk carries
+// its SHA-256 when the browser can compute it (secure contexts only).
+async function chunkedUpload(file, kind, fields = {}, onProgress = () => {}) {
+  const key = `upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+  const headers = { 'X-CSRFToken': getCsrf() };
+  const getState = async id => {
+    const res = await fetch(`/api/uploads/${id}/`, { credentials: 'same-origin' });
+    return res.ok ? res.json() : null;
+  };
+
+  let state = localStorage.getItem(key) ? await getState(localStorage.getItem(key)) : null;
+  if (!state) {
+    const body = new FormData();
+    body.append('kind', kind);
+    body.append('filename', file.name);
+    body.append('size', file.size);
+    if (fields.thread_id) body.append('thread_id', fields.thread_id);
+    const res = await fetch('/api/uploads/', { method: 'POST', body, headers, credentials: 'same-origin' });
+    state = await res.json();
+    if (!res.ok) throw new Error(state.error || 'Upload failed');
+    localStorage.setItem(key, state.upload_id);
+  }
+
+  let failures = 0;
+  while (state.offset < state.size) {
+    const chunk = file.slice(state.offset, state.offset + state.chunk_size);
+    const chunkHeaders = { ...headers, 'Content-Type': 'application/octet-stream', 'Upload-Offset': String(state.offset) };
+    if (window.crypto && crypto.subtle) {
+      const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+      chunkHeaders['Upload-Chunk-Sha256'] = [...new Uint8Array(digest)].map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+    try {
+      const res = await fetch(`/api/uploads/${state.upload_id}/`, {
+        method: 'POST', body: chunk, headers: chunkHeaders, credentials: 'same-origin'
+      });
+      const data = await res.json();
+      // 409 means our offset was stale; the response carries the server's
+      if (!res.ok && res.status !== 409) throw new Error(data.error || 'Upload failed');
+      state = { ...state, ...data };
+      failures = 0;
+    } catch (err) {
+      if (++failures > 5) throw err;
+      await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+      state = (await getState(state.upload_id).catch(() => null)) || state;
+    }
+    onProgress(state.offset / state.size);
+  }
+
+  const body = new FormData();
+  Object.entries(fields).forEach(([k, v]) => body.append(k, v));
+  const res = await fetch(`/api/uploads/${state.upload_id}/complete/`, {
+    method: 'POST', body, headers, credentials: 'same-origin'
+  });
+  const data = await res.json();
+  if (!res.ok) throw new Error(data.error || 'Upload failed');
+  localStorage.removeItem(key);
+  return data;
+}
+
+// Forms marked data-chunked-upload="<kind>" send large files through
+// chunkedUpload instead of one multipart request.
+document.addEventListener('DOMContentLoaded', () => {
+  document.querySelectorAll('form[data-chunked-upload]').forEach(form => {
+    form.addEventListener('submit', async e => {
+      const input = form.querySelector('input[type="file"]');
+      const file = input && input.files[0];
+      const threshold = Number(form.dataset.chunkThreshold || 4 * 1024 * 1024);
+      if (!file || file.size <= threshold) return;  // small files: normal submit
+      e.preventDefault();
+      const button = form.querySelector('button[type="submit"], button:not([type])');
+      const label = button ? button.textContent : '';
+      if (button) button.disabled = true;
+      const fields = {};
+      new FormData(form).forEach((v, k) => {
+        if (!(v instanceof File) && k !== 'csrfmiddlewaretoken') fields[k] = v;
+      });
+      try {
+        const data = await chunkedUpload(file, form.dataset.chunkedUpload, fields, p => {
+          if (button) button.textContent = `Uploading… ${Math.floor(p * 100)}%`;
+        });
+        window.location.href = data.redirect || window.location.href;
+      } catch (err) {
+        console.error(err);
+        showToast('Upload failed', `${err.message}. Submit again to resume.`);
+        if (button) { button.disabled = false; button.textContent = label; }
+      }
+    });
+  });
+});
@@ -0,0 +1,60 @@
+"""Content-addressed storage for post, story and message media.
+
+Each distinct file is written once, as `blobs/<aa>/<sha256><ext>` (the
+field's `upload_to` is ignored), and recorded in a `MediaBlob` row whose
+reference count follows the rows that point at it (see core.blobs).
+Uploading bytes that are already stored just returns the existing name.
+Images are stripped of EXIF/XMP metadata before they are hashed, since the
+original is served as-is.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from .image_worker import strip_metadata
+
+BLOB_PREFIX = 'blobs/'
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+def blob_name(digest, ext):
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest}{ext.lower()}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        # Identical names mean identical bytes, so never invent "_abc123" variants.
+        super().__init__(allow_overwrite=True, **kwargs)
+
+    def save(self, name, content, max_length=None):
+        from . import blobs
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            content.seek(0)
+            content = ContentFile(strip_metadata(content.read()), name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+        # Record the blob before checking the file: a concurrent collection
+        # of the same blob either finishes first (file gone, written again
+        # below) or sees the fresh touch and leaves it alone.
+        blobs.touch(name, content.size)
+        if os.path.exists(self.path(name)):
+            # Restart the grace period gc_media gives files whose row is not committed yet
+            os.utime(self.path(name))
+        else:
+            content.seek(0)
+            self._save(name, content)
+        return name
+
+
+def content_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,72 @@
+"""Story tray for the home page.
+
+The tray is built from two queries (active stories, the viewer's views of
+them), grouped in memory and cached per viewer. Adding a story bumps a
+global version so every viewer's cached tray is dropped at once; viewing a
+story only drops the viewer's own entry. Expired stories are moved out
+of the table by core.expiry.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Story, StoryView
+
+STORY_TTL = timedelta(hours=24)
+_VERSION_KEY = 'story_tray:version'
+
+
+def _cache_seconds():
+    return getattr(settings, 'STORY_TRAY_CACHE_SECONDS', 60)
+
+
+def _tray_key(viewer_id):
+    return f'story_tray:{cache.get_or_set(_VERSION_KEY, 1, None)}:{viewer_id}'
+
+
+def invalidate_all_trays():
+    """Drop every cached tray, e.g. after a new story is posted."""
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
+
+
+def invalidate_tray(viewer):
+    cache.delete(_tray_key(viewer.id))
+
+
+def invalidate_trays(viewer_ids):
+    cache.delete_many([_tray_key(viewer_id) for viewer_id in viewer_ids])
+
+
+def build_story_tray(viewer):
+    """Return one entry per author with active stories, newest author first.
+
+    Each entry is {'user', 'story' (latest), 'unviewed'}; `unviewed` is True
+    if the viewer has not seen at least one of that author's active stories.
+    """
+    cutoff = timezone.now() - STORY_TTL
+    stories = Story.objects.filter(created_at__gte=cutoff).select_related('user').order_by('-created_at')
+    seen = set(
+        StoryView.objects.filter(viewer=viewer, story__created_at__gte=cutoff)
+        .values_list('story_id', flat=True)
+    )
+    tray = {}
+    for s in stories:
+        entry = tray.setdefault(s.user_id, {'user': s.user, 'story': s, 'unviewed': False})
+        if s.id not in seen:
+            entry['unviewed'] = True
+    return list(tray.values())
+
+
+def get_story_tray(viewer):
+    """Cached `build_story_tray`."""
+    key = _tray_key(viewer.id)
+    tray = cache.get(key)
+    if tray is None:
+        tray = build_story_tray(viewer)
+        cache.set(key, tray, _cache_seconds())
+    return tray
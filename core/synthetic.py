@@ -0,0 +1,284 @@
+"""Synthetic social graph for load tests and benchmarks.
+
+`generate` fills the database with users and everything hanging off
+them, using bulk inserts in batches of `batch_size`, so a graph of
+100,000 users is a matter of minutes rather than hours:
+
+* follows with power-law in- and out-degrees: a few accounts are followed
+  by a large share of everyone, most by a handful;
+* posts spread over the last `days`, sharing a few real image blobs, with
+  Zipf-distributed hashtags and the odd @mention;
+* likes and comments from each author's followers, and the aggregated
+  notifications they would have produced;
+* active stories with views, and direct threads with messages.
+
+Bulk inserts skip signals and counter updates, so the derived data --
+counters, timelines, the search index, inbox summaries, explore ranks and
+blob reference counts -- is rebuilt at the end. The same seed always
+produces the same graph.
+"""
+import bisect
+import itertools
+import random
+from collections import defaultdict
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import blobs, chat, explore, feed, inbox, search
+from .counters import reconcile_counters
+from .models import (
+    Comment, Follow, Hashtag, InboxEntry, Like, Mention, Message, MessageThread, Notification,
+    NotificationActor, Post, PostTag, Profile, Story, StoryView, TimelineEntry,
+)
+from .notifications import RECENT_ACTORS, aggregate_text
+from .storage import content_storage
+
+FIRST_NAMES = ['Ana', 'Ben', 'Chloe', 'Dev', 'Elif', 'Farah', 'Gus', 'Hana', 'Ivan', 'Jia', 'Kofi', 'Lena',
+               'Mateo', 'Nia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sven', 'Tariq', 'Uma', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Garcia', 'Ito', 'Khan', 'Lopez', 'Moreau', 'Nguyen', 'Okafor', 'Petrov', 'Silva', 'Walsh',
+              'Berg', 'Costa', 'Haddad', 'Kim', 'Novak', 'Rossi', 'Sato', 'Tan']
+WORDS = ['sunset', 'coffee', 'travel', 'food', 'friends', 'beach', 'city', 'nature', 'art', 'music', 'dog',
+         'cat', 'fitness', 'books', 'weekend', 'mood', 'style', 'family', 'summer', 'winter', 'hiking',
+         'photography', 'streetart', 'brunch', 'design', 'vintage', 'garden', 'sky', 'ocean', 'mountains']
+MESSAGES = ['hey!', 'did you see that?', 'haha', 'on my way', 'love this', 'when are you free?',
+            'sounds good', 'miss you', 'lol', 'see you tomorrow', 'that place was great', 'ok']
+MEDIA_COLORS = ['#e76f51', '#f4a261', '#e9c46a', '#2a9d8f', '#264653', '#8ab17d', '#b56576', '#6d597a']
+
+
+class _Zipf:
+    """Draw indexes 0..n-1 with probability proportional to 1 / (rank + 1) ** s."""
+
+    def __init__(self, n, s=1.1):
+        self.cumulative = list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def draw(self, rng):
+        return bisect.bisect(self.cumulative, rng.random() * self.cumulative[-1])
+
+
+class _Writer:
+    """Buffers model instances and bulk-inserts each model every `batch_size` rows."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.pending = defaultdict(list)
+        self.counts = defaultdict(int)
+
+    def add(self, obj):
+        rows = self.pending[type(obj)]
+        rows.append(obj)
+        if len(rows) >= self.batch_size:
+            self.flush(type(obj))
+
+    def flush(self, model=None):
+        for m in [model] if model else list(self.pending):
+            rows, self.pending[m] = self.pending[m], []
+            if rows:
+                _bulk_insert(m, rows, self.batch_size)
+                self.counts[m.__name__] += len(rows)
+
+
+def _bulk_insert(model, rows, batch_size):
+    """bulk_create `rows`, keeping the created_at/viewed_at values set on them.
+
+    bulk_create stamps auto_now_add fields with the current time, so the
+    wanted values are written back with bulk_update (by the primary keys
+    bulk_create sets, hence no ignore_conflicts for those models).
+    """
+    fields = [f.attname for f in model._meta.fields if getattr(f, 'auto_now_add', False)]
+    if not fields:
+        model.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+        return
+    wanted = [[getattr(row, f) for f in fields] for row in rows]
+    model.objects.bulk_create(rows, batch_size=batch_size)
+    for row, values in zip(rows, wanted):
+        for f, value in zip(fields, values):
+            setattr(row, f, value)
+    model.objects.bulk_update(rows, fields, batch_size=batch_size)
+
+
+def _media_names(rng, count):
+    """Save `count` small JPEGs as content-addressed blobs; return their names."""
+    names = []
+    for i in range(count):
+        buf = BytesIO()
+        Image.new('RGB', (rng.choice([640, 1080]), rng.choice([640, 810, 1080])), MEDIA_COLORS[i % len(MEDIA_COLORS)]) \
+            .save(buf, 'JPEG', quality=80)
+        names.append(content_storage().save(f'posts/synthetic{i}.jpg', ContentFile(buf.getvalue())))
+    return names
+
+
+def generate(users=1000, posts_per_user=4, follows_per_user=40, like_rate=0.15, story_fraction=0.2,
+             threads_per_user=2, messages_per_thread=12, days=30, seed=0, batch_size=2000,
+             password='password', log=None):
+    """Create a synthetic graph of `users` accounts; return {model name: rows created}."""
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+    writer = _Writer(batch_size)
+
+    with transaction.atomic():
+        # Users, with one shared password hash (hashing is the slow part)
+        first_id = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        hashed = make_password(password)
+        for i in range(users):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            writer.add(User(
+                username=f'{first.lower()}.{last.lower()}{first_id + i}', first_name=first, last_name=last,
+                password=hashed, date_joined=now - timedelta(days=days + rng.random() * 365),
+            ))
+        writer.flush()
+        user_ids = list(User.objects.filter(id__gte=first_id).order_by('id').values_list('id', flat=True))
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+        for uid in user_ids:
+            writer.add(Profile(user_id=uid, bio=' '.join(rng.sample(WORDS, 3))))
+        log(f'{len(user_ids):,} users')
+
+        # Follows: popularity follows a random Zipf order, so celebrities are spread across ids
+        popular = user_ids[:]
+        rng.shuffle(popular)
+        popularity = _Zipf(len(popular))
+        followers = defaultdict(list)
+        for uid in user_ids:
+            wanted = min(len(user_ids) - 1, int(rng.paretovariate(1.5) * follows_per_user / 3))
+            targets = {popular[popularity.draw(rng)] for _ in range(wanted)} - {uid}
+            for target in targets:
+                followers[target].append(uid)
+                writer.add(Follow(follower_id=uid, following_id=target,
+                                  created_at=now - timedelta(days=rng.random() * days * 2)))
+        writer.flush()
+        log(f'{writer.counts["Follow"]:,} follows')
+
+        # Posts, tags and mentions
+        media = _media_names(rng, 8)
+        Hashtag.objects.bulk_create([Hashtag(name=w) for w in WORDS], ignore_conflicts=True)
+        hashtag_ids = dict(Hashtag.objects.filter(name__in=WORDS).values_list('name', 'id'))
+        tag_rank = _Zipf(len(WORDS))
+        limit = feed.fanout_limit()
+        posts = []
+        for uid in user_ids:
+            for _ in range(int(rng.expovariate(1 / posts_per_user)) if posts_per_user else 0):
+                tags = list(dict.fromkeys(WORDS[tag_rank.draw(rng)] for _ in range(rng.randint(0, 4))))
+                mentioned = rng.choice(user_ids) if rng.random() < 0.1 else None
+                caption = ' '.join(['Just posting', *(f'#{t}' for t in tags)])
+                if mentioned and mentioned != uid:
+                    caption += f' with @{usernames[mentioned]}'
+                else:
+                    mentioned = None
+                post = Post(author_id=uid, caption=caption, media=rng.choice(media), width=1080, height=1080,
+                            fanned_out=len(followers[uid]) <= limit,
+                            created_at=now - timedelta(seconds=rng.random() * days * 86400))
+                posts.append((post, tags, mentioned))
+        _bulk_insert(Post, [p for p, _, _ in posts], batch_size)
+        writer.counts['Post'] = len(posts)
+        for post, tags, mentioned in posts:
+            for t in tags:
+                writer.add(PostTag(hashtag_id=hashtag_ids[t], post_id=post.id, created_at=post.created_at))
+            if mentioned:
+                writer.add(Mention(post_id=post.id, user_id=mentioned, created_at=post.created_at))
+            audience = followers[post.author_id] if post.fanned_out else []
+            for uid in [post.author_id, *audience]:
+                writer.add(TimelineEntry(user_id=uid, post_id=post.id, created_at=post.created_at))
+        log(f'{len(posts):,} posts')
+
+        # Likes and comments from the author's followers, plus their notifications
+        unseen_likers = {}
+        for post, _, _ in posts:
+            audience = followers[post.author_id]
+            likers = rng.sample(audience, min(len(audience), int(len(audience) * like_rate * rng.expovariate(1))))
+            age = (now - post.created_at).total_seconds()
+            for uid in likers:
+                writer.add(Like(post_id=post.id, user_id=uid,
+                                created_at=post.created_at + timedelta(seconds=rng.random() * age)))
+            if likers:
+                recent = [usernames[uid] for uid in likers[:RECENT_ACTORS]]
+                seen = rng.random() < 0.8
+                if not seen:
+                    unseen_likers[post.id] = likers
+                writer.add(Notification(
+                    user_id=post.author_id, actor_id=likers[0], verb=Notification.LIKE, post_id=post.id,
+                    text=aggregate_text(Notification.LIKE, recent, len(likers)), actor_count=len(likers),
+                    recent_actors=recent, seen=seen, created_at=post.created_at,
+                    updated_at=now - timedelta(seconds=rng.random() * age),
+                ))
+            for uid in likers[:len(likers) // 6]:
+                created = post.created_at + timedelta(seconds=rng.random() * age)
+                writer.add(Comment(post_id=post.id, author_id=uid, text=rng.choice(MESSAGES), created_at=created))
+                writer.add(Notification(
+                    user_id=post.author_id, actor_id=uid, verb=Notification.COMMENT, post_id=post.id,
+                    text=f'{usernames[uid]} commented on your post.', recent_actors=[usernames[uid]],
+                    seen=rng.random() < 0.8, created_at=created, updated_at=created,
+                ))
+        writer.flush()
+        # Unseen aggregated rows get folded into again, so record who is already counted
+        open_rows = Notification.objects.filter(verb=Notification.LIKE, seen=False, post_id__in=list(unseen_likers))
+        for notification_id, post_id in open_rows.values_list('id', 'post_id').iterator(chunk_size=batch_size):
+            for uid in unseen_likers[post_id]:
+                writer.add(NotificationActor(notification_id=notification_id, user_id=uid))
+        writer.flush()
+        log(f'{writer.counts["Like"]:,} likes, {writer.counts["Comment"]:,} comments')
+
+        # Active stories and their views
+        stories = []
+        for uid in rng.sample(user_ids, int(len(user_ids) * story_fraction)):
+            for _ in range(rng.randint(1, 3)):
+                stories.append(Story(user_id=uid, media=rng.choice(media), width=1080, height=1080,
+                                     created_at=now - timedelta(seconds=rng.random() * 20 * 3600)))
+        _bulk_insert(Story, stories, batch_size)
+        writer.counts['Story'] = len(stories)
+        for story in stories:
+            audience = followers[story.user_id]
+            for uid in rng.sample(audience, int(len(audience) * rng.uniform(0.1, 0.5))):
+                writer.add(StoryView(story_id=story.id, viewer_id=uid, viewed_at=story.created_at))
+        writer.flush()
+
+        # Direct threads between followers and the accounts they follow
+        following = defaultdict(list)
+        for target, fans in followers.items():
+            for fan in fans:
+                following[fan].append(target)
+        pairs = set()
+        for uid in user_ids:
+            for other in rng.sample(following[uid], min(threads_per_user, len(following[uid]))):
+                pairs.add((min(uid, other), max(uid, other)))
+        threads = [
+            MessageThread(direct_key=chat.direct_key(a, b), created_at=now - timedelta(days=rng.random() * days))
+            for a, b in sorted(pairs)
+        ]
+        _bulk_insert(MessageThread, threads, batch_size)
+        writer.counts['MessageThread'] = len(threads)
+        threads = MessageThread.objects.filter(direct_key__in=[t.direct_key for t in threads])
+        Through = MessageThread.participants.through
+        for thread in threads.iterator(chunk_size=batch_size):
+            a, b = (int(part) for part in thread.direct_key.split(':'))
+            for user_id, partner_id in ((a, b), (b, a)):
+                writer.add(Through(messagethread_id=thread.id, user_id=user_id))
+                writer.add(InboxEntry(user_id=user_id, thread_id=thread.id, partner_id=partner_id,
+                                      last_activity=thread.created_at))
+            start = thread.created_at
+            for _ in range(rng.randint(1, messages_per_thread)):
+                start += timedelta(seconds=rng.random() * 3600)
+                writer.add(Message(thread_id=thread.id, sender_id=rng.choice((a, b)),
+                                   text=rng.choice(MESSAGES), created_at=min(start, now)))
+        writer.flush()
+        # Fold each thread's messages into its summary row and inbox badges
+        by_thread = defaultdict(list)
+        for message in Message.objects.filter(thread__in=threads).order_by('created_at', 'id').iterator(chunk_size=batch_size):
+            by_thread[message.thread_id].append(message)
+        for thread_id, messages in by_thread.items():
+            inbox.record_messages(thread_id, messages)
+        log(f'{writer.counts["MessageThread"]:,} threads, {writer.counts["Message"]:,} messages')
+
+    # Everything bulk_create did not maintain
+    reconcile_counters(batch_size=batch_size)
+    search.rebuild_index(batch_size=batch_size)
+    blobs.reconcile()
+    explore.compute_rankings()
+    log('counters, search index, media references and explore ranks rebuilt')
+    return dict(writer.counts)
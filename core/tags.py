@@ -0,0 +1,55 @@
+"""Hashtags and @mentions parsed out of post captions.
+
+`index_post` stores a post's tags and mentions when it is created, so a tag
+page is an index range scan on `PostTag` rather than a LIKE over captions.
+"""
+import re
+
+from django.contrib.auth.models import User
+
+from . import feed
+from .models import Hashtag, Mention, PostTag
+
+TAG_PAGE_SIZE = 24
+# Per caption, to bound the work a single post can cause.
+MAX_TAGS = 30
+MAX_MENTIONS = 20
+
+HASHTAG_RE = re.compile(r'(?<![\w&])#(\w{1,100})')
+# Usernames allow letters, digits and @.+-_ ; a trailing '.' is sentence punctuation.
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.+-]{1,150})')
+
+
+def parse_caption(caption):
+    """Return (hashtags, usernames) found in `caption`, first occurrence order, deduplicated."""
+    caption = caption or ''
+    tags = list(dict.fromkeys(t.lower() for t in HASHTAG_RE.findall(caption)))[:MAX_TAGS]
+    names = list(dict.fromkeys(n.rstrip('.') for n in MENTION_RE.findall(caption)))[:MAX_MENTIONS]
+    return tags, [n for n in names if n]
+
+
+def index_post(post):
+    """Store `post`'s hashtags and mentions; return the mentioned users (excluding the author)."""
+    tag_names, usernames = parse_caption(post.caption)
+    if tag_names:
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in tag_names], ignore_conflicts=True)
+        PostTag.objects.bulk_create([
+            PostTag(hashtag=tag, post=post, created_at=post.created_at)
+            for tag in Hashtag.objects.filter(name__in=tag_names)
+        ], ignore_conflicts=True)
+    if not usernames:
+        return []
+    users = list(User.objects.filter(username__in=usernames).exclude(pk=post.author_id))
+    Mention.objects.bulk_create([
+        Mention(post=post, user=user, created_at=post.created_at) for user in users
+    ], ignore_conflicts=True)
+    return users
+
+
+def tag_page(name, cursor=None, page_size=TAG_PAGE_SIZE):
+    """Return (posts, next_cursor) for hashtag `name`, newest first."""
+    rows, next_cursor = feed.keyset_page(
+        PostTag.objects.filter(hashtag__name=name.lower()).select_related('post__author'),
+        cursor, page_size,
+    )
+    return [row.post for row in rows], next_cursor
@@ -0,0 +1,36 @@
+import re
+
+from django import template
+from django.urls import reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from core.tags import HASHTAG_RE, MENTION_RE
+
+register = template.Library()
+
+_CAPTION_RE = re.compile(f'{HASHTAG_RE.pattern}|{MENTION_RE.pattern}')
+
+
+def _link(match):
+    tag, username = match.groups()
+    if tag:
+        return format_html('<a href="{}">#{}</a>', reverse('tag', args=[tag.lower()]), tag)
+    name = username.rstrip('.')
+    if not name:
+        return conditional_escape(match.group(0))
+    # A trailing '.' ends the sentence, not the username
+    return format_html('<a href="{}">@{}</a>{}', reverse('profile', args=[name]), name, username[len(name):])
+
+
+@register.filter
+def linkify_caption(caption):
+    """Escape `caption` and link its #hashtags and @mentions."""
+    caption = caption or ''
+    parts, last = [], 0
+    for match in _CAPTION_RE.finditer(caption):
+        parts.append(conditional_escape(caption[last:match.start()]))
+        parts.append(_link(match))
+        last = match.end()
+    parts.append(conditional_escape(caption[last:]))
+    return mark_safe(''.join(parts))
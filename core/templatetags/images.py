@@ -0,0 +1,17 @@
+from django import template
+
+from core import images
+
+register = template.Library()
+
+
+@register.filter
+def srcset(obj):
+    """`srcset` value for a post/story's downscaled variants ('' until they exist)."""
+    return images.srcset(obj.variants)
+
+
+@register.filter
+def thumb_url(obj, width):
+    """URL of the smallest variant at least `width` px wide, else the original."""
+    return images.variant_url(obj.variants, int(width), obj.media.url)
@@ -1,12 +1,63 @@
-from django.test import TestCase, Client
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from PIL import Image
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
-from .models import Profile, Post, Comment, Like, Follow, Story, MessageThread, Message
+from .models import (
+    Profile, Post, Comment, Like, Follow, Story, StoryView, MessageThread, Message,
+    InboxEntry, Notification, NotificationActor, NotificationOutbox, TimelineEntry, UploadSession, MediaBlob,
+    ArchivedStory,
+)
+from . import (
+    benchmarks, blobs, chat, expiry, explore, feed, image_worker, images, inbox, notifications, search, stories,
+    synthetic, tags, uploads, videos, viewers,
+)
+from .notifications import process_outbox, push_notification
+from .views import MESSAGE_PAGE_SIZE, REELS_PAGE_SIZE, _message_page
+from .consumers import ChatConsumer, RoomBatcher
+from .counters import reconcile_counters
+from .querylog import QueryBudgetAssertions
+from .storage import content_storage
+
+
+@override_settings(
+    NOTIFICATION_DELIVERY='inline', IMAGE_PROCESSING='inline', VIDEO_PROCESSING='inline',
+    STORY_VIEW_RECORDING='inline', STORY_EXPIRY_INTERVAL_SECONDS=0,
+)
+class CoreTestCase(TestCase):
+    """Runs the work the app normally hands to background threads inside the test.
+
+    Uploads go to a throwaway MEDIA_ROOT, removed after each class.
+    """
 
-class ModelTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUpClass()
+
+class ModelTests(CoreTestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='password')
         self.other_user = User.objects.create_user(username='otheruser', password='password')
@@ -74,7 +125,7 @@ class ModelTests(TestCase):
         self.assertEqual(str(msg), f'Message {msg.id} by testuser')
 
 
-class ViewTests(TestCase):
+class ViewTests(CoreTestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', email='test@example.com', password='password')
@@ -145,3 +196,1117 @@ class ViewTests(TestCase):
         response = self.client.post(reverse('comment_create', args=[post.id]), {'text': 'Great!'})
         self.assertEqual(response.status_code, 200)
         self.assertTrue(Comment.objects.filter(author=self.user, post=post, text='Great!').exists())
+
+
+class FeedTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.followed = User.objects.create_user(username='followed', password='password')
+        self.stranger = User.objects.create_user(username='stranger', password='password')
+        Follow.objects.create(follower=self.user, following=self.followed)
+
+    def _post(self, author):
+        post = Post.objects.create(author=author, media=SimpleUploadedFile("t.jpg", b"c"))
+        feed.fan_out_post(post)
+        return post
+
+    def test_feed_is_scoped_to_followed_and_self(self):
+        own = self._post(self.user)
+        followed = self._post(self.followed)
+        self._post(self.stranger)
+        posts, cursor = feed.get_feed_page(self.user)
+        self.assertEqual(posts, [followed, own])
+        self.assertIsNone(cursor)
+
+    def test_keyset_pagination(self):
+        created = [self._post(self.followed) for _ in range(5)]
+        first, cursor = feed.get_feed_page(self.user, page_size=3)
+        self.assertEqual(first, created[:1:-1])
+        second, cursor = feed.get_feed_page(self.user, cursor=cursor, page_size=3)
+        self.assertEqual(second, created[1::-1])
+        self.assertIsNone(cursor)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_high_follower_posts_merged_on_read(self):
+        reconcile_counters()
+        post = self._post(self.followed)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        posts, _ = feed.get_feed_page(self.user)
+        self.assertEqual(posts, [post])
+
+    def test_pulled_posts_survive_author_dropping_below_limit(self):
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=0):
+            post = self._post(self.followed)
+        self.assertFalse(Post.objects.get(pk=post.pk).fanned_out)
+        reconcile_counters()
+        posts, _ = feed.get_feed_page(self.user)
+        self.assertEqual(posts, [post])
+
+    def test_follow_toggle_updates_timeline(self):
+        post = self._post(self.stranger)
+        self.client.force_login(self.user)
+        self.client.post(reverse('follow_toggle', args=[self.stranger.username]))
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        self.client.post(reverse('follow_toggle', args=[self.stranger.username]))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user, post=post).exists())
+
+
+class CounterTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.other_user = User.objects.create_user(username='otheruser', password='password')
+        self.post = Post.objects.create(author=self.other_user, media=SimpleUploadedFile("t.jpg", b"c"))
+        self.client.force_login(self.user)
+
+    def test_like_and_comment_counters(self):
+        response = self.client.post(reverse('like_toggle', args=[self.post.id]))
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.post(reverse('comment_create', args=[self.post.id]), {'text': 'Hi'})
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.post(reverse('like_toggle', args=[self.post.id]))
+        self.assertEqual(response.json()['count'], 0)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (0, 1))
+
+    def test_follow_counters(self):
+        response = self.client.post(reverse('follow_toggle', args=[self.other_user.username]))
+        self.assertEqual(response.json()['followers'], 1)
+        self.assertEqual(Profile.objects.get(user=self.user).following_count, 1)
+        response = self.client.post(reverse('follow_toggle', args=[self.other_user.username]))
+        self.assertEqual(response.json()['followers'], 0)
+        self.assertEqual(Profile.objects.get(user=self.user).following_count, 0)
+
+    def test_unlike_race_decrements_once(self):
+        Post.objects.filter(pk=self.post.pk).update(like_count=1)
+        # The row was already removed by a concurrent toggle after get_or_create saw it
+        with mock.patch.object(Like.objects, 'get_or_create', return_value=(None, False)):
+            response = self.client.post(reverse('like_toggle', args=[self.post.id]))
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_reconcile_counters_fixes_drift(self):
+        Like.objects.create(post=self.post, user=self.user)
+        Follow.objects.create(follower=self.user, following=self.other_user)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        profile = Profile.objects.get(user=self.other_user)
+        self.assertEqual((profile.follower_count, profile.post_count), (1, 1))
+
+
+class StoryTrayTests(CoreTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.author = User.objects.create_user(username='author', password='password')
+        self.first = Story.objects.create(user=self.author, media=SimpleUploadedFile("story.jpg", b"c"))
+        self.second = Story.objects.create(user=self.author, media=SimpleUploadedFile("story.jpg", b"c"))
+
+    def test_tray_groups_by_author_in_two_queries(self):
+        StoryView.objects.create(story=self.second, viewer=self.user)
+        with self.assertNumQueries(2):
+            tray = stories.build_story_tray(self.user)
+        self.assertEqual(len(tray), 1)
+        self.assertEqual(tray[0]['story'], self.second)
+        self.assertTrue(tray[0]['unviewed'])
+
+    def test_mark_viewed_invalidates_cached_tray(self):
+        self.client.force_login(self.user)
+        self.assertTrue(stories.get_story_tray(self.user)[0]['unviewed'])
+        for story in (self.first, self.second):
+            self.client.post(reverse('mark_story_viewed'), {'story_id': story.id})
+        with self.assertNumQueries(2):  # rebuilt, not served stale from cache
+            self.assertFalse(stories.get_story_tray(self.user)[0]['unviewed'])
+
+
+class StoryViewTests(CoreTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='password')
+        self.viewer = User.objects.create_user(username='viewer', password='password')
+        self.first = Story.objects.create(user=self.author, media='stories/a.jpg')
+        self.second = Story.objects.create(user=self.author, media='stories/b.jpg')
+        self.expired = Story.objects.create(user=self.author, media='stories/c.jpg')
+        Story.objects.filter(pk=self.expired.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+    def _mark(self, user, *story_ids):
+        self.client.force_login(user)
+        return self.client.post(reverse('mark_story_viewed'), {'story_ids': ','.join(map(str, story_ids))})
+
+    def test_batch_records_each_view_once(self):
+        ids = (self.first.id, self.second.id, self.expired.id, 999999)
+        self.assertTrue(self._mark(self.viewer, *ids).json()['ok'])
+        self._mark(self.viewer, self.first.id)
+        self._mark(self.author, self.first.id)  # own views are not counted
+        self.assertEqual(
+            set(StoryView.objects.values_list('story_id', 'viewer_id')),
+            {(self.first.id, self.viewer.id), (self.second.id, self.viewer.id)},
+        )
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.view_count, 1)
+        self.assertEqual(self._mark(self.viewer, 'x').status_code, 400)
+
+    @override_settings(STORY_VIEW_RECORDING='buffered')
+    def test_buffered_views_are_written_on_flush(self):
+        with mock.patch.object(viewers.flusher, 'wake'):
+            with self.assertNumQueries(0):
+                viewers.record(self.viewer.id, [self.first.id, self.second.id])
+            viewers.record(self.viewer.id, [self.first.id])
+        self.assertFalse(StoryView.objects.exists())
+        self.assertEqual(viewers.flush(), 2)
+        self.assertEqual(viewers.flush(), 0)
+        self.assertEqual(
+            list(Story.objects.filter(pk__in=[self.first.pk, self.second.pk]).values_list('view_count', flat=True)),
+            [1, 1],
+        )
+
+    @override_settings(STORY_VIEW_RECORDING='buffered')
+    def test_flush_drops_views_that_cannot_be_written(self):
+        gone = User.objects.create_user(username='gone', password='password')
+        with mock.patch.object(viewers.flusher, 'wake'):
+            viewers.record(gone.id, [self.first.id])
+            gone.delete()
+            viewers.record(self.viewer.id, [self.first.id])
+        self.assertEqual(viewers.flush(), 1)
+        self.assertEqual(list(StoryView.objects.values_list('viewer_id', flat=True)), [self.viewer.id])
+        # A batch the database rejects outright is not retried forever
+        with mock.patch.object(viewers.flusher, 'wake'):
+            viewers.record(self.viewer.id, [self.second.id])
+        with mock.patch.object(viewers, 'write', side_effect=IntegrityError), self.assertLogs('core.viewers', 'WARNING'):
+            self.assertEqual(viewers.flush(), 0)
+        self.assertEqual(viewers.flush(), 0)
+
+    def test_seen_by_list_is_owner_only_and_paged(self):
+        others = [User.objects.create_user(username=f'fan{i}', password='password') for i in range(3)]
+        for user in [self.viewer, *others]:
+            viewers.record(user.id, [self.first.id])
+        url = reverse('story_viewers', args=[self.first.id])
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.author)
+        with mock.patch.object(viewers, 'VIEWERS_PAGE_SIZE', 3):
+            page = self.client.get(url).json()
+            self.assertEqual(page['count'], 4)
+            self.assertEqual([v['username'] for v in page['viewers']], ['fan2', 'fan1', 'fan0'])
+            rest = self.client.get(url, {'cursor': page['next_cursor']}).json()
+        self.assertEqual([v['username'] for v in rest['viewers']], ['viewer'])
+        self.assertIsNone(rest['next_cursor'])
+
+
+class NotificationTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.other_user = User.objects.create_user(username='otheruser', password='password')
+        self.post = Post.objects.create(author=self.user, media=SimpleUploadedFile("t.jpg", b"c"))
+
+    def test_like_records_actor_verb_and_post(self):
+        self.client.force_login(self.other_user)
+        self.client.post(reverse('like_toggle', args=[self.post.id]))
+        n = Notification.objects.get(user=self.user)
+        self.assertEqual((n.actor, n.verb, n.post), (self.other_user, Notification.LIKE, self.post))
+
+    def test_notifications_view_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        Notification.objects.create(user=self.user, actor=self.other_user, verb=Notification.LIKE, post=self.post, text='x')
+        with self.assertNumQueries(3):  # session, user, notifications
+            self.client.get(reverse('notifications'))
+        for _ in range(10):
+            Notification.objects.create(user=self.user, actor=self.other_user, verb=Notification.FOLLOW, text='x')
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('notifications'))
+        self.assertEqual(len(response.context['notifs']), 11)
+
+    def test_likes_on_same_post_are_coalesced(self):
+        fans = [User.objects.create_user(username=f'fan{i}', password='password') for i in range(3)]
+        for fan in fans + fans[:1]:
+            push_notification(self.user, f'{fan.username} liked your post.', actor=fan,
+                              verb=Notification.LIKE, post=self.post)
+        n = Notification.objects.get(user=self.user)
+        self.assertEqual(n.actor_count, 3)
+        self.assertEqual(n.text, 'fan0 and 2 others liked your post.')
+        self.assertEqual(n.recent_actors, ['fan0', 'fan2', 'fan1'])
+
+    def test_actor_count_is_distinct_beyond_recent_actors(self):
+        fans = [User.objects.create_user(username=f'fan{i}', password='password') for i in range(4)]
+        for fan in fans + fans[:1]:
+            push_notification(self.user, f'{fan.username} liked your post.', actor=fan,
+                              verb=Notification.LIKE, post=self.post)
+        n = Notification.objects.get(user=self.user)
+        self.assertEqual(n.actor_count, 4)
+        self.assertEqual(n.text, 'fan0 and 3 others liked your post.')
+
+    def test_unlike_takes_actor_out_of_aggregate(self):
+        fan = User.objects.create_user(username='fan', password='password')
+        for actor in (self.other_user, fan):
+            self.client.force_login(actor)
+            self.client.post(reverse('like_toggle', args=[self.post.id]))
+        self.client.post(reverse('like_toggle', args=[self.post.id]))  # fan unlikes
+        n = Notification.objects.get(user=self.user)
+        self.assertEqual((n.actor_count, n.actor, n.text), (1, self.other_user, 'otheruser liked your post.'))
+        self.client.force_login(self.other_user)
+        self.client.post(reverse('like_toggle', args=[self.post.id]))
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+
+    def test_throttled_push_is_sent_when_debounce_ends(self):
+        for _ in range(2):
+            push_notification(self.user, 'otheruser started following you.', actor=self.other_user,
+                              verb=Notification.FOLLOW)
+        n = Notification.objects.get(user=self.user)
+        self.assertIsNotNone(n.push_due)
+        self.assertEqual(notifications.send_due_pushes(now=n.push_due - timedelta(seconds=1)), 0)
+        self.assertEqual(notifications.send_due_pushes(now=n.push_due), 1)
+        self.assertEqual(notifications.send_due_pushes(now=n.push_due), 0)
+
+    @override_settings(NOTIFICATION_AGGREGATE_WINDOW=0)
+    def test_events_outside_window_are_not_coalesced(self):
+        for _ in range(2):
+            push_notification(self.user, 'otheruser liked your post.', actor=self.other_user,
+                              verb=Notification.LIKE, post=self.post)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(NOTIFICATION_DELIVERY='queued')
+    def test_queued_delivery_goes_through_outbox(self):
+        fan = User.objects.create_user(username='fan', password='password')
+        for actor in (self.other_user, fan):
+            push_notification(self.user, f'{actor.username} liked your post.', actor=actor,
+                              verb=Notification.LIKE, post=self.post)
+        push_notification(self.user, 'fan started following you.', actor=fan, verb=Notification.FOLLOW)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(process_outbox(), 3)
+        self.assertFalse(NotificationOutbox.objects.exists())
+        like = Notification.objects.get(user=self.user, verb=Notification.LIKE)
+        self.assertEqual(like.actor_count, 2)
+        self.assertTrue(Notification.objects.filter(user=self.user, verb=Notification.FOLLOW).exists())
+
+    @override_settings(NOTIFICATION_DELIVERY='queued')
+    def test_failed_outbox_batch_is_rolled_back(self):
+        push_notification(self.user, 'otheruser liked your post.', actor=self.other_user,
+                          verb=Notification.LIKE, post=self.post, title='New like')
+        process_outbox()
+        fan = User.objects.create_user(username='fan', password='password')
+        push_notification(self.user, 'fan liked your post.', actor=fan, verb=Notification.LIKE, post=self.post)
+        with mock.patch.object(NotificationActor.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                process_outbox()
+        # The fold into the existing row was undone with the rest of the batch
+        self.assertEqual(Notification.objects.get(user=self.user).actor_count, 1)
+        self.assertEqual(process_outbox(), 1)
+        self.assertEqual(Notification.objects.get(user=self.user).actor_count, 2)
+
+
+class MessageHistoryTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.other_user = User.objects.create_user(username='otheruser', password='password')
+        self.thread = MessageThread.objects.create()
+        self.thread.participants.add(self.user, self.other_user)
+        self.msgs = [Message.objects.create(thread=self.thread, sender=self.user, text=str(i)) for i in range(5)]
+        self.client.force_login(self.user)
+
+    def test_messages_view_renders_latest_page(self):
+        Message.objects.bulk_create(
+            [Message(thread=self.thread, sender=self.other_user, text='bulk') for _ in range(MESSAGE_PAGE_SIZE)]
+        )
+        response = self.client.get(reverse('messages'), {'t': self.thread.id})
+        page = response.context['chat_messages']
+        self.assertEqual(len(page), MESSAGE_PAGE_SIZE)
+        self.assertEqual(page[-1].id, Message.objects.latest('id').id)
+        self.assertTrue(response.context['has_older'])
+
+    def test_history_endpoint_pages_backwards(self):
+        response = self.client.get(reverse('message_history', args=[self.thread.id]), {'before': self.msgs[2].id})
+        data = response.json()
+        self.assertEqual([m['text'] for m in data['messages']], ['0', '1'])
+        self.assertFalse(data['has_older'])
+
+    def test_history_pages_cover_messages_with_out_of_order_timestamps(self):
+        Message.objects.filter(pk=self.msgs[4].pk).update(created_at=timezone.now() - timedelta(days=1))
+        seen, before = [], None
+        while True:
+            page, has_older = _message_page(self.thread, before=before, size=2)
+            seen = page + seen
+            if not has_older:
+                break
+            before = page[0].id
+        self.assertEqual(seen, self.msgs)
+
+    def test_history_endpoint_requires_participant(self):
+        outsider = User.objects.create_user(username='outsider', password='password')
+        self.client.force_login(outsider)
+        response = self.client.get(reverse('message_history', args=[self.thread.id]), {'before': self.msgs[2].id})
+        self.assertEqual(response.status_code, 403)
+
+
+class InboxTests(CoreTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.friends = [User.objects.create_user(username=f'friend{i}', password='password') for i in range(2)]
+        self.client.force_login(self.user)
+        self.threads = []
+        for friend in self.friends:
+            self.client.get(reverse('start_thread', args=[friend.username]))
+            self.threads.append(InboxEntry.objects.get(user=self.user, partner=friend).thread)
+
+    def _send(self, sender, thread, text):
+        self.client.force_login(sender)
+        self.client.post(reverse('message_upload'), {'thread_id': thread.id, 'text': text})
+
+    def test_inbox_sorted_by_last_activity_with_unread_badges(self):
+        self._send(self.friends[1], self.threads[1], 'first')
+        self._send(self.friends[0], self.threads[0], 'second')
+        self._send(self.friends[0], self.threads[0], 'third')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('messages'), {'t': self.threads[1].id})
+        entries = list(response.context['threads'])
+        self.assertEqual([e.thread for e in entries], [self.threads[0], self.threads[1]])
+        self.assertEqual([e.unread_count for e in entries], [2, 0])
+        self.assertEqual(entries[0].thread.last_preview, 'third')
+
+    def test_sender_entry_stays_read(self):
+        self._send(self.user, self.threads[0], 'hello')
+        mine = InboxEntry.objects.get(user=self.user, thread=self.threads[0])
+        theirs = InboxEntry.objects.get(user=self.friends[0], thread=self.threads[0])
+        self.assertEqual((mine.unread_count, theirs.unread_count), (0, 1))
+        self.assertEqual(mine.last_read_message, Message.objects.get(text='hello'))
+
+    def test_start_thread_reuses_direct_thread(self):
+        self.client.get(reverse('start_thread', args=[self.friends[0].username]))
+        self.client.force_login(self.friends[0])
+        self.client.get(reverse('start_thread', args=[self.user.username]))
+        self.assertEqual(MessageThread.objects.count(), 2)
+        self.assertEqual(self.threads[0].direct_key, chat.direct_key(self.friends[0].id, self.user.id))
+
+    def test_is_participant_uses_direct_key(self):
+        outsider = User.objects.create_user(username='outsider', password='password')
+        with self.assertNumQueries(1):
+            self.assertTrue(chat.is_participant(self.threads[0].id, self.user.id))
+        self.assertFalse(chat.is_participant(self.threads[0].id, outsider.id))
+        self.assertFalse(chat.is_participant(0, self.user.id))
+
+    def test_participant_cache_invalidated_on_membership_change(self):
+        group = MessageThread.objects.create()
+        group.participants.add(self.user)
+        self.assertEqual(chat.participant_ids(group.id), {self.user.id})
+        group.participants.add(self.friends[0])
+        with self.assertNumQueries(2):
+            self.assertEqual(chat.participant_ids(group.id), {self.user.id, self.friends[0].id})
+        with self.assertNumQueries(0):
+            self.assertTrue(chat.is_participant(group.id, self.friends[0].id))
+
+
+class ChatConsumerTests(CoreTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.other_user = User.objects.create_user(username='otheruser', password='password')
+        self.thread, _ = chat.get_or_create_direct_thread(self.user, self.other_user)
+
+    async def _exchange(self, texts):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/{self.thread.id}/')
+        communicator.scope['user'] = self.user
+        communicator.scope['url_route'] = {'kwargs': {'thread_id': str(self.thread.id)}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for text in texts:
+            await communicator.send_json_to({'text': text})
+        frame = await communicator.receive_json_from(timeout=5)
+        await communicator.disconnect()
+        return frame
+
+    @override_settings(CHAT_BATCH_MAX_LATENCY_MS=100)
+    def test_messages_are_saved_and_broadcast_as_one_batch(self):
+        frame = async_to_sync(self._exchange)(['one', 'two', 'three'])
+        self.assertEqual(frame['type'], 'chat.batch')
+        self.assertEqual([m['text'] for m in frame['messages']], ['one', 'two', 'three'])
+        self.assertEqual(list(self.thread.messages.order_by('id').values_list('text', flat=True)), ['one', 'two', 'three'])
+        theirs = InboxEntry.objects.get(user=self.other_user, thread=self.thread)
+        self.assertEqual(theirs.unread_count, 3)
+
+    @mock.patch.object(RoomBatcher, 'SAVE_RETRY_DELAY', 0)
+    def test_failed_save_is_retried(self):
+        save, attempts = RoomBatcher.__dict__['_save_batch'], []
+
+        async def flaky(batcher, batch):
+            attempts.append(batch)
+            if len(attempts) == 1:
+                raise DatabaseError('database is locked')
+            return await save.__get__(batcher, RoomBatcher)(batch)
+
+        with mock.patch.object(RoomBatcher, '_save_batch', flaky):
+            frame = async_to_sync(self._exchange)(['one'])
+        self.assertEqual((frame['type'], len(attempts)), ('chat.batch', 2))
+        self.assertEqual(list(self.thread.messages.values_list('text', flat=True)), ['one'])
+
+    @mock.patch.object(RoomBatcher, 'SAVE_RETRY_DELAY', 0)
+    def test_unsaved_messages_are_returned_to_sender(self):
+        with mock.patch.object(RoomBatcher, '_save_batch', side_effect=DatabaseError('locked')):
+            frame = async_to_sync(self._exchange)(['one', 'two'])
+        self.assertEqual((frame['type'], frame['texts']), ('chat.error', ['one', 'two']))
+        self.assertFalse(self.thread.messages.exists())
+
+    @mock.patch.object(RoomBatcher, 'SAVE_RETRY_DELAY', 0)
+    def test_rooms_are_forgotten_after_every_idle_flush(self):
+        async def flushes():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            batcher = RoomBatcher.for_room(self.thread.id, layer)
+            batcher.pending.append((channel, self.user.id, self.user.username, 'lost'))
+            with mock.patch.object(RoomBatcher, '_save_batch', side_effect=DatabaseError('locked')):
+                await batcher.flush()
+            after_reject = self.thread.id in RoomBatcher._rooms
+            await RoomBatcher.for_room(self.thread.id, layer).flush()  # nothing left to send
+            return after_reject, self.thread.id in RoomBatcher._rooms, await layer.receive(channel)
+
+        after_reject, after_empty, frame = async_to_sync(flushes)()
+        self.assertEqual((after_reject, after_empty, frame['texts']), (False, False, ['lost']))
+
+
+class ReelsTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_login(self.user)
+
+    def test_media_type_set_on_upload(self):
+        self.client.post(reverse('create_post'), {
+            'caption': 'clip', 'media': SimpleUploadedFile("clip.MOV", b"v", content_type="video/quicktime"),
+        })
+        self.assertEqual(Post.objects.get(caption='clip').media_type, Post.VIDEO)
+
+    def test_reels_view_pages_videos_only(self):
+        Post.objects.create(author=self.user, media=SimpleUploadedFile("t.jpg", b"c"))
+        videos = [
+            Post.objects.create(author=self.user, media=SimpleUploadedFile("v.mp4", b"c"))
+            for _ in range(REELS_PAGE_SIZE + 1)
+        ]
+        response = self.client.get(reverse('reels'))
+        self.assertEqual(response.context['reels'], videos[:0:-1])
+        response = self.client.get(reverse('reels'), {'cursor': response.context['next_cursor']})
+        self.assertEqual(response.context['reels'], videos[:1])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class ExploreTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='password') for i in range(3)]
+        self.posts = [Post.objects.create(author=self.user, media=SimpleUploadedFile("t.jpg", b"c")) for _ in range(3)]
+        self.client.force_login(self.user)
+
+    def test_rankings_order_by_decayed_engagement(self):
+        for fan in self.fans:
+            Like.objects.create(post=self.posts[0], user=fan)
+        Comment.objects.create(post=self.posts[1], author=self.fans[0], text='!')
+        old = Like.objects.create(post=self.posts[2], user=self.fans[0])
+        Like.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.assertEqual(explore.compute_rankings(), 2)
+        posts, cursor = explore.ranked_page(page_size=1)
+        self.assertEqual(posts, [self.posts[0]])
+        posts, cursor = explore.ranked_page(cursor, page_size=1)
+        self.assertEqual((posts, cursor), ([self.posts[1]], None))
+
+    def test_api_falls_back_to_recent_without_rankings(self):
+        data = self.client.get(reverse('explore_api'), {'mode': 'ranked'}).json()
+        self.assertEqual(data['mode'], 'recent')
+        self.assertEqual([p['id'] for p in data['posts']], [p.id for p in reversed(self.posts)])
+
+    def test_recent_pages_walk_an_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('checks the SQLite query plan')
+        _, cursor = explore.recent_page(page_size=1)
+        queries = [Post.objects.select_related('author').order_by('-created_at', '-id')[:2]]
+        position = feed.decode_cursor(cursor)
+        queries.append(queries[0].model.objects.select_related('author')
+                       .filter(feed._before(position, 'created_at', 'id')).order_by('-created_at', '-id')[:2])
+        for queryset in queries:
+            plan = queryset.explain()
+            self.assertIn('core_post_recent', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class SearchTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.ann = User.objects.create_user(username='ann', first_name='Zed')
+        self.annie = User.objects.create_user(username='annie_k')
+        self.named = User.objects.create_user(username='zz9', first_name='Annabel', last_name='Lee')
+        self.client.force_login(self.user)
+
+    def test_ranks_username_prefix_above_name_prefix(self):
+        self.assertEqual(search.search_users('ann'), [self.ann, self.annie, self.named])
+        self.assertEqual(search.search_users('ANNA lee'), [self.named])
+        self.assertEqual(search.search_users('k'), [self.annie])
+
+    def test_index_follows_profile_edits(self):
+        self.ann.first_name = 'Quinn'
+        self.ann.save()
+        self.assertEqual(search.search_users('quinn'), [self.ann])
+        self.assertEqual(search.search_users('zed'), [])
+        # login only writes last_login and leaves the index alone
+        self.client.login(username='testuser', password='password')
+        self.assertEqual(search.search_users('testuser'), [self.user])
+
+    def test_typeahead_endpoint(self):
+        data = self.client.get(reverse('user_typeahead'), {'q': 'ann'}).json()
+        self.assertEqual([u['username'] for u in data['users']], ['ann', 'annie_k', 'zz9'])
+        self.assertEqual(data['users'][2]['full_name'], 'Annabel Lee')
+        self.assertEqual(self.client.get(reverse('user_typeahead')).json(), {'users': []})
+
+
+class TagTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.friend = User.objects.create_user(username='friend', password='password')
+        self.client.force_login(self.user)
+
+    def _post(self, caption):
+        self.client.post(reverse('create_post'), {
+            'caption': caption, 'media': SimpleUploadedFile('t.jpg', b'c', content_type='image/jpeg'),
+        })
+        return Post.objects.latest('id')
+
+    def test_parse_caption(self):
+        self.assertEqual(
+            tags.parse_caption('#Sun and #sun, hi @friend. mail a@b.c #x&#39; @testuser'),
+            (['sun', 'x'], ['friend', 'testuser']),
+        )
+
+    def test_create_post_indexes_tags_and_notifies_mentions(self):
+        post = self._post('Beach day #Summer with @friend and @testuser @nobody')
+        self.assertEqual(list(post.tags.values_list('hashtag__name', flat=True)), ['summer'])
+        self.assertEqual(list(post.mentions.values_list('user__username', flat=True)), ['friend'])
+        n = Notification.objects.get(user=self.friend)
+        self.assertEqual((n.verb, n.actor, n.post), (Notification.MENTION, self.user, post))
+        self.assertFalse(Notification.objects.filter(user=self.user, verb=Notification.MENTION).exists())
+
+    def test_tag_feed_pages_newest_first(self):
+        posts = [self._post(f'#Cats {i}') for i in range(3)]
+        self._post('#dogs')
+        page, cursor = tags.tag_page('CATS', page_size=2)
+        self.assertEqual(page, [posts[2], posts[1]])
+        page, cursor = tags.tag_page('cats', cursor, page_size=2)
+        self.assertEqual((page, cursor), ([posts[0]], None))
+        response = self.client.get(reverse('tag', args=['cats']))
+        self.assertEqual(list(response.context['posts']), posts[::-1])
+        self.assertContains(self.client.get(reverse('home')), f'href="{reverse("tag", args=["cats"])}"')
+
+
+def jpeg_upload(name='photo.jpg', size=(1500, 1000)):
+    buf = BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCam'  # Make
+    Image.new('RGB', size, 'teal').save(buf, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buf.getvalue(), content_type='image/jpeg')
+
+
+class ImageVariantTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_login(self.user)
+
+    def test_post_upload_records_size_and_stripped_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_post'), {'caption': '', 'media': jpeg_upload()})
+        post = Post.objects.get()
+        self.assertEqual((post.width, post.height), (1500, 1000))
+        self.assertEqual(sorted(post.variants, key=int), ['320', '640', '1080'])
+        with default_storage.open(post.variants['320']) as f, Image.open(f) as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (320, 213)))
+            self.assertFalse(variant.getexif())
+        html = self.client.get(reverse('home')).content.decode()
+        self.assertIn(f'{default_storage.url(post.variants["640"])} 640w', html)
+        self.assertNotIn(f'src="{post.media.url}"', html)
+
+    def test_small_and_undecodable_uploads(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_post'), {'caption': '', 'media': jpeg_upload(size=(200, 100))})
+        self.assertEqual(list(Post.objects.get().variants), ['200'])
+        post = Post.objects.create(author=self.user, media=SimpleUploadedFile('bad.jpg', b'not an image'))
+        with self.assertLogs('core.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            images.schedule(post)
+        post.refresh_from_db()
+        self.assertEqual((post.variants, post.width), ({}, None))
+
+    def test_decompression_bomb_is_skipped(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            post = Post.objects.create(author=self.user, media=jpeg_upload())
+            with self.assertLogs('core.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                images.schedule(post)
+        post.refresh_from_db()
+        self.assertEqual(post.variants, {})
+
+    def test_stored_originals_have_no_exif(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_post'), {'caption': '', 'media': jpeg_upload()})
+            self.client.post(reverse('profile_edit', args=['testuser']), {'bio': '', 'avatar': jpeg_upload('a.jpg')})
+        for field in (Post.objects.get().media, Profile.objects.get(user=self.user).avatar):
+            with default_storage.open(field.name) as f, Image.open(f) as original:
+                self.assertEqual((original.format, original.size), ('JPEG', (1500, 1000)))
+                self.assertFalse(original.getexif())
+
+    def test_metadata_is_stripped_without_reencoding_webp(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'TestCam'
+        buf = BytesIO()
+        Image.effect_noise((300, 200), 60).convert('RGB').save(buf, 'WEBP', quality=70, exif=exif)
+        stripped = image_worker.strip_metadata(buf.getvalue())
+        self.assertLess(len(stripped), len(buf.getvalue()))
+        self.assertNotIn(b'VP8L', stripped)  # still the original lossy bitstream
+        with Image.open(BytesIO(stripped)) as image:
+            self.assertFalse(image.getexif())
+        # Rotated photos are turned upright before their orientation tag goes
+        exif[0x0112] = 6
+        buf = BytesIO()
+        Image.new('RGB', (300, 200), 'teal').save(buf, 'JPEG', exif=exif)
+        with Image.open(BytesIO(image_worker.strip_metadata(buf.getvalue()))) as image:
+            self.assertEqual((image.size, dict(image.getexif())), ((200, 300), {}))
+
+    def test_new_avatar_replaces_variants(self):
+        url = reverse('profile_edit', args=['testuser'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'bio': '', 'avatar': jpeg_upload('a.jpg', (400, 400))})
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(list(profile.avatar_variants), ['160'])
+        self.assertEqual(profile.avatar_url, default_storage.url(profile.avatar_variants['160']))
+        old_files = [profile.avatar.name, profile.avatar_variants['160']]
+        # The replaced avatar and its thumbnail go with it, and the new ones with the account
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'bio': '', 'avatar': jpeg_upload('b.jpg', (400, 400))})
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+        profile.refresh_from_db()
+        new_files = [profile.avatar.name, profile.avatar_variants['160']]
+        self.assertTrue(all(default_storage.exists(name) for name in new_files))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in new_files))
+
+    def test_generate_uses_worker_pool(self):
+        post = Post.objects.create(author=self.user, media=jpeg_upload())
+        self.assertEqual(images.generate([post]), 1)
+        post.refresh_from_db()
+        self.assertEqual(len(post.variants), 3)
+
+
+# Stands in for ffmpeg: writes a placeholder to the output path (the last argument).
+FAKE_FFMPEG = f"""#!{sys.executable}
+import sys
+with open(sys.argv[-1], 'wb') as f:
+    f.write(b'derived')
+"""
+
+
+class VideoPosterTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_login(self.user)
+
+    def _upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_post'), {
+                'caption': '', 'media': SimpleUploadedFile('clip.mp4', b'video', content_type='video/mp4'),
+            })
+        return Post.objects.get()
+
+    def test_without_ffmpeg_tiles_do_not_preload(self):
+        with override_settings(FFMPEG_BINARY=None), mock.patch('shutil.which', return_value=None):
+            post = self._upload()
+        self.assertEqual((post.poster.name, post.preview.name), ('', ''))
+        html = self.client.get(reverse('explore')).content.decode()
+        self.assertIn('preload="none"', html)
+        self.assertNotIn('autoplay', html)
+
+    def test_poster_and_preview_stored_next_to_original(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            binary = os.path.join(tmp, 'ffmpeg')
+            with open(binary, 'w') as f:
+                f.write(FAKE_FFMPEG)
+            os.chmod(binary, os.stat(binary).st_mode | stat.S_IEXEC)
+            with override_settings(FFMPEG_BINARY=binary):
+                post = self._upload()
+        stem = os.path.splitext(post.media.name)[0]
+        self.assertTrue(post.poster.name.startswith(f'{stem}_poster') and post.poster.name.endswith('.jpg'))
+        self.assertTrue(post.preview.name.startswith(f'{stem}_preview'))
+        html = self.client.get(reverse('home')).content.decode()
+        self.assertIn(f'poster="{post.poster.url}"', html)
+        data = self.client.get(reverse('explore_api')).json()
+        self.assertEqual(data['posts'][0]['preview_url'], post.preview.url)
+
+
+class ChunkedUploadTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_login(self.user)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.settings_override = override_settings(UPLOAD_TEMP_DIR=self.tmp.name, UPLOAD_CHUNK_SIZE=1024)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.data = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 10  # 2,572 bytes of "MP4"
+
+    def _start(self, **fields):
+        params = {'kind': 'post', 'filename': 'clip.mp4', 'size': len(self.data),
+                  'sha256': hashlib.sha256(self.data).hexdigest(), **fields}
+        return self.client.post(reverse('upload_start'), params)
+
+    def _chunk(self, upload_id, offset, data, sha=None):
+        headers = {'Upload-Offset': str(offset)}
+        if sha:
+            headers['Upload-Chunk-Sha256'] = sha
+        return self.client.post(reverse('upload_chunk', args=[upload_id]), data,
+                                content_type='application/octet-stream', headers=headers)
+
+    def test_resumable_upload_creates_post(self):
+        upload_id = self._start().json()['upload_id']
+        first = self.data[:1024]
+        self.assertEqual(self._chunk(upload_id, 0, first, hashlib.sha256(first).hexdigest()).json()['offset'], 1024)
+        # A corrupted chunk is rejected without moving the offset
+        self.assertEqual(self._chunk(upload_id, 1024, self.data[1024:2048], 'ab' * 32).status_code, 400)
+        # Client "reconnects", asks where to resume, and finishes
+        offset = self.client.get(reverse('upload_chunk', args=[upload_id])).json()['offset']
+        self.assertEqual(offset, 1024)
+        stale = self._chunk(upload_id, 0, first)
+        self.assertEqual((stale.status_code, stale.json()['offset']), (409, 1024))
+        self._chunk(upload_id, 1024, self.data[1024:2048])
+        self._chunk(upload_id, 2048, self.data[2048:])
+        response = self.client.post(reverse('upload_complete', args=[upload_id]), {'caption': 'big #clip'})
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(pk=response.json()['post_id'])
+        self.assertEqual((post.media_type, post.caption), (Post.VIDEO, 'big #clip'))
+        with post.media.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(Profile.objects.get(user=self.user).post_count, 1)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+        # A double submit gets the first response back instead of a second post
+        again = self.client.post(reverse('upload_complete', args=[upload_id]), {'caption': 'big #clip'})
+        self.assertEqual((again.status_code, again.json()), (200, response.json()))
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_completion_in_progress_is_not_repeated(self):
+        upload_id = self._start().json()['upload_id']
+        for offset in range(0, len(self.data), 1024):
+            self._chunk(upload_id, offset, self.data[offset:offset + 1024])
+        session = UploadSession.objects.get()
+        self.assertTrue(uploads.claim(session))
+        response = self.client.post(reverse('upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Post.objects.exists())
+        # A failed completion releases the claim for a retry
+        uploads.release(session)
+        self.assertEqual(self.client.post(reverse('upload_complete', args=[upload_id])).status_code, 201)
+
+    def test_validation(self):
+        self.assertEqual(self._start(filename='notes.txt').status_code, 415)
+        with override_settings(UPLOAD_MAX_SIZE=100):
+            self.assertEqual(self._start().status_code, 413)
+        thread = MessageThread.objects.create()
+        thread.participants.add(self.other)
+        self.assertEqual(self._start(kind='message', thread_id=thread.id).status_code, 404)
+        upload_id = self._start().json()['upload_id']
+        self.assertEqual(self._chunk(upload_id, 0, self.data[:1025]).status_code, 413)
+        self.assertEqual(self.client.post(reverse('upload_complete', args=[upload_id])).status_code, 409)
+        # Content that is not what the extension claims never becomes a post
+        upload_id = self._start(filename='photo.jpg').json()['upload_id']
+        for offset in range(0, len(self.data), 1024):
+            self._chunk(upload_id, offset, self.data[offset:offset + 1024])
+        self.assertEqual(self.client.post(reverse('upload_complete', args=[upload_id])).status_code, 415)
+        self.assertFalse(Post.objects.exists())
+        # Sessions belong to their owner
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(reverse('upload_chunk', args=[upload_id])).status_code, 404)
+
+    def test_message_attachment_and_purge(self):
+        thread = MessageThread.objects.create()
+        thread.participants.add(self.user, self.other)
+        inbox.create_entries(thread, [self.user, self.other])
+        upload_id = self._start(kind='message', filename='notes.txt', thread_id=thread.id, sha256='').json()['upload_id']
+        for offset in range(0, len(self.data), 1024):
+            self._chunk(upload_id, offset, self.data[offset:offset + 1024])
+        data = self.client.post(reverse('upload_complete', args=[upload_id]), {'text': 'see attached'}).json()
+        self.assertTrue(data['attachment_url'])
+        self.assertEqual(InboxEntry.objects.get(user=self.other).unread_count, 1)
+        stale = uploads.start(self.user, 'post', 'a.jpg', 10)
+        UploadSession.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(uploads.purge_stale(), 1)
+        self.assertFalse(os.path.exists(uploads.part_path(stale)))
+
+
+@override_settings(MEDIA_GC_GRACE_SECONDS=0)
+class MediaBlobTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.force_login(self.user)
+
+    def _post(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_post'), {'caption': '', 'media': upload})
+        return Post.objects.latest('id')
+
+    def _delete(self, post):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('post_delete', args=[post.id]))
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self._post(jpeg_upload('a.jpg'))
+        second = self._post(jpeg_upload('b.JPG'))
+        self.assertEqual(first.media.name, second.media.name)
+        self.assertTrue(first.media.name.startswith('blobs/'))
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+        # the second post reused the first one's variants instead of re-rendering
+        self.assertEqual(second.variants, first.variants)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.media.path))), 2)  # blob + variants/
+
+    def test_last_reference_deletes_blob_and_variants(self):
+        first = self._post(jpeg_upload())
+        second = self._post(jpeg_upload())
+        thread = MessageThread.objects.create()
+        forwarded = Message.objects.create(thread=thread, sender=self.user, attachment=first.media.name)
+        path, variant = first.media.path, default_storage.path(first.variants['320'])
+        self.assertEqual(MediaBlob.objects.get().derived, sorted(first.variants.values()))
+        # Only recorded files go: not whatever else shares the blob's directory and name
+        stray = default_storage.save(os.path.splitext(first.variants['320'])[0] + '_edit.webp', ContentFile(b'x'))
+        self._delete(first)
+        self._delete(second)
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            forwarded.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(os.path.exists(path) or os.path.exists(variant))
+        self.assertTrue(default_storage.exists(stray))
+
+    def test_gc_media_repairs_counts_and_sweeps(self):
+        post = self._post(jpeg_upload())
+        MediaBlob.objects.update(ref_count=5)
+        self.assertEqual(blobs.reconcile(), 1)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        Post.objects.filter(pk=post.pk).update(media='posts/legacy.jpg')  # orphan the blob
+        call_command('gc_media', stdout=StringIO())
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_gc_media_sweeps_files_of_rolled_back_uploads(self):
+        kept = self._post(jpeg_upload())
+        with mock.patch.object(tags, 'index_post', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self._post(jpeg_upload(size=(300, 200)))
+        self.assertEqual(MediaBlob.objects.count(), 1)
+        blob_files = [os.path.join(root, f) for root, _, files in os.walk(default_storage.path('blobs')) for f in files]
+        self.assertEqual(len(blob_files), 2 + len(kept.variants))  # the rolled-back upload's file is left over
+        with override_settings(MEDIA_GC_GRACE_SECONDS=60):
+            self.assertEqual(blobs.sweep_orphans(), 0)  # too recent: its transaction may still commit
+        self.assertEqual(blobs.sweep_orphans(), 1)
+        self.assertTrue(os.path.exists(kept.media.path))
+        self.assertTrue(all(default_storage.exists(name) for name in kept.variants.values()))
+
+
+@override_settings(MEDIA_GC_GRACE_SECONDS=0)
+class StoryExpiryTests(CoreTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.viewer = User.objects.create_user(username='viewer', password='password')
+        self.client.force_login(self.user)
+
+    def _story(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_story'), {'media': jpeg_upload()})
+        story = Story.objects.latest('id')
+        viewers.record(self.viewer.id, [story.id])
+        Story.objects.filter(pk=story.pk).update(created_at=timezone.now() - timedelta(hours=25))
+        story.refresh_from_db()
+        return story
+
+    def test_archive_keeps_media_and_view_count(self):
+        story = self._story()
+        Story.objects.filter(pk=story.pk).update(preview='stories/old_preview.mp4')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expiry.expire_stories(mode='archive'), 1)
+        self.assertFalse(Story.objects.exists() or StoryView.objects.exists())
+        archived = ArchivedStory.objects.get()
+        self.assertEqual((archived.user, archived.media.name, archived.view_count), (self.user, story.media.name, 1))
+        self.assertEqual(archived.preview.name, 'stories/old_preview.mp4')
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(story.media.path))
+        with self.captureOnCommitCallbacks(execute=True):
+            archived.delete()
+        self.assertFalse(os.path.exists(story.media.path))
+
+    def test_scheduler_starts_with_first_request(self):
+        with mock.patch.object(expiry.scheduler, 'ensure_started') as ensure_started:
+            self.client.get(reverse('login'))
+        ensure_started.assert_called_once_with()
+
+    def test_delete_removes_media_and_variants(self):
+        story = self._story()
+        variant = default_storage.path(next(iter(story.variants.values())))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expiry.expire_stories(mode='delete'), 1)
+        self.assertFalse(ArchivedStory.objects.exists() or MediaBlob.objects.exists())
+        self.assertFalse(os.path.exists(story.media.path) or os.path.exists(variant))
+
+    def test_command_expires_in_batches_and_keeps_active_stories(self):
+        old = timezone.now() - timedelta(days=2)
+        for i in range(5):
+            story = Story.objects.create(user=self.user, media=f'stories/old{i}.jpg')
+            StoryView.objects.create(story=story, viewer=self.viewer)
+        Story.objects.update(created_at=old)
+        fresh = Story.objects.create(user=self.user, media='stories/new.jpg')
+        out = StringIO()
+        call_command('expire_stories', '--batch-size', '2', '--mode', 'delete', stdout=out)
+        self.assertIn('Expired 5 stories', out.getvalue())
+        self.assertEqual(list(Story.objects.all()), [fresh])
+        self.assertFalse(StoryView.objects.exists())
+
+
+class MediaServingTests(CoreTestCase):
+    def setUp(self):
+        self.data = bytes(range(256)) * 4
+        self.blob = content_storage().save('posts/clip.mp4', ContentFile(self.data))
+        self.addCleanup(content_storage().delete, self.blob)
+        self.url = default_storage.url(self.blob)
+
+    def _get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_blob_is_immutable_and_revalidates(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.data).hexdigest()}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual((response['Content-Type'], response['Accept-Ranges']), ('video/mp4', 'bytes'))
+        self.assertEqual(self._get(If_None_Match=response['ETag']).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self._get(Range='bytes=2-5')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 2-5/1024'))
+        self.assertEqual((b''.join(response.streaming_content), response['Content-Length']), (self.data[2:6], '4'))
+        self.assertEqual(b''.join(self._get(Range='bytes=-3').streaming_content), self.data[-3:])
+        self.assertEqual(b''.join(self._get(Range='bytes=1000-').streaming_content), self.data[1000:])
+        self.assertEqual(self._get(Range='bytes=2000-').status_code, 416)
+        # a stale If-Range gets the whole (changed) file instead of a splice
+        self.assertEqual(self._get(Range='bytes=2-5', If_Range='"old"').status_code, 200)
+
+    def test_other_media_hash_etag_and_sendfile_modes(self):
+        name = default_storage.save('avatars/me.png', ContentFile(b'avatar'))
+        self.addCleanup(default_storage.delete, name)
+        response = self._get(default_storage.url(name))
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(b"avatar").hexdigest()}"')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self._get(Range='bytes=0-1')
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.blob}')
+        self.assertEqual(self._get('/media/../manage.py').status_code, 404)
+
+    def test_only_images_and_video_are_inline(self):
+        self.assertFalse(self._get().get('Content-Disposition', '').startswith('attachment'))
+        for filename, content_type in [
+            ('page.html', 'text/html'), ('logo.svg', 'image/svg+xml'), ('notes.txt.gz', 'application/gzip'),
+        ]:
+            name = content_storage().save(f'messages/{filename}', ContentFile(filename.encode()))
+            self.addCleanup(content_storage().delete, name)
+            response = self._get(default_storage.url(name))
+            self.assertEqual(response['Content-Type'], content_type)
+            self.assertTrue(response['Content-Disposition'].startswith('attachment;'))
+            self.assertNotIn('Content-Encoding', response)
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            self.assertTrue(self._get(default_storage.url(name))['Content-Disposition'].startswith('attachment;'))
+
+
+class QueryBudgetTests(QueryBudgetAssertions, CoreTestCase):
+    """Page views run a fixed number of queries however many rows they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='password')
+        for i in range(12):
+            other = User.objects.create_user(username=f'friend{i}', password='password')
+            Follow.objects.create(follower=cls.user, following=other)
+            post = Post.objects.create(author=other, media=f'posts/{i}.jpg', caption=f'#tag{i} hi @testuser')
+            feed.fan_out_post(post)
+            Post.objects.create(author=cls.user, media=f'posts/own{i}.jpg')
+            Comment.objects.create(post=post, author=other, text='nice')
+            Like.objects.create(post=post, user=cls.user)
+            Story.objects.create(user=other, media=f'stories/{i}.jpg')
+            Notification.objects.create(user=cls.user, actor=other, verb=Notification.LIKE, post=post, text='like')
+            thread, _ = chat.get_or_create_direct_thread(cls.user, other)
+            inbox.record_message(Message.objects.create(thread=thread, sender=other, text='hey'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_page_query_budgets(self):
+        for name, args, budget in (
+            ('home', [], 10),
+            ('profile', [self.user.username], 6),
+            ('notifications', [], 3),
+            ('messages', [], 8),
+        ):
+            with self.subTest(view=name), self.assertMaxQueries(budget):
+                self.assertEqual(self.client.get(reverse(name, args=args)).status_code, 200)
+
+    @override_settings(QUERY_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('notifications'))
+        self.assertRegex(response['Server-Timing'], r'^db;desc="3 queries";dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(QUERY_BUDGETS={'notifications': 1})
+    def test_over_budget_and_repeated_queries_are_logged(self):
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            self.client.get(reverse('notifications'))
+        self.assertIn('GET /notifications/ ran 3 queries', logs.output[0])
+        with self.assertRaisesRegex(AssertionError, '13 queries executed, at most 2'):
+            with self.assertMaxQueries(2):
+                for post in Post.objects.filter(author=self.user):
+                    post.author.username
+
+
+class SyntheticBenchmarkTests(CoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.counts = synthetic.generate(users=40, seed=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_generated_graph_is_consistent(self):
+        self.assertEqual(User.objects.count(), 40)
+        # bulk inserts kept the generated timestamps rather than "now"
+        self.assertTrue(Post.objects.filter(created_at__lt=timezone.now() - timedelta(days=1)).exists())
+        self.assertFalse(Follow.objects.filter(created_at__gt=timezone.now() - timedelta(minutes=5)).exists())
+        self.assertEqual(Profile.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), self.counts['Post'])
+        # bulk inserts were followed by a full rebuild of the derived data
+        self.assertFalse(any(reconcile_counters().values()))
+        self.assertEqual(blobs.reconcile(), 0)
+        self.assertTrue(search.search_users(User.objects.first().username))
+        self.assertFalse(InboxEntry.objects.filter(last_activity__isnull=True).exists())
+        degrees = sorted(Profile.objects.values_list('follower_count', flat=True), reverse=True)
+        self.assertGreater(degrees[0], 4 * degrees[len(degrees) // 2])  # a few accounts dominate
+
+    def test_run_reports_latency_and_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            results = benchmarks.run(['home', 'like', 'chat'], iterations=3, clients=2)
+        self.assertEqual(results['home']['requests'], 3)
+        self.assertEqual(results['home']['errors'], 0)
+        self.assertGreater(results['like']['queries_per_request'], 0)
+        self.assertNotIn('queries_per_request', results['chat'])
+        self.assertLessEqual(results['chat']['p50_ms'], results['chat']['p99_ms'])
+
+    def test_percentile_and_compare(self):
+        self.assertEqual(benchmarks.percentile(range(1, 101), 99), 99)
+        self.assertEqual(benchmarks.percentile([5], 50), 5)
+        base = {'home': {'p99_ms': 10.0, 'queries_per_request': 8, 'errors': 0}}
+        self.assertEqual(benchmarks.compare(base, {'home': {'p99_ms': 12.0, 'queries_per_request': 8, 'errors': 0}}), [])
+        regressions = benchmarks.compare(base, {'home': {'p99_ms': 20.0, 'queries_per_request': 9, 'errors': 1}})
+        self.assertEqual(len(regressions), 3)
+
+
+class DatabaseConfigTests(CoreTestCase):
+    def test_sqlite_connections_get_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            pragmas = {name: cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in ('synchronous', 'busy_timeout')}
+        self.assertEqual(pragmas, {'synchronous': 1, 'busy_timeout': settings.SQLITE_PRAGMAS['busy_timeout']})  # 1 = NORMAL
+        self.assertEqual(connection.settings_dict['OPTIONS']['transaction_mode'], 'IMMEDIATE')
@@ -0,0 +1,198 @@
+"""Chunked, resumable media uploads.
+
+A client opens a session (`start`) with the file's name, size and
+optionally its SHA-256, then appends chunks at the current offset
+(`append`, each optionally with its own SHA-256). Chunks are streamed from
+the request straight into a temporary file, so neither the chunk nor the
+file is ever held in memory, and a dropped connection only loses the chunk
+in flight: the client asks for `received` and carries on. `finish` checks
+the length, hash and content type before handing back a `File` for the
+final Post/Story/Message. The completing request `claim`s the session
+first, so a double submit publishes once and gets the first response back.
+"""
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from . import chat
+from .models import VIDEO_EXTENSIONS, UploadSession
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev servers only
+    fcntl = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+
+
+def chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+
+
+def upload_dir():
+    path = getattr(settings, 'UPLOAD_TEMP_DIR', None) or os.path.join(tempfile.gettempdir(), 'insta-uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def part_path(session):
+    return os.path.join(upload_dir(), f'{session.id}.part')
+
+
+def _media_kind(data):
+    """'image', 'video' or None, from a file's leading bytes."""
+    if data.startswith((b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')):
+        return 'image'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image'
+    if data[4:8] == b'ftyp' or data.startswith(b'\x1a\x45\xdf\xa3'):  # MP4/MOV, WebM
+        return 'video'
+    return None
+
+
+def start(user, kind, filename, size, sha256='', thread_id=None):
+    """Open an upload session after checking the declared size and type."""
+    if kind not in dict(UploadSession.KIND_CHOICES):
+        raise UploadError('invalid kind')
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('missing filename')
+    if size <= 0 or size > max_size():
+        raise UploadError(f'size must be between 1 and {max_size()} bytes', status=413)
+    if sha256 and (len(sha256) != 64 or not all(c in '0123456789abcdef' for c in sha256.lower())):
+        raise UploadError('sha256 must be 64 hex digits')
+    if kind == UploadSession.MESSAGE:
+        if not thread_id or not chat.is_participant(thread_id, user.id):
+            raise UploadError('invalid thread', status=404)
+    elif not filename.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+        raise UploadError('unsupported file type', status=415)
+    session = UploadSession.objects.create(
+        user=user, kind=kind, thread_id=thread_id if kind == UploadSession.MESSAGE else None,
+        filename=filename, size=size, sha256=sha256.lower(),
+    )
+    open(part_path(session), 'wb').close()
+    return session
+
+
+@contextmanager
+def _locked(path):
+    with open(path, 'r+b') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append(session, offset, stream, sha256=''):
+    """Stream one chunk from `stream` into the session at `offset`; return the new `received`."""
+    try:
+        with _locked(part_path(session)) as f:
+            return _write_chunk(session, f, offset, stream, sha256)
+    except FileNotFoundError:
+        raise UploadError('upload expired', status=410)
+
+
+def _write_chunk(session, f, offset, stream, sha256):
+    # Under the file lock, so concurrent retries of a chunk serialize
+    session.refresh_from_db(fields=['received'])
+    if offset != session.received:
+        raise UploadError(f'expected offset {session.received}', status=409)
+    f.seek(offset)
+    f.truncate()  # drop any tail a failed request left behind
+    digest, written, limit = hashlib.sha256(), 0, min(chunk_size(), session.size - offset)
+    for buf in iter(lambda: stream.read(READ_SIZE), b''):
+        written += len(buf)
+        if written > limit:
+            f.truncate(offset)
+            raise UploadError(f'chunk larger than {limit} bytes', status=413)
+        digest.update(buf)
+        f.write(buf)
+    if sha256 and digest.hexdigest() != sha256.lower():
+        f.truncate(offset)
+        raise UploadError('chunk sha256 mismatch')
+    f.flush()
+    session.received = offset + written
+    session.save(update_fields=['received', 'updated_at'])
+    return session.received
+
+
+def finish(session):
+    """Validate a fully received upload and return it as an open `File` (caller closes and `discard`s)."""
+    if session.received != session.size:
+        raise UploadError(f'incomplete: {session.received} of {session.size} bytes', status=409)
+    path = part_path(session)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        head = f.read(READ_SIZE)
+        digest.update(head)
+        for buf in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(buf)
+    if session.sha256 and digest.hexdigest() != session.sha256:
+        raise UploadError('sha256 mismatch')
+    if session.kind != UploadSession.MESSAGE:
+        expected = 'video' if session.filename.lower().endswith(VIDEO_EXTENSIONS) else 'image'
+        if _media_kind(head) != expected:
+            raise UploadError('file content does not match its type', status=415)
+    return File(open(path, 'rb'), name=session.filename)
+
+
+def claim(session):
+    """Mark `session` as being completed; False if another request got there first."""
+    now = timezone.now()
+    if not UploadSession.objects.filter(pk=session.pk, completed_at=None).update(completed_at=now):
+        return False
+    session.completed_at = now
+    return True
+
+
+def release(session):
+    """Undo `claim` after a failed completion, so the client can retry it."""
+    UploadSession.objects.filter(pk=session.pk).update(completed_at=None)
+    session.completed_at = None
+
+
+def complete(session, result):
+    """Drop the received bytes and keep `result` for repeated completions (until `purge_stale`)."""
+    _remove_part(session)
+    session.result = result
+    session.save(update_fields=['result', 'updated_at'])
+
+
+def _remove_part(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def discard(session):
+    _remove_part(session)
+    session.delete()
+
+
+def purge_stale(max_age=timedelta(hours=24)):
+    """Drop sessions idle longer than `max_age`; return how many were removed."""
+    stale = list(UploadSession.objects.filter(updated_at__lt=timezone.now() - max_age))
+    for session in stale:
+        discard(session)
+    return len(stale)
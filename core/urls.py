@@ -15,9 +15,11 @@ urlpatterns = [
     path('search/', login_required(views.search_view), name='search'),
     path('explore/', login_required(views.explore_view), name='explore'),
     path('reels/', login_required(views.reels_view), name='reels'),
+    path('tags/<str:tag>/', login_required(views.tag_view), name='tag'),
 
     path('messages/', login_required(views.messages_view), name='messages'),
     path('messages/start/<str:username>/', login_required(views.start_thread_view), name='start_thread'),
+    path('messages/<int:thread_id>/history/', login_required(views.message_history_view), name='message_history'),
 
     path('notifications/', login_required(views.notifications_view), name='notifications'),
 
@@ -30,10 +32,16 @@ urlpatterns = [
     # Stories
     path('stories/add/', login_required(views.add_story_view), name='add_story'),
     path('stories/mark_viewed/', login_required(views.mark_story_viewed), name='mark_story_viewed'),
+    path('api/stories/<int:story_id>/viewers/', login_required(views.story_viewers_view), name='story_viewers'),
     path('messages/upload/', login_required(views.message_upload_view), name='message_upload'),
+    path('api/uploads/', login_required(views.upload_start_view), name='upload_start'),
+    path('api/uploads/<uuid:upload_id>/', login_required(views.upload_chunk_view), name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/complete/', login_required(views.upload_complete_view), name='upload_complete'),
 
     # AJAX endpoints (protected)
     path('api/like/<int:post_id>/', login_required(views.like_toggle_view), name='like_toggle'),
     path('api/comment/<int:post_id>/', login_required(views.comment_create_view), name='comment_create'),
     path('api/follow/<str:username>/', login_required(views.follow_toggle_view), name='follow_toggle'),
+    path('api/explore/', login_required(views.explore_api_view), name='explore_api'),
+    path('api/search/users/', login_required(views.user_typeahead_view), name='user_typeahead'),
 ]
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""Poster frames and short previews for video posts and stories.
+
+After a video upload commits, `schedule` queues it on a small thread pool
+(`VIDEO_WORKERS`; the work happens in ffmpeg subprocesses) that extracts a
+JPEG poster frame and a few seconds of muted, low-bitrate H.264 next to the
+original. Templates show the poster with `preload="none"` so grids never
+fetch video bytes until played. Without ffmpeg (`FFMPEG_BINARY` or on PATH)
+nothing is generated and templates fall back to the original file.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from . import blobs
+
+logger = logging.getLogger(__name__)
+
+POSTER_WIDTH = 720
+PREVIEW_WIDTH = 480
+PREVIEW_SECONDS = 3
+FFMPEG_TIMEOUT = 120
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def ffmpeg_binary():
+    return getattr(settings, 'FFMPEG_BINARY', None) or shutil.which('ffmpeg')
+
+
+def schedule(instance):
+    """Generate a poster and preview for `instance` once the current transaction commits."""
+    if not instance.is_video:
+        return
+    if not ffmpeg_binary():
+        logger.debug('ffmpeg not found; serving %s without a poster', instance.media.name)
+        return
+    model, name = type(instance), instance.media.name
+    transaction.on_commit(lambda: _submit(model, instance.pk, name))
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'VIDEO_WORKERS', 2), thread_name_prefix='videos',
+            )
+        return _executor
+
+
+def _submit(model, pk, name):
+    if getattr(settings, 'VIDEO_PROCESSING', 'background') == 'inline':
+        process(model, pk, name)
+    else:
+        _executor_instance().submit(_process_in_worker, model, pk, name)
+
+
+def _process_in_worker(model, pk, name):
+    close_old_connections()
+    try:
+        process(model, pk, name)
+    except Exception:
+        logger.exception('Video processing failed for %s', name)
+    finally:
+        close_old_connections()
+
+
+def _ffmpeg(*args):
+    try:
+        subprocess.run(
+            [ffmpeg_binary(), '-y', '-loglevel', 'error', *args],
+            check=True, capture_output=True, timeout=FFMPEG_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError) as exc:
+        logger.warning('ffmpeg failed: %s', getattr(exc, 'stderr', b'') or exc)
+        return False
+    return True
+
+
+def render(source, workdir):
+    """Write poster.jpg and preview.mp4 for `source` into `workdir`; return their paths (None if failed)."""
+    poster = os.path.join(workdir, 'poster.jpg')
+    preview = os.path.join(workdir, 'preview.mp4')
+    scale_poster = f'scale=min({POSTER_WIDTH}\\,iw):-2'
+    # One second in skips fade-ins; clips shorter than that use the first frame.
+    if not (_ffmpeg('-ss', '1', '-i', source, '-frames:v', '1', '-vf', scale_poster, poster)
+            and os.path.exists(poster)):
+        _ffmpeg('-i', source, '-frames:v', '1', '-vf', scale_poster, poster)
+    _ffmpeg(
+        '-i', source, '-t', str(PREVIEW_SECONDS), '-an',
+        '-vf', f'scale=min({PREVIEW_WIDTH}\\,iw):-2',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '32', '-movflags', '+faststart',
+        preview,
+    )
+    return (poster if os.path.exists(poster) else None), (preview if os.path.exists(preview) else None)
+
+
+def process(model, pk, name):
+    """Render and store the derived files for one upload; return the saved names."""
+    # Another row with the same content-addressed file already has them
+    done = model.objects.filter(media=name).exclude(poster='').values('poster', 'preview').first()
+    if done:
+        model.objects.filter(pk=pk, media=name).update(**done)
+        return done
+    stem, _ = os.path.splitext(name)
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            source = default_storage.path(name)
+        except NotImplementedError:
+            # Remote storage: ffmpeg needs a local file
+            source = os.path.join(workdir, 'source' + os.path.splitext(name)[1])
+            with default_storage.open(name, 'rb') as src, open(source, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        updates = {}
+        for field, path in zip(('poster', 'preview'), render(source, workdir)):
+            if path:
+                with open(path, 'rb') as f:
+                    updates[field] = default_storage.save(f'{stem}_{field}{os.path.splitext(path)[1]}', File(f))
+    # Only if the upload was not replaced or deleted meanwhile.
+    if updates and not model.objects.filter(pk=pk, media=name).update(**updates):
+        for saved in updates.values():
+            default_storage.delete(saved)
+    else:
+        blobs.record_derived(name, list(updates.values()))
+    return updates
@@ -0,0 +1,149 @@
+"""Buffered story view recording and the owner's "seen by" list.
+
+Opening stories is the busiest write in the app, so `record` only adds
+(story, viewer) pairs to an in-process set -- duplicates collapse for free
+-- and a daemon thread flushes it every `STORY_VIEW_FLUSH_SECONDS`, or as
+soon as `STORY_VIEW_BUFFER_SIZE` pairs are waiting. A flush drops expired,
+deleted and own stories and deleted viewers, inserts the rest with one
+`bulk_create(ignore_conflicts=True)` and bumps `Story.view_count` with one
+UPDATE per distinct increment. Two processes flushing the same new view at
+once can over-count by one; `reconcile_counters` repairs that.
+
+With `STORY_VIEW_RECORDING = 'inline'` (the test suite) views are written
+inside the request.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import stories
+from .counters import adjust
+from .feed import keyset_page
+from .models import Story, StoryView
+
+logger = logging.getLogger(__name__)
+
+VIEWERS_PAGE_SIZE = 50
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def buffer_size():
+    return getattr(settings, 'STORY_VIEW_BUFFER_SIZE', 500)
+
+
+def record(viewer_id, story_ids):
+    """Note that `viewer_id` has seen `story_ids`; written on the next flush."""
+    pairs = {(story_id, viewer_id) for story_id in story_ids}
+    if getattr(settings, 'STORY_VIEW_RECORDING', 'buffered') == 'inline':
+        write(pairs)
+        return
+    with _pending_lock:
+        _pending.update(pairs)
+        full = len(_pending) >= buffer_size()
+    flusher.wake(now=full)
+
+
+def flush():
+    """Write every buffered view; return how many were new."""
+    global _pending
+    with _pending_lock:
+        batch, _pending = _pending, set()
+    try:
+        return write(batch)
+    except IntegrityError:
+        # A story or viewer deleted since write() checked; retrying cannot succeed
+        logger.warning('Dropped %d story views that no longer fit their rows', len(batch), exc_info=True)
+        return 0
+    except Exception:
+        with _pending_lock:
+            _pending |= batch
+        raise
+
+
+def write(pairs):
+    """Persist (story_id, viewer_id) pairs; return how many views were new."""
+    if not pairs:
+        return 0
+    owners = dict(
+        Story.objects.filter(
+            pk__in={story_id for story_id, _ in pairs},
+            created_at__gte=timezone.now() - stories.STORY_TTL,
+        ).values_list('pk', 'user_id')
+    )
+    viewers = set(User.objects.filter(pk__in={v for _, v in pairs}).values_list('pk', flat=True))
+    pairs = {(s, v) for s, v in pairs if s in owners and v in viewers and owners[s] != v}
+    if not pairs:
+        return 0
+    existing = set(
+        StoryView.objects.filter(
+            story_id__in={s for s, _ in pairs}, viewer_id__in={v for _, v in pairs},
+        ).values_list('story_id', 'viewer_id')
+    )
+    new = pairs - existing
+    if not new:
+        return 0
+    by_increment = defaultdict(list)
+    for story_id, n in Counter(s for s, _ in new).items():
+        by_increment[n].append(story_id)
+    with transaction.atomic():
+        StoryView.objects.bulk_create(
+            [StoryView(story_id=s, viewer_id=v) for s, v in new], ignore_conflicts=True,
+        )
+        for n, story_ids in by_increment.items():
+            adjust(Story.objects.filter(pk__in=story_ids), view_count=n)
+    stories.invalidate_trays({v for _, v in new})
+    return len(new)
+
+
+def viewers_page(story, cursor=None, page_size=None):
+    """Newest-first page of `story`'s StoryView rows (with viewer profiles) and the next cursor."""
+    queryset = StoryView.objects.filter(story=story).select_related('viewer__profile')
+    return keyset_page(queryset, cursor, page_size or VIEWERS_PAGE_SIZE, field='viewed_at')
+
+
+class ViewFlusher:
+    """Daemon thread that flushes the view buffer periodically, or early when woken."""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self, now=False):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='story-views', daemon=True)
+                self._thread.start()
+        if now:
+            self._wakeup.set()
+
+    def _run(self):
+        interval = getattr(settings, 'STORY_VIEW_FLUSH_SECONDS', 2)
+        while True:
+            self._wakeup.wait(timeout=interval)
+            self._wakeup.clear()
+            try:
+                flush()
+            except Exception:
+                logger.exception('Flushing story views failed; will retry')
+            finally:
+                close_old_connections()
+
+
+flusher = ViewFlusher()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not flush story views at exit')
@@ -2,39 +2,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from .forms import SignUpForm, LoginForm, PostForm, CommentForm, StoryForm, ProfileForm
 from .models import (
     Post, Profile, Notification, MessageThread, Message,
-    Like, Comment, Follow, Story
+    Like, Comment, Follow, Story, UploadSession,
 )
-from .models import StoryView
+from . import chat, explore, feed, images, inbox, search, stories, tags, uploads, videos, viewers
+from .counters import adjust
+from .notifications import push_notification, retract
 
 from django.contrib import messages as dj_messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import transaction
 from django.http import JsonResponse, HttpResponseForbidden
 from django.urls import reverse
-from django.utils import timezone
-from datetime import timedelta
 
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 
-
-def push_notification(user, text, title='Activity'):
-    n = Notification.objects.create(user=user, text=text)
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'notif_{user.id}',
-        {
-            'type': 'notif.message',
-            'title': title,
-            'text': text,
-            'created_at': n.created_at.isoformat(),
-        }
-    )
-
-
 def signup_view(request):
     if request.user.is_authenticated:
         return redirect('home')
@@ -70,36 +55,16 @@ def logout_view(request):
 
 @login_required
 def home_view(request):
-    posts = (
-        Post.objects.select_related('author')
-        .prefetch_related('comments__author', 'likes__user')
-        .order_by('-created_at')
-    )
-    # Active stories in last 24h
-    recent_stories = Story.objects.filter(created_at__gte=timezone.now() - timedelta(hours=24)).select_related('user').order_by('-created_at')
-    # Build per-user story summary with viewed/unviewed status
-    story_by_user = {}
-    for s in recent_stories:
-        if s.user_id not in story_by_user:
-            story_by_user[s.user_id] = {'user': s.user, 'story': s}
-    story_users = []
-    for info in story_by_user.values():
-        u = info['user']
-        s = info['story']
-        Profile.objects.get_or_create(user=u)
-        # Determine if there exists at least one story for that user the current viewer hasn't seen
-        user_stories = recent_stories.filter(user=u)
-        has_unviewed = False
-        for us in user_stories:
-            if not StoryView.objects.filter(story=us, viewer=request.user).exists():
-                has_unviewed = True
-                break
-        story_users.append({'user': u, 'story': s, 'unviewed': has_unviewed})
+    # One page of the viewer's timeline (followed authors + self), keyset-paginated
+    posts, next_cursor = feed.get_feed_page(request.user, request.GET.get('cursor'))
+    # Per-author story rings with viewed/unviewed status (cached per viewer)
+    story_users = stories.get_story_tray(request.user)
     # Precompute which users the current user is following for template checks
     following_ids = list(Follow.objects.filter(follower=request.user).values_list('following_id', flat=True))
 
     return render(request, 'core/home.html', {
         'posts': posts,
+        'next_cursor': next_cursor,
         'comment_form': CommentForm(),
         'stories': story_users,
         'following_ids': following_ids,
@@ -111,84 +76,206 @@ def search_view(request):
     q = request.GET.get('q', '').strip()
     users = None  # initial state: do not show "No users found"
     if q:
-        users = User.objects.filter(
-            Q(username__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q)
-        ).select_related('profile')[:50]
+        users = search.search_users(q)
     return render(request, 'core/search.html', {'q': q, 'users': users})
 
 
+TYPEAHEAD_LIMIT = 10
+
+
+@login_required
+def user_typeahead_view(request):
+    """JSON user suggestions for the search box (`q` is matched by prefix)."""
+    users = search.search_users(request.GET.get('q', '').strip(), limit=TYPEAHEAD_LIMIT)
+    return JsonResponse({
+        'users': [{
+            'username': u.username,
+            'full_name': u.get_full_name(),
+            'avatar_url': u.profile.avatar_url,
+        } for u in users],
+    })
+
+
 @login_required
 def explore_view(request):
-    posts = Post.objects.select_related('author').order_by('-created_at')
-    return render(request, 'core/explore.html', {'posts': posts})
+    mode, posts, next_cursor = explore.explore_page(request.GET.get('mode', 'recent'), request.GET.get('cursor'))
+    return render(request, 'core/explore.html', {'posts': posts, 'mode': mode, 'next_cursor': next_cursor})
+
+
+# Grid tiles are at most ~300 CSS px wide; 640 covers 2x displays.
+GRID_THUMB_WIDTH = 640
+
+
+@login_required
+def explore_api_view(request):
+    """JSON page of explore tiles for infinite scroll (`mode`, `cursor` as in explore_view)."""
+    mode, posts, next_cursor = explore.explore_page(request.GET.get('mode', 'recent'), request.GET.get('cursor'))
+    return JsonResponse({
+        'mode': mode,
+        'next_cursor': next_cursor,
+        'posts': [{
+            'id': p.id,
+            'author': p.author.username,
+            'caption': p.caption,
+            'media_url': p.media.url,
+            'thumb_url': images.variant_url(p.variants, GRID_THUMB_WIDTH, p.media.url),
+            'poster_url': p.poster.url if p.poster else None,
+            'preview_url': p.preview.url if p.preview else None,
+            'is_video': p.is_video,
+        } for p in posts],
+    })
+
+
+@login_required
+def tag_view(request, tag):
+    posts, next_cursor = tags.tag_page(tag, request.GET.get('cursor'))
+    return render(request, 'core/tag.html', {'tag': tag.lower(), 'posts': posts, 'next_cursor': next_cursor})
+
+
+REELS_PAGE_SIZE = 12
 
 
 @login_required
 def reels_view(request):
-    # Only videos, newest first
-    videos = [p for p in Post.objects.order_by('-created_at') if p.is_video]
-    return render(request, 'core/reels.html', {'videos': videos})
+    # Only videos, newest first, one (media_type, created_at) index range per page
+    reels, next_cursor = feed.keyset_page(
+        Post.objects.filter(media_type=Post.VIDEO).select_related('author'),
+        request.GET.get('cursor'), REELS_PAGE_SIZE,
+    )
+    return render(request, 'core/reels.html', {'reels': reels, 'next_cursor': next_cursor})
+
+
+MESSAGE_PAGE_SIZE = 50
+
+
+def _message_page(thread, before=None, size=MESSAGE_PAGE_SIZE):
+    """Return (messages oldest-first, has_older) for the newest `size` messages before id `before`.
+
+    Ordered by id, the same key the `before` cursor compares, so pages never
+    skip or repeat messages whose timestamps are out of id order.
+    """
+    qs = thread.messages.select_related('sender__profile').order_by('-id')
+    if before is not None:
+        qs = qs.filter(id__lt=before)
+    page = list(qs[:size + 1])
+    return page[:size][::-1], len(page) > size
 
 
 @login_required
 def messages_view(request):
     q = request.GET.get('q', '').strip()
-    threads = MessageThread.objects.filter(participants=request.user).prefetch_related('participants').order_by('-created_at')
+    # Inbox rows carry the partner, preview and unread badge; newest activity first
+    threads = list(
+        request.user.inbox.select_related('thread', 'partner__profile')
+        .order_by('-last_activity')
+    )
     results = None
     if q:
-        results = User.objects.filter(username__icontains=q).exclude(id=request.user.id).select_related('profile')[:50]
+        results = search.search_users(q, exclude_id=request.user.id)
     # When searching, hide previous chats and show results only (handled in template)
     thread_id = request.GET.get('t')
     selected_thread = None
     msgs = []
+    has_older = False
     if not q:  # only resolve threads/messages when not searching
         if thread_id:
             selected_thread = get_object_or_404(MessageThread, id=thread_id)
-            if not selected_thread.participants.filter(id=request.user.id).exists():
+            if not chat.is_participant(selected_thread.id, request.user.id):
                 return HttpResponseForbidden("Not allowed")
-            msgs = selected_thread.messages.select_related('sender').order_by('created_at')
-        elif threads.exists():
-            selected_thread = threads.first()
-            msgs = selected_thread.messages.select_related('sender').order_by('created_at')
+        else:
+            selected_thread = threads[0].thread if threads else None
+        if selected_thread:
+            msgs, has_older = _message_page(selected_thread)
+            inbox.mark_read(request.user, selected_thread)
+            for entry in threads:  # already loaded: clear the badge in place
+                if entry.thread_id == selected_thread.id:
+                    entry.unread_count = 0
 
     # compute chat partner for header display
     chat_partner = None
     if selected_thread:
-        other = selected_thread.participants.exclude(id=request.user.id).first()
-        chat_partner = other
+        others = chat.participant_ids(selected_thread.id) - {request.user.id}
+        chat_partner = User.objects.select_related('profile').filter(id__in=others).first() if others else None
 
     return render(request, 'core/messages.html', {
         'threads': threads,
         'selected_thread': selected_thread,
         'chat_messages': msgs,
+        'has_older': has_older,
         'q': q,
         'results': results,
         'chat_partner': chat_partner,
     })
 
 
+@login_required
+def message_history_view(request, thread_id):
+    """JSON page of messages older than `?before=<message id>` for scroll-back."""
+    thread = get_object_or_404(MessageThread, id=thread_id)
+    if not chat.is_participant(thread.id, request.user.id):
+        return HttpResponseForbidden('Not allowed')
+    try:
+        before = int(request.GET['before'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'missing before'}, status=400)
+    msgs, has_older = _message_page(thread, before=before)
+    return JsonResponse({
+        'messages': [{
+            'id': m.id,
+            'sender': m.sender.username,
+            'avatar_url': m.sender.profile.avatar_url if hasattr(m.sender, 'profile') else None,
+            'text': m.text,
+            'created_at': m.created_at.isoformat(),
+            'attachment_url': m.attachment.url if m.attachment else None,
+        } for m in msgs],
+        'has_older': has_older,
+    })
+
+
+# Stories the tray can report in one request
+STORY_VIEW_BATCH_LIMIT = 100
+
+
 @login_required
 def mark_story_viewed(request):
-    """AJAX endpoint to mark a story viewed by the current user.
+    """AJAX endpoint to mark stories viewed by the current user.
 
-    Expects POST with 'story_id'. Returns JSON {ok: true}.
+    Expects POST with one or more 'story_id' values (or comma-separated
+    'story_ids'). Views are buffered and written in batches (core.viewers),
+    so this touches no tables. Returns JSON {ok: true}.
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
-    story_id = request.POST.get('story_id') or request.POST.get('id')
-    if not story_id:
+    raw = request.POST.getlist('story_id') or request.POST.getlist('id')
+    raw += [part for part in request.POST.get('story_ids', '').split(',') if part]
+    if not raw:
         return JsonResponse({'error': 'missing story_id'}, status=400)
     try:
-        s = Story.objects.get(id=int(story_id))
-    except (Story.DoesNotExist, ValueError):
-        return JsonResponse({'error': 'invalid story'}, status=404)
-    # create view record if not exists
-    StoryView.objects.get_or_create(story=s, viewer=request.user)
+        story_ids = {int(story_id) for story_id in raw}
+    except ValueError:
+        return JsonResponse({'error': 'invalid story'}, status=400)
+    if len(story_ids) > STORY_VIEW_BATCH_LIMIT:
+        return JsonResponse({'error': f'at most {STORY_VIEW_BATCH_LIMIT} stories per request'}, status=400)
+    viewers.record(request.user.id, story_ids)
     return JsonResponse({'ok': True})
 
 
+@login_required
+def story_viewers_view(request, story_id):
+    """JSON "seen by" list for one of the current user's stories, newest first (`cursor` pages)."""
+    story = get_object_or_404(Story, id=story_id, user=request.user)
+    rows, next_cursor = viewers.viewers_page(story, request.GET.get('cursor'))
+    return JsonResponse({
+        'count': story.view_count,
+        'viewers': [{
+            'username': row.viewer.username,
+            'avatar_url': row.viewer.profile.avatar_url,
+            'viewed_at': row.viewed_at.isoformat(),
+        } for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
 @login_required
 def message_upload_view(request):
     """Handle file uploads for a thread. Creates Message with attachment and broadcasts it."""
@@ -200,34 +287,44 @@ def message_upload_view(request):
     if not thread_id:
         return JsonResponse({'error': 'missing thread_id'}, status=400)
     try:
-        thread = MessageThread.objects.get(id=int(thread_id))
-    except (MessageThread.DoesNotExist, ValueError):
+        thread_id = int(thread_id)
+    except ValueError:
         return JsonResponse({'error': 'invalid thread'}, status=404)
-    if not thread.participants.filter(id=request.user.id).exists():
+    members = chat.participant_ids(thread_id)
+    if not members:
+        return JsonResponse({'error': 'invalid thread'}, status=404)
+    if request.user.id not in members:
         return HttpResponseForbidden('Not allowed')
 
-    m = Message.objects.create(thread=thread, sender=request.user, text=text or '', attachment=file if file else None)
+    return JsonResponse(_publish_message(request.user, thread_id, text, file))
+
+
+def _publish_message(sender, thread_id, text, file=None):
+    """Save a message (with optional attachment), update inboxes and broadcast it; return its JSON."""
+    with transaction.atomic():
+        m = Message.objects.create(thread_id=thread_id, sender=sender, text=text or '', attachment=file if file else None)
+        inbox.record_message(m)
 
     # broadcast to channel layer so WS clients get the new message
     channel_layer = get_channel_layer()
     payload = {
         'type': 'chat.message',
         'message_id': m.id,
-        'sender': m.sender.username,
+        'sender': sender.username,
         'text': m.text,
         'created_at': m.created_at.isoformat(),
     }
     if m.attachment:
         payload['attachment_url'] = m.attachment.url
-    async_to_sync(channel_layer.group_send)(f'chat_{thread.id}', payload)
+    async_to_sync(channel_layer.group_send)(f'chat_{thread_id}', payload)
 
-    return JsonResponse({
+    return {
         'id': m.id,
-        'sender': m.sender.username,
+        'sender': sender.username,
         'text': m.text,
         'created_at': m.created_at.isoformat(),
         'attachment_url': m.attachment.url if m.attachment else None,
-    })
+    }
 
 
 @login_required
@@ -236,35 +333,18 @@ def start_thread_view(request, username):
     if other == request.user:
         dj_messages.info(request, "You can't start a thread with yourself.")
         return redirect('messages')
-    thread = (
-        MessageThread.objects.filter(participants=request.user)
-        .filter(participants=other).first()
-    )
-    if not thread:
-        thread = MessageThread.objects.create()
-        thread.participants.add(request.user, other)
+    thread, _ = chat.get_or_create_direct_thread(request.user, other)
     return redirect(f"{reverse('messages')}?t={thread.id}")
 
 
 @login_required
 def notifications_view(request):
-    raw = request.user.notifications.order_by('-created_at')[:50]
-    # Attach actor (if present) via a reliable relation if Notification has actor FK;
-    # otherwise attempt to resolve from text prefix, safely.
-    notifs = []
-    for n in raw:
-        actor = None
-        try:
-            # Try resolving an actor via notification text prefix (safe, non-db call)
-            candidate = (n.text or '').split()[0]
-            actor = User.objects.filter(username=candidate).first()
-        except Exception:
-            actor = None
-        if actor:
-            Profile.objects.get_or_create(user=actor)
-        # `post` may not exist in this schema; include None for template safety
-        post_obj = getattr(n, 'post', None) if hasattr(n, 'post') else None
-        notifs.append({'notif': n, 'actor': actor, 'post': post_obj})
+    # Actor (with avatar) and post preview come from the same query
+    notifs = (
+        request.user.notifications
+        .select_related('actor__profile', 'post')
+        .order_by('-updated_at')[:50]
+    )
     return render(request, 'core/notifications.html', {'notifs': notifs})
 
 
@@ -274,9 +354,18 @@ def profile_edit_view(request, username):
         dj_messages.error(request, 'Not allowed')
         return redirect('profile', username=username)
     profile, _ = Profile.objects.get_or_create(user=request.user)
+    # Validation already copies the new avatar onto the instance
+    old_avatar, old_variants = profile.avatar.name, profile.avatar_variants
     form = ProfileForm(request.POST or None, request.FILES or None, instance=profile)
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        profile = form.save(commit=False)
+        avatar_changed = 'avatar' in form.changed_data
+        if avatar_changed:
+            profile.avatar_variants = {}
+        profile.save()
+        if avatar_changed:
+            images.discard_avatar(old_avatar, old_variants)
+            images.schedule(profile)
         dj_messages.success(request, 'Profile updated.')
         return redirect('profile', username=request.user.username)
     return render(request, 'core/profile_edit.html', {'form': form})
@@ -289,23 +378,41 @@ def post_delete_view(request, post_id):
         dj_messages.error(request, 'Not allowed')
         return redirect('profile', username=request.user.username)
     if request.method == 'POST':
-        post.delete()
+        with transaction.atomic():
+            post.delete()
+            adjust(Profile.objects.filter(user=request.user), post_count=-1)
         dj_messages.success(request, 'Post deleted.')
         return redirect('profile', username=request.user.username)
     return redirect('profile', username=request.user.username)
 
 
+def _publish_post(post):
+    """Save a new `post` (author set) and run everything a new post triggers."""
+    author = post.author
+    with transaction.atomic():
+        post.save()
+        adjust(Profile.objects.filter(user=author), post_count=1)
+        mentioned = tags.index_post(post)
+        images.schedule(post)
+        videos.schedule(post)
+    feed.fan_out_post(post)
+    push_notification(author, 'You posted new content.', title='Post uploaded',
+                      verb=Notification.POST, post=post)
+    for user in mentioned:
+        push_notification(user, f'{author.username} mentioned you in a post.', title='New mention',
+                          actor=author, verb=Notification.MENTION, post=post)
+
+
 @login_required
 def create_post_view(request):
     form = PostForm(request.POST or None, request.FILES or None)
     if request.method == 'POST' and form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
-        push_notification(request.user, 'You posted new content.', title='Post uploaded')
+        _publish_post(post)
         dj_messages.success(request, 'Post created.')
         return redirect('home')
-    return render(request, 'core/create_post.html', {'form': form})
+    return render(request, 'core/create_post.html', {'form': form, 'chunk_size': uploads.chunk_size()})
 
 
 @login_required
@@ -313,12 +420,12 @@ def profile_view(request, username):
     user = get_object_or_404(User, username=username)
     profile, _ = Profile.objects.get_or_create(user=user)
     posts = user.posts.order_by('-created_at')
-    photos = [p for p in posts if not p.is_video]
-    videos = [p for p in posts if p.is_video]
+    photos = posts.filter(media_type=Post.IMAGE)
+    videos = posts.filter(media_type=Post.VIDEO)
     stats = {
-        'posts': posts.count(),
-        'followers': Follow.objects.filter(following=user).count(),
-        'following': Follow.objects.filter(follower=user).count(),
+        'posts': profile.post_count,
+        'followers': profile.follower_count,
+        'following': profile.following_count,
     }
     is_following = None if request.user == user else Follow.objects.filter(follower=request.user, following=user).exists()
     return render(request, 'core/profile.html', {
@@ -332,31 +439,137 @@ def profile_view(request, username):
     })
 
 
+def _publish_story(story):
+    story.save()
+    images.schedule(story)
+    videos.schedule(story)
+    stories.invalidate_all_trays()
+
+
 @login_required
 def add_story_view(request):
     form = StoryForm(request.POST or None, request.FILES or None)
     if request.method == 'POST' and form.is_valid():
         story = form.save(commit=False)
         story.user = request.user
-        story.save()
+        _publish_story(story)
         dj_messages.success(request, 'Story added!')
         return redirect('home')
-    return render(request, 'core/add_story.html', {'form': form})
+    return render(request, 'core/add_story.html', {'form': form, 'chunk_size': uploads.chunk_size()})
+
+
+# Chunked uploads: start, then POST raw chunks at the current offset
+# (GET returns it after a dropped connection), then complete.
+def _upload_state(session):
+    return {
+        'upload_id': str(session.id),
+        'offset': session.received,
+        'size': session.size,
+        'chunk_size': uploads.chunk_size(),
+    }
+
+
+@login_required
+def upload_start_view(request):
+    """Open an upload session: `kind`, `filename`, `size`, optional `sha256` (and `thread_id` for messages)."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        size = int(request.POST.get('size', ''))
+        thread_id = int(request.POST['thread_id']) if request.POST.get('thread_id') else None
+    except ValueError:
+        return JsonResponse({'error': 'invalid size or thread'}, status=400)
+    try:
+        session = uploads.start(
+            request.user, request.POST.get('kind', ''), request.POST.get('filename', ''),
+            size, request.POST.get('sha256', ''), thread_id,
+        )
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    return JsonResponse(_upload_state(session), status=201)
+
+
+@login_required
+def upload_chunk_view(request, upload_id):
+    """GET: upload state. POST: raw chunk body written at the `Upload-Offset` header."""
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse(_upload_state(session))
+    if request.method != 'POST':
+        return JsonResponse({'error': 'GET or POST required'}, status=405)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return JsonResponse({'error': 'missing Upload-Offset header'}, status=400)
+    try:
+        # Streams the body; never touches request.body
+        uploads.append(session, offset, request, request.headers.get('Upload-Chunk-Sha256', ''))
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc), **_upload_state(session)}, status=exc.status)
+    return JsonResponse(_upload_state(session))
+
+
+@login_required
+def upload_complete_view(request, upload_id):
+    """Verify a fully sent upload and create its Post (`caption`), Story or Message (`text`)."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    if session.kind == UploadSession.MESSAGE and not chat.is_participant(session.thread_id, request.user.id):
+        return HttpResponseForbidden('Not allowed')
+    # Claimed before publishing, so a double submit cannot create two of them
+    if not uploads.claim(session):
+        session.refresh_from_db(fields=['result'])
+        if session.result:
+            return JsonResponse(session.result)
+        return JsonResponse({'error': 'upload is already being completed'}, status=409)
+    try:
+        with uploads.finish(session) as file:
+            if session.kind == UploadSession.POST:
+                post = Post(author=request.user, caption=request.POST.get('caption', ''), media=file)
+                _publish_post(post)
+                dj_messages.success(request, 'Post created.')
+                result = {'post_id': post.id, 'redirect': reverse('home')}
+            elif session.kind == UploadSession.STORY:
+                story = Story(user=request.user, media=file)
+                _publish_story(story)
+                dj_messages.success(request, 'Story added!')
+                result = {'story_id': story.id, 'redirect': reverse('home')}
+            else:
+                result = _publish_message(request.user, session.thread_id, request.POST.get('text', '').strip(), file)
+    except uploads.UploadError as exc:
+        uploads.release(session)
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    except Exception:
+        uploads.release(session)
+        raise
+    uploads.complete(session, result)
+    return JsonResponse(result, status=201)
 
 
 # AJAX endpoints
 @login_required
 def like_toggle_view(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    like, created = Like.objects.get_or_create(post=post, user=request.user)
-    if not created:
-        like.delete()
-        liked = False
-    else:
-        liked = True
-        if request.user != post.author:
-            push_notification(post.author, f'{request.user.username} liked your post.', title='New like')
-    return JsonResponse({'liked': liked, 'count': post.likes.count()})
+    with transaction.atomic():
+        _, created = Like.objects.get_or_create(post=post, user=request.user)
+        if created:
+            delta = 1
+        else:
+            # A racing toggle may have removed the row already; count only what this one deletes
+            deleted, _ = Like.objects.filter(post=post, user=request.user).delete()
+            delta = -deleted
+        if delta:
+            adjust(Post.objects.filter(pk=post.pk), like_count=delta)
+    post.refresh_from_db(fields=['like_count'])
+    liked = created
+    if request.user != post.author:
+        if liked:
+            push_notification(post.author, f'{request.user.username} liked your post.', title='New like',
+                              actor=request.user, verb=Notification.LIKE, post=post)
+        elif delta:
+            retract(post.author, request.user, Notification.LIKE, post)
+    return JsonResponse({'liked': liked, 'count': post.like_count})
 
 
 @login_required
@@ -365,15 +578,19 @@ def comment_create_view(request, post_id):
     text = request.POST.get('text', '').strip()
     if not text:
         return JsonResponse({'error': 'Empty comment'}, status=400)
-    c = Comment.objects.create(post=post, author=request.user, text=text)
+    with transaction.atomic():
+        c = Comment.objects.create(post=post, author=request.user, text=text)
+        adjust(Post.objects.filter(pk=post.pk), comment_count=1)
+    post.refresh_from_db(fields=['comment_count'])
     if request.user != post.author:
-        push_notification(post.author, f'{request.user.username} commented: "{text}"', title='New comment')
+        push_notification(post.author, f'{request.user.username} commented: "{text}"', title='New comment',
+                          actor=request.user, verb=Notification.COMMENT, post=post)
     return JsonResponse({
         'id': c.id,
-        'author': c.author.username,
+        'author': request.user.username,
         'text': c.text,
         'created_at': c.created_at.isoformat(),
-        'count': post.comments.count(),
+        'count': post.comment_count,
     })
 
 
@@ -382,12 +599,24 @@ def follow_toggle_view(request, username):
     target = get_object_or_404(User, username=username)
     if target == request.user:
         return JsonResponse({'error': "Can't follow yourself"}, status=400)
-    rel, created = Follow.objects.get_or_create(follower=request.user, following=target)
-    if not created:
-        rel.delete()
-        following = False
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(follower=request.user, following=target)
+        if created:
+            delta = 1
+        else:
+            deleted, _ = Follow.objects.filter(follower=request.user, following=target).delete()
+            delta = -deleted
+        if delta:
+            adjust(Profile.objects.filter(user=target), follower_count=delta)
+            adjust(Profile.objects.filter(user=request.user), following_count=delta)
+    following = created
+    if following:
+        feed.backfill_follow(request.user, target)
+        push_notification(target, f'{request.user.username} started following you.', title='New follower',
+                          actor=request.user, verb=Notification.FOLLOW)
     else:
-        following = True
-        push_notification(target, f'{request.user.username} started following you.', title='New follower')
-    followers_count = Follow.objects.filter(following=target).count()
+        feed.drop_follow(request.user, target)
+        if delta:
+            retract(target, request.user, Notification.FOLLOW)
+    followers_count = Profile.objects.filter(user=target).values_list('follower_count', flat=True).first() or 0
     return JsonResponse({'following': following, 'followers': followers_count})
\ No newline at end of file
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.querylog.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,10 +58,56 @@ TEMPLATES = [{
 WSGI_APPLICATION = 'insta.wsgi.application'
 ASGI_APPLICATION = 'insta.asgi.application'
 
-DATABASES = {'default': {
-    'ENGINE': 'django.db.backends.sqlite3',
-    'NAME': BASE_DIR / 'db.sqlite3'
-}}
+# Database: SQLite by default; set DB_ENGINE=postgresql (plus DB_NAME,
+# DB_USER, DB_PASSWORD, DB_HOST, DB_PORT) for PostgreSQL.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME', 'insta'),
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', ''),
+        'PORT': os.getenv('DB_PORT', ''),
+        'OPTIONS': {},
+    }}
+    if os.getenv('DB_POOL_MAX_SIZE'):
+        # psycopg 3 connection pool (needs psycopg[pool]); replaces persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # Seconds a connection waits on a locked database before failing
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+            # Take the write lock at BEGIN, so writers queue on the busy
+            # timeout instead of failing to upgrade a read lock mid-transaction
+            'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+    }}
+# Keep connections open between requests (checked before reuse) instead of
+# reconnecting -- and, for SQLite, re-running the pragmas -- every time.
+# Under ASGI with PostgreSQL, prefer the pool (DB_POOL_MAX_SIZE).
+DATABASES['default'].setdefault('CONN_MAX_AGE', int(os.getenv('DB_CONN_MAX_AGE', '60')))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Applied to every new SQLite connection (core.signals). WAL lets readers
+# run alongside the single writer; synchronous=NORMAL is durable in WAL
+# mode except for the last commits on power loss.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '20')) * 1000,
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', '20000')),
+    'temp_store': 'MEMORY',
+}
 
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'Asia/Kolkata'
@@ -71,9 +118,80 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'core' / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Media is served by core.serving. Set MEDIA_SENDFILE to 'x-accel-redirect'
+# (nginx: an `internal` location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT)
+# or 'x-sendfile' to let the fronting server send the bytes.
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Cache lifetime for media that is not content-addressed (avatars, old uploads).
+MEDIA_MAX_AGE = int(os.getenv('MEDIA_MAX_AGE', '86400'))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Home feed: posts from authors with more followers than this are not fanned
+# out into every follower's timeline on write; they are merged in on read.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', '5000'))
+
+# Per-viewer home story tray cache lifetime (uses the default cache backend).
+STORY_TRAY_CACHE_SECONDS = int(os.getenv('STORY_TRAY_CACHE_SECONDS', '60'))
+
+# Likes/follows on the same target within this many seconds are coalesced
+# into one notification; pushes for a coalesced row are throttled.
+NOTIFICATION_AGGREGATE_WINDOW = int(os.getenv('NOTIFICATION_AGGREGATE_WINDOW', '3600'))
+NOTIFICATION_PUSH_DEBOUNCE = int(os.getenv('NOTIFICATION_PUSH_DEBOUNCE', '10'))
+# 'queued' writes notifications to an outbox drained by a background thread;
+# 'inline' stores and pushes them inside the request.
+NOTIFICATION_DELIVERY = os.getenv('NOTIFICATION_DELIVERY', 'queued')
+NOTIFICATION_OUTBOX_POLL_SECONDS = int(os.getenv('NOTIFICATION_OUTBOX_POLL_SECONDS', '5'))
+
+# Chat sockets buffer messages per room for up to this long (or this many
+# messages) and save/broadcast them together.
+CHAT_BATCH_MAX_LATENCY_MS = int(os.getenv('CHAT_BATCH_MAX_LATENCY_MS', '5'))
+CHAT_BATCH_SIZE = int(os.getenv('CHAT_BATCH_SIZE', '50'))
+
+# Uploaded images get downscaled WebP variants from a pool of this many
+# worker processes ('pool'); 'inline' renders them in the request.
+IMAGE_PROCESSING = os.getenv('IMAGE_PROCESSING', 'pool')
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+# Video posters/previews are cut by ffmpeg (FFMPEG_BINARY, else found on
+# PATH; skipped when absent) on a background thread pool.
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY')
+VIDEO_PROCESSING = os.getenv('VIDEO_PROCESSING', 'background')
+VIDEO_WORKERS = int(os.getenv('VIDEO_WORKERS', '2'))
+
+# Chunked uploads (api/uploads/): largest accepted file, largest chunk per
+# request, and where partial files live (defaults to the system temp dir).
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(200 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+UPLOAD_TEMP_DIR = os.getenv('UPLOAD_TEMP_DIR')
+
+# Unreferenced media blobs stored again within this many seconds are left
+# for `manage.py gc_media` instead of being deleted straight away.
+MEDIA_GC_GRACE_SECONDS = int(os.getenv('MEDIA_GC_GRACE_SECONDS', '60'))
+
+# Expired stories are moved to the archive ('archive') or dropped ('delete')
+# in batches, by a background thread every STORY_EXPIRY_INTERVAL_SECONDS
+# (0 disables it; run `manage.py expire_stories` from cron instead).
+STORY_EXPIRY_MODE = os.getenv('STORY_EXPIRY_MODE', 'archive')
+STORY_EXPIRY_BATCH_SIZE = int(os.getenv('STORY_EXPIRY_BATCH_SIZE', '500'))
+STORY_EXPIRY_INTERVAL_SECONDS = int(os.getenv('STORY_EXPIRY_INTERVAL_SECONDS', '300'))
+
+# Story views are buffered in memory and bulk-written every
+# STORY_VIEW_FLUSH_SECONDS, or once STORY_VIEW_BUFFER_SIZE are waiting;
+# 'inline' writes them inside the request.
+STORY_VIEW_RECORDING = os.getenv('STORY_VIEW_RECORDING', 'buffered')
+STORY_VIEW_FLUSH_SECONDS = float(os.getenv('STORY_VIEW_FLUSH_SECONDS', '2'))
+STORY_VIEW_BUFFER_SIZE = int(os.getenv('STORY_VIEW_BUFFER_SIZE', '500'))
+
+# Requests running more than QUERY_BUDGET queries (per URL name overrides in
+# QUERY_BUDGETS), or one statement QUERY_REPEAT_THRESHOLD+ times, are logged
+# by core.querylog. QUERY_SERVER_TIMING adds a Server-Timing header.
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '30'))
+QUERY_BUDGETS = {}
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '5'))
+QUERY_SERVER_TIMING = os.getenv('QUERY_SERVER_TIMING', str(DEBUG)) == 'True'
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'